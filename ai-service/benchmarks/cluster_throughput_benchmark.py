@@ -0,0 +1,129 @@
+"""Throughput of the cluster launcher versus worker count.
+
+Starts an in-process fake backend, then for each worker count launches
+`src/cluster.py` with the stub LLM backend, warms the user cache, and drives
+POST /process at a fixed concurrency. Reports requests/second and latency.
+
+Usage: python benchmarks/cluster_throughput_benchmark.py [--workers 1,2,4] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+fake_backend = FastAPI()
+
+@fake_backend.post("/auth/login", status_code=200)
+async def login():
+    return {"token": "bench-token", "user": {"id": "bench-user", "email": "bench@example.com", "name": "Bench", "role": "PARENT"}}
+
+@fake_backend.get("/children")
+async def children():
+    return [
+        {"id": "c1", "name": "Emma", "date_of_birth": "2025-01-01T00:00:00Z"},
+        {"id": "c2", "name": "Liam", "date_of_birth": "2025-01-01T00:00:00Z"},
+    ]
+
+@fake_backend.post("/feeding", status_code=201)
+async def create_feeding():
+    return {"id": "f1"}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_backend(port: int) -> None:
+    server = uvicorn.Server(uvicorn.Config(fake_backend, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+async def wait_healthy(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("cluster did not become healthy")
+
+async def drive(url: str, workers: int, total: int, concurrency: int):
+    # Authenticate over fresh connections so every worker caches the user
+    async with httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        for _ in range(workers * 8):
+            await client.post(f"{url}/authenticate", params={"email": "bench@example.com", "password": "x"})
+
+    latencies = []
+    not_found = 0
+    remaining = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal not_found
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.post(f"{url}/process", json={"message": "Emma had 90ml bottle", "user_id": "bench-user"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if "user_not_found" in response.text:
+                not_found += 1
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency), timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return total / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95)], not_found
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    backend_port = free_port()
+    start_fake_backend(backend_port)
+
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'not found':>11}")
+    for workers in [int(n) for n in args.workers.split(",")]:
+        port = free_port()
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "PORT": str(port),
+                "CLUSTER_WORKERS": str(workers),
+                "BACKEND_API_URL": f"http://127.0.0.1:{backend_port}",
+                "LLM_BACKEND": "stub",
+                "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+                "WHATSAPP_OUTBOX_PATH": os.path.join(tmp, "outbox.db"),
+                "CACHE_BUS_URL": f"unix://{tmp}/bus",
+                "LOG_LEVEL": "WARNING",
+            }
+            proc = subprocess.Popen([sys.executable, "cluster.py"], cwd=SRC_DIR, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f"http://127.0.0.1:{port}"
+                await wait_healthy(url)
+                rps, p50, p95, not_found = await drive(url, workers, args.requests, args.concurrency)
+                print(f"{workers:>8}{rps:>10.1f}{p50:>10.1f}{p95:>10.1f}{not_found:>11}")
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+if __name__ == "__main__":
+    asyncio.run(main())
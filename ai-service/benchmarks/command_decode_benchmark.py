@@ -0,0 +1,97 @@
+"""Decode cost of LLM replies: legacy per-stage parsing vs the command decoder.
+
+legacy:  json.loads, then Model(**data); on a JSON error, a greedy
+         r"\\{.*\\}" DOTALL search and a second json.loads (what the _parse_*
+         methods did)
+decoder: command_decoder.decode_command, which validates the raw string
+         against the discriminated union in one pass and only falls back to
+         the bounded recovery scanner for wrapped JSON
+
+The corpus is a set of recorded extraction replies, including fenced and
+chatty ones. Replies neither approach can decode are counted, not timed.
+
+Usage: python benchmarks/command_decode_benchmark.py [--rounds 2000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models import FeedingCommand, SleepCommand, DiaperCommand, HealthCommand, QueryCommand
+from command_decoder import decode_command, CommandDecodeError
+
+# (expected model, recorded reply)
+CORPUS = [
+    (FeedingCommand, '{"action": "create_feeding_log", "child_name": "Emma", "amount": 120, "type": "FORMULA", "time": null, "notes": null}'),
+    (FeedingCommand, '{"action": "create_feeding_log", "child_name": "Liam", "amount": 90, "type": "BOTTLE", "time": "2025-12-22T09:30:00", "notes": "burped well"}'),
+    (FeedingCommand, '{\n  "action": "create_feeding_log",\n  "child_name": "Emma",\n  "amount": null,\n  "type": "BREAST",\n  "time": null,\n  "notes": "left side 15 min"\n}'),
+    (FeedingCommand, '```json\n{"action": "create_feeding_log", "child_name": "Liam", "amount": 60, "type": "BOTTLE", "time": null, "notes": null}\n```'),
+    (FeedingCommand, 'Here is the extracted information:\n{"action": "create_feeding_log", "child_name": "Emma", "amount": 110, "type": "BOTTLE", "time": null, "notes": "EBM + 30ml top up"}'),
+    (SleepCommand, '{"action": "start_sleep", "child_name": "Liam", "start_time": null, "end_time": null, "type": "NAP", "quality": null, "notes": null}'),
+    (SleepCommand, '{"action": "end_sleep", "child_name": "Emma", "start_time": null, "end_time": null, "type": "NIGHT", "quality": "RESTLESS", "notes": "woke twice"}'),
+    (SleepCommand, '{"action": "create_sleep_log", "child_name": "Emma", "start_time": "2025-12-22T13:00:00", "end_time": "2025-12-22T15:00:00", "type": "NAP", "quality": "DEEP", "notes": null}'),
+    (DiaperCommand, '{"action": "create_diaper_log", "child_name": "Emma", "type": "WET", "consistency": null, "time": null, "notes": null}'),
+    (DiaperCommand, '{"action": "create_diaper_log", "child_name": "Liam", "type": "MIXED", "consistency": "WATERY", "time": null, "notes": "rash starting {check}"}'),
+    (DiaperCommand, '```\n{"action": "create_diaper_log", "child_name": "Liam", "type": "DIRTY", "consistency": "NORMAL", "time": null, "notes": null}\n```\nLet me know if you need anything else.'),
+    (HealthCommand, '{"action": "create_health_log", "child_name": "Emma", "type": "TEMPERATURE", "value": "37.8", "unit": "C", "time": null, "notes": null}'),
+    (HealthCommand, '{"action": "create_health_log", "child_name": "Liam", "type": "MEDICINE", "value": "2.5", "unit": "ml", "time": null, "notes": "paracetamol"}'),
+    (QueryCommand, '{"action": "query", "query_type": "last_feeding", "child_name": "Emma", "details": {}}'),
+    (QueryCommand, '{"action": "query", "query_type": "feeding_trend", "child_name": null, "details": {"window": "this_week"}}'),
+    (QueryCommand, 'Sure! {"action": "query", "query_type": "summary", "child_name": null, "details": {}} Hope that helps.'),
+]
+
+def legacy_decode(model, raw: str):
+    try:
+        data = json.loads(raw)
+        return model(**data)
+    except json.JSONDecodeError as e:
+        json_match = re.search(r'\{.*\}', raw, re.DOTALL)
+        if json_match:
+            data = json.loads(json_match.group())
+            return model(**data)
+        raise e
+
+def new_decode(model, raw: str):
+    return decode_command(raw, model)
+
+def run(decode, rounds: int):
+    failures = sum(1 for model, raw in CORPUS if not _ok(decode, model, raw))
+    usable = [(model, raw) for model, raw in CORPUS if _ok(decode, model, raw)]
+    clean = [(m, r) for m, r in usable if r.lstrip().startswith("{") and r.rstrip().endswith("}")]
+    wrapped = [(m, r) for m, r in usable if (m, r) not in clean]
+
+    def time_set(items):
+        if not items:
+            return 0.0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for model, raw in items:
+                decode(model, raw)
+        return (time.perf_counter() - start) / (rounds * len(items)) * 1e6
+
+    return time_set(usable), time_set(clean), time_set(wrapped), failures
+
+def _ok(decode, model, raw) -> bool:
+    try:
+        decode(model, raw)
+        return True
+    except (ValueError, TypeError, CommandDecodeError):
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{len(CORPUS)} recorded replies, {args.rounds} rounds")
+    print(f"{'':<10}{'all us/op':>12}{'clean us/op':>14}{'wrapped us/op':>16}{'undecodable':>14}")
+    for name, decode in (("legacy", legacy_decode), ("decoder", new_decode)):
+        overall, clean, wrapped, failures = run(decode, args.rounds)
+        print(f"{name:<10}{overall:>12.2f}{clean:>14.2f}{wrapped:>16.2f}{failures:>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Bytes per cached user context: nested dicts vs compact records.
+
+legacy:  what _cache_user_context/StorageService used to keep, i.e.
+         {"context:<id>": {"context_data": {"user": {...}, "children": [{...}]},
+         "timestamp": datetime}} plus a datetime in last_activity
+compact: StorageService.contexts, slotted ContextRecord/ChildRecord with
+         interned roles, genders, timezones and child names, and epoch-second
+         integers for dates, plus an int in last_activity
+
+Each user has two children and is built from its own parsed JSON payload, so
+repeated strings start out as distinct objects, as they do when they come
+from backend responses. Sizes are a deep sys.getsizeof walk of everything
+the cache holds, counting shared objects once (tracemalloc's own overhead
+does not fit 1M users in memory).
+
+Usage: python benchmarks/context_memory_benchmark.py [--users 10000,100000,1000000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models import User, Child
+from storage_service import StorageService, ContextRecord
+
+TIMEZONES = ["Asia/Dubai", "Europe/London", "America/New_York", "Asia/Beirut", None]
+NAMES = ["Emma", "Liam", "Olivia", "Noah", "Ava", "Elijah", "Sophia", "Lucas", "Mia", "Layla"]
+
+def payload(n: int) -> str:
+    token = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + f"{n:024x}" * 4 + ".s1gnatureS1gnatureS1gnatureS1gnatureS1gna"
+    return json.dumps({
+        "id": f"{n:08x}-5c1e-4b7a-9f3d-2a6e8c0b1d4f",
+        "email": f"parent{n}@example.com",
+        "name": f"Parent {n}",
+        "role": "PARENT",
+        "auth_token": token,
+        "timezone": TIMEZONES[n % len(TIMEZONES)],
+        "children": [
+            {"id": f"{n:08x}-0000-4000-8000-00000000000{i}", "name": NAMES[(n + i) % len(NAMES)],
+             "date_of_birth": f"2025-0{1 + (n + i) % 9}-1{i}T00:00:00.000Z", "gender": ("FEMALE", "MALE")[i]}
+            for i in range(2)
+        ],
+    })
+
+def users(count: int):
+    for n in range(count):
+        data = json.loads(payload(n))
+        children = [Child(**child) for child in data.pop("children")]
+        yield User(**data, children=children)
+
+def legacy_cache(count: int):
+    cache, last_activity = {}, {}
+    for user in users(count):
+        context_data = {
+            "user": {
+                "id": user.id,
+                "email": user.email,
+                "name": user.name,
+                "role": user.role,
+                "auth_token": user.auth_token,
+                "timezone": user.timezone
+            },
+            "children": [
+                {
+                    "id": child.id,
+                    "name": child.name,
+                    "date_of_birth": child.date_of_birth.isoformat(),
+                    "gender": child.gender
+                }
+                for child in user.children
+            ]
+        }
+        cache[f"context:{user.id}"] = {"context_data": context_data, "timestamp": datetime.now()}
+        last_activity[user.id] = datetime.now()
+    return cache, last_activity
+
+def compact_cache(count: int):
+    storage = StorageService()
+    for user in users(count):
+        storage.cache_user_context(user.id, ContextRecord.from_user(user))
+        storage.touch_user(user.id)
+    return storage.contexts, storage.last_activity
+
+def deep_size(*roots) -> int:
+    seen, stack, total = set(), list(roots), 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif hasattr(type(obj), "__slots__"):
+            stack.extend(getattr(obj, slot) for slot in type(obj).__slots__ if hasattr(obj, slot))
+    return total
+
+def measure(build, count: int):
+    started = time.perf_counter()
+    structures = build(count)
+    built = time.perf_counter() - started
+    size = deep_size(*structures)
+    del structures
+    gc.collect()
+    return size / count, built
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="10000,100000,1000000")
+    args = parser.parse_args()
+
+    print(f"{'users':>10}{'legacy B/user':>16}{'compact B/user':>17}{'saved':>8}{'legacy MB':>12}{'compact MB':>13}")
+    for count in (int(n) for n in args.users.split(",")):
+        legacy, _ = measure(legacy_cache, count)
+        compact, _ = measure(compact_cache, count)
+        print(f"{count:>10}{legacy:>16.0f}{compact:>17.0f}{1 - compact / legacy:>8.0%}"
+              f"{legacy * count / 2**20:>12.1f}{compact * count / 2**20:>13.1f}")
+
+if __name__ == "__main__":
+    main()
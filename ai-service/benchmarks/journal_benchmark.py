@@ -0,0 +1,85 @@
+"""Measure what the inbound journal adds to each message.
+
+Each simulated message is appended to the journal, "processed" (no work) and
+marked done, the same two journal round trips the webhook makes. Two loads:
+- paced: messages arrive at --rate per second (our peak), reporting the
+  latency the journal adds per message
+- burst: --concurrency messages in flight at once, reporting throughput
+Both run with group commit and with one commit per operation (max batch 1)
+for comparison.
+
+Usage: python benchmarks/journal_benchmark.py [--rate 50] [--seconds 5] [--concurrency 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inbound_journal import InboundJournal
+
+async def one_message(journal: InboundJournal, n: int, latencies: list) -> None:
+    started = time.perf_counter()
+    entry = await journal.append(f"wamid.bench.{n}", "15550000000", "Bench", "Emma had 90ml of formula")
+    appended = time.perf_counter()
+    await journal.mark_done(entry)
+    latencies.append(((appended - started) * 1000, (time.perf_counter() - started) * 1000))
+
+async def paced(journal: InboundJournal, rate: float, seconds: float) -> list:
+    latencies, tasks = [], []
+    interval = 1 / rate
+    start = time.perf_counter()
+    for n in range(int(rate * seconds)):
+        delay = start + n * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one_message(journal, n, latencies)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+async def burst(journal: InboundJournal, concurrency: int, total: int) -> float:
+    latencies = []
+    start = time.perf_counter()
+    for offset in range(0, total, concurrency):
+        await asyncio.gather(*(one_message(journal, 10_000_000 + offset + n, latencies)
+                               for n in range(min(concurrency, total - offset))))
+    return total / (time.perf_counter() - start)
+
+def pct(values: list, q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+async def run(label: str, max_batch: int, args) -> None:
+    directory = tempfile.mkdtemp(prefix="journal-bench-")
+    journal = InboundJournal()
+    journal.path = os.path.join(directory, "inbound.db")
+    journal.max_batch = max_batch
+    await journal.start()
+    try:
+        latencies = await paced(journal, args.rate, args.seconds)
+        throughput = await burst(journal, args.concurrency, args.concurrency * 10)
+    finally:
+        await journal.stop()
+
+    appends = [a for a, _ in latencies]
+    totals = [t for _, t in latencies]
+    print(f"{label:<22} append p50 {pct(appends, 50):6.2f}ms  p95 {pct(appends, 95):6.2f}ms  "
+          f"append+done p95 {pct(totals, 95):6.2f}ms  burst {throughput:8.0f} msg/s")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50.0, help="paced arrival rate (messages/second)")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"paced at {args.rate:.0f} msg/s for {args.seconds:.0f}s; burst of {args.concurrency} concurrent "
+          f"(synchronous={os.getenv('JOURNAL_SYNCHRONOUS', 'FULL')})")
+    await run("group commit", 256, args)
+    await run("commit per operation", 1, args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
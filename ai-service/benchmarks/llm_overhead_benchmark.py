@@ -0,0 +1,77 @@
+"""Compare per-call client overhead of the LLM backends.
+
+The provider is replaced by an in-process OpenAI-compatible responder with a
+fixed simulated latency, so the numbers isolate what each adapter adds on
+top of the model call (prompt/message building, callbacks, serialisation).
+
+Usage: python benchmarks/llm_overhead_benchmark.py [--calls 200] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import httpx
+
+from llm_client import OpenAIChatClient, LangChainClient, StubLLMClient
+
+SYSTEM = """Extract feeding information from the message and return ONLY valid JSON.
+        Child names available: Emma, Liam
+        Return a JSON object with these exact fields: action, child_name, amount, type, time, notes"""
+USER = "Emma had 120ml of formula"
+COMPLETION = '{"action": "create_feeding_log", "child_name": "Emma", "amount": 120, "type": "FORMULA"}'
+
+def fake_provider(latency_ms: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency_ms / 1000)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": COMPLETION}}],
+            "usage": {"prompt_tokens": 60, "completion_tokens": 25, "total_tokens": 85},
+        })
+    return httpx.MockTransport(handler)
+
+def build_langchain(transport: httpx.MockTransport) -> LangChainClient:
+    import openai
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI(temperature=0, model="gpt-4", openai_api_key="sk-benchmark")
+    llm.async_client = openai.AsyncOpenAI(
+        api_key="sk-benchmark", http_client=httpx.AsyncClient(transport=transport)
+    ).chat.completions
+    return LangChainClient(llm)
+
+async def measure(client, calls: int):
+    await client.complete(SYSTEM, USER, stage="bench")  # warm connection pools and imports
+    results = [await client.complete(SYSTEM, USER, stage="bench") for _ in range(calls)]
+    await client.aclose()
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    backends = {
+        "stub": lambda: StubLLMClient(latency_ms=args.latency_ms),
+        "openai": lambda: OpenAIChatClient(transport=fake_provider(args.latency_ms)),
+        "langchain": lambda: build_langchain(fake_provider(args.latency_ms)),
+    }
+
+    print(f"{'backend':<12}{'total p50':>12}{'model p50':>12}{'overhead p50':>14}{'overhead p95':>14}  (ms)")
+    for name, factory in backends.items():
+        results = await measure(factory(), args.calls)
+        overhead = sorted(r.overhead_ms for r in results)
+        print(f"{name:<12}"
+              f"{statistics.median(r.total_ms for r in results):>12.3f}"
+              f"{statistics.median(r.model_ms for r in results):>12.3f}"
+              f"{statistics.median(overhead):>14.3f}"
+              f"{overhead[int(len(overhead) * 0.95)]:>14.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,181 @@
+"""Token cost per message of the prompt changes.
+
+Compares, per stage and per message (classification + one extraction):
+- legacy: the original indented f-string prompts with a full ISO timestamp
+- whitespace: legacy prompts after whitespace compaction only
+- current: compact prompts with shared instructions and a minute-precision time
+
+It also shows how much of each current prompt is a static prefix that the
+provider's prompt cache can reuse across users and requests (per-user and
+per-request lines come last), against the provider's minimum cacheable
+prompt length.
+
+Counts use the local approximate counter in token_counter.py.
+
+Usage: python benchmarks/prompt_tokens_report.py [--children "Emma, Liam"]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from prompts import compact, classify_prompt, extraction_prompt, prompt_time, static_prefix
+from token_counter import count_tokens
+
+# Verbatim copies of the prompts before compaction, as the baseline
+LEGACY_PROMPTS = {
+    "classify": """You are an assistant that classifies messages about baby care.
+            The user has children named: {children_names}
+
+            Classify the message into one of these categories:
+            - feeding: anything about feeding, bottles, breast, formula, milk, eating, drinking
+            - sleep: anything about sleep, nap, wake, rest, awake, bedtime
+            - diaper: anything about diapers, poop, pee, wet, dirty, change
+            - health: temperature, medicine, symptoms, weight, height, fever, illness
+            - query: questions asking for information (when, how much, last time, status, summary, etc.)
+            - other: anything else
+
+            Respond with only the category name.""",
+    "feeding": """Extract feeding information from the message and return ONLY valid JSON.
+        Child names available: {children_names}
+        Current time: {current_time}
+
+        Return a JSON object with these exact fields:
+        - action: must be "create_feeding_log"
+        - child_name: must be one of the available child names (exact match)
+        - amount: number (ml amount) or null
+        - type: must be "BOTTLE", "BREAST", "FORMULA", "MIXED", or "SOLID"
+        - time: ISO datetime string (use current time if not specified)
+        - notes: string or null
+
+        If the child name is unclear or not mentioned, use the first available child.
+
+        Return ONLY the JSON object, no other text.""",
+    "sleep": """Extract sleep information from the message and return ONLY valid JSON.
+        Child names available: {children_names}
+        Current time: {current_time}
+
+        Determine the action:
+        - "start_sleep" if child is going to sleep now
+        - "end_sleep" if child just woke up
+        - "create_sleep_log" if reporting a past sleep
+
+        Return a JSON object with these fields:
+        - action: must be "start_sleep", "end_sleep", or "create_sleep_log"
+        - child_name: must be one of the available child names (exact match)
+        - start_time: ISO datetime or null
+        - end_time: ISO datetime or null
+        - type: must be "NAP" or "NIGHT"
+        - quality: "DEEP", "RESTLESS", "INTERRUPTED", or null
+        - notes: string or null
+
+        If the child name is unclear, use the first available child.
+
+        Return ONLY the JSON object, no other text.""",
+    "diaper": """Extract diaper information from the message and return ONLY valid JSON.
+        Child names available: {children_names}
+        Current time: {current_time}
+
+        Return a JSON object with these exact fields:
+        - action: must be "create_diaper_log"
+        - child_name: must be one of the available child names (exact match)
+        - type: must be "WET", "DIRTY", or "MIXED"
+        - consistency: "NORMAL", "WATERY", "HARD", or null
+        - time: ISO datetime string (use current time if not specified)
+        - notes: string or null
+
+        If the child name is unclear, use the first available child.
+
+        Return ONLY the JSON object, no other text.""",
+    "health": """Extract health information from the message and return ONLY valid JSON.
+        Child names available: {children_names}
+        Current time: {current_time}
+
+        Return a JSON object with these exact fields:
+        - action: must be "create_health_log"
+        - child_name: must be one of the available child names (exact match)
+        - type: must be "TEMPERATURE", "MEDICINE", "WEIGHT", "HEIGHT", or "SYMPTOM"
+        - value: string value
+        - unit: string unit or null
+        - time: ISO datetime string (use current time if not specified)
+        - notes: string or null
+
+        If the child name is unclear, use the first available child.
+
+        Return ONLY the JSON object, no other text.""",
+    "query": """Extract query information from the message and return ONLY valid JSON.
+        Child names available: {children_names}
+
+        Return a JSON object with these exact fields:
+        - action: must be "query"
+        - query_type: describe the type of query (e.g., "last_feeding", "last_sleep", "last_diaper", "summary", "status")
+        - child_name: one of the available child names, or null if asking about all children
+        - details: empty object
+
+        If asking about all children or no specific child mentioned, set child_name to null.
+
+        Return ONLY the JSON object, no other text.""",
+}
+
+SAMPLE_MESSAGES = {
+    "feeding": "Emma had 120ml of formula at 3pm",
+    "sleep": "Liam just fell asleep for his nap",
+    "diaper": "Changed Emma, it was a dirty one",
+    "health": "Liam's temperature is 37.8",
+    "query": "When did Emma last eat?",
+}
+
+def legacy_prompt(stage: str, children: str) -> str:
+    return LEGACY_PROMPTS[stage].format(children_names=children, current_time=datetime.now().isoformat())
+
+def current_prompt(stage: str, children: str) -> str:
+    if stage == "classify":
+        return classify_prompt(children)
+    return extraction_prompt(stage, children, prompt_time())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--children", default="Emma, Liam")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prompt the provider caches (OpenAI: 1024)")
+    args = parser.parse_args()
+
+    variants = {
+        "legacy": legacy_prompt,
+        "whitespace": lambda stage, children: compact(legacy_prompt(stage, children)),
+        "current": current_prompt,
+    }
+
+    def tokens(variant: str, stage: str) -> int:
+        return count_tokens(variants[variant](stage, args.children))
+
+    print(f"{'stage':<10}" + "".join(f"{name:>12}" for name in variants) + f"{'saved':>10}")
+    for stage in LEGACY_PROMPTS:
+        counts = [tokens(name, stage) for name in variants]
+        print(f"{stage:<10}" + "".join(f"{count:>12}" for count in counts) + f"{counts[0] - counts[-1]:>10}")
+
+    print("\nPer message (classification + extraction + user text):")
+    print(f"{'intent':<10}" + "".join(f"{name:>12}" for name in variants) + f"{'saved':>10}{'saved %':>9}")
+    for stage, message in SAMPLE_MESSAGES.items():
+        user_tokens = 2 * count_tokens(message)
+        counts = [tokens(name, "classify") + tokens(name, stage) + user_tokens for name in variants]
+        saved = counts[0] - counts[-1]
+        print(f"{stage:<10}" + "".join(f"{count:>12}" for count in counts)
+              + f"{saved:>10}{100 * saved / counts[0]:>8.1f}%")
+
+    print("\nCacheable static prefix of the current prompts (system + user message):")
+    print(f"{'stage':<10}{'prefix':>10}{'suffix':>10}{'static %':>10}{'cacheable':>11}")
+    for stage in LEGACY_PROMPTS:
+        prompt = current_prompt(stage, args.children)
+        prefix = static_prefix(stage)
+        assert prompt.startswith(prefix)
+        prefix_tokens = count_tokens(prefix)
+        suffix_tokens = count_tokens(prompt[len(prefix):]) + count_tokens(SAMPLE_MESSAGES.get(stage, ""))
+        total = prefix_tokens + suffix_tokens
+        print(f"{stage:<10}{prefix_tokens:>10}{suffix_tokens:>10}{100 * prefix_tokens / total:>9.1f}%"
+              f"{'yes' if prefix_tokens >= args.cache_min_tokens else 'no':>11}")
+
+if __name__ == "__main__":
+    main()
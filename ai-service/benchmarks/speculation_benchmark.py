@@ -0,0 +1,93 @@
+"""Latency and wasted tokens of speculative extraction at different widths.
+
+Runs the classify-then-extract flow of MessageProcessor (without executing
+commands) over a mix of parent messages, against the stub LLM with a fixed
+simulated latency per call. Width 0 is the sequential baseline. The stub's
+keyword classifier stands in for the model's answer.
+
+Usage: python benchmarks/speculation_benchmark.py [--latency-ms 300] [--widths 0,1,2] [--rounds 20]
+       [--min-probability 0.3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["SPECULATIVE_EXTRACTION"] = "true"
+
+from llm_client import StubLLMClient
+from metrics import metrics
+from prompts import classify_prompt, extraction_prompt
+from speculation import Speculator
+
+CHILDREN = "Emma, Liam"
+MESSAGES = [
+    "Emma had 120ml of formula",
+    "Liam just fell asleep",
+    "Changed Emma, it was a dirty one",
+    "Liam's temperature is 37.8",
+    "When did Emma last eat?",
+    "Liam took 90ml bottle",
+    "Emma woke up",
+    "wet diaper for Liam",
+    "thanks!",
+    "Emma breastfed for 15 minutes",
+    "how much did Liam sleep today?",
+    "Liam is a bit fussy",
+]
+
+async def handle(llm: StubLLMClient, speculator: Speculator, message: str, user_id: str) -> None:
+    speculation = speculator.start(
+        message, user_id, lambda stage: llm.complete(extraction_prompt(stage, CHILDREN), message, stage=stage)
+    )
+    try:
+        intent = (await llm.complete(classify_prompt(CHILDREN), message, stage="classify")).content
+        speculation.classified(intent)
+        if intent != "other":
+            await speculation.take(intent, lambda: llm.complete(extraction_prompt(intent, CHILDREN), message, stage=intent))
+    finally:
+        speculation.close()
+
+async def run(width: int, min_probability: float, latency_ms: float, rounds: int) -> dict:
+    metrics.counters.clear()
+    metrics.samples.clear()
+    llm = StubLLMClient(latency_ms=latency_ms)
+    speculator = Speculator()
+    speculator.width = width
+    speculator.min_probability = min_probability
+    latencies = []
+    for round_number in range(rounds):
+        for i, message in enumerate(MESSAGES):
+            started = time.perf_counter()
+            await handle(llm, speculator, message, f"user-{(round_number + i) % 3}")
+            latencies.append((time.perf_counter() - started) * 1000)
+    await asyncio.sleep(0)
+    counters = metrics.counters
+    hits, misses = counters.get("speculation.hits", 0), counters.get("speculation.misses", 0)
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95)],
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "wasted_per_msg": counters.get("speculation.tokens_wasted", 0) / len(latencies),
+        "wasted_calls_per_msg": counters.get("speculation.wasted", 0) / len(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--widths", default="0,1,2")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--min-probability", type=float, default=0.3)
+    args = parser.parse_args()
+
+    print(f"{'width':>6}{'mean ms':>10}{'p95 ms':>10}{'hit rate':>10}{'wasted calls/msg':>18}{'wasted tok/msg':>16}")
+    for width in (int(w) for w in args.widths.split(",")):
+        r = asyncio.run(run(width, args.min_probability, args.latency_ms, args.rounds))
+        print(f"{width:>6}{r['mean_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['hit_rate']:>10.0%}"
+              f"{r['wasted_calls_per_msg']:>18.2f}{r['wasted_per_msg']:>16.1f}")
+
+if __name__ == "__main__":
+    main()
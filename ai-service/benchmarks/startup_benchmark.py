@@ -0,0 +1,73 @@
+"""Measure AI service cold-start cost.
+
+Each run starts a fresh interpreter and records:
+- import_ms: `import main`
+- startup_ms: running the FastAPI lifespan startup
+- first_health_ms: first GET /health
+- first_llm_ms: building the LLM client on first use (set LLM_BACKEND=langchain
+  to include the LangChain import)
+
+Usage: python benchmarks/startup_benchmark.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    client.get("/health")
+    t3 = time.perf_counter()
+    from llm_client import get_llm_client
+    get_llm_client()
+    t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "startup_ms": (t2 - t1) * 1000,
+    "first_health_ms": (t3 - t2) * 1000,
+    "first_llm_ms": (t4 - t3) * 1000,
+}))
+"""
+
+def run_once(env):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=SRC_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "BACKEND_API_URL": os.getenv("BACKEND_API_URL", "http://localhost:3001/api"),
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-benchmark"),
+            "WHATSAPP_OUTBOX_PATH": os.path.join(tmp, "outbox.db"),
+            # Measure the on-demand cost rather than racing the background warmup
+            "WARMUP_ON_STARTUP": "false",
+            "LOG_LEVEL": "WARNING",
+        }
+        results = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{'metric':<18}{'median':>10}{'min':>10}{'max':>10}  (ms, {args.runs} runs)")
+    for key in results[0]:
+        values = [r[key] for r in results]
+        print(f"{key:<18}{statistics.median(values):>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Cost of the /webhook front door on a realistic mix of Meta deliveries.
+
+legacy:   request.json(), log_payload, then process_webhook for every
+          delivery (status callbacks end with {"status": "no_message"})
+fastpath: the current receive_message: raw body through orjson, payload
+          classification, status callbacks recorded without the message
+          pipeline
+
+Both are driven through the ASGI app in-process ("us/req") and also as bare
+handler code on the raw body ("handler us"). Message processing itself
+(LLM, backend) is replaced by a no-op in both so only the front door is
+measured. The default mix is what a busy number sees: each reply produces
+sent, delivered and read callbacks, and some deliveries batch several
+statuses.
+
+Usage: python benchmarks/webhook_fastpath_benchmark.py [--requests 3000] [--message-share 0.2]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("LOG_LEVEL", "INFO")
+
+import httpx
+import orjson
+from fastapi import FastAPI, Request
+
+import main
+from logging_config import log_payload
+from webhook_handler import payload_kind
+
+# The benchmark's own client requests are not part of the measurement
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BUSINESS = {"display_phone_number": "15550001111", "phone_number_id": "106540352242922"}
+
+def _envelope(value: dict) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "102290129340398", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp", "metadata": BUSINESS, **value}}]}],
+    }
+
+def status_payload(n: int, states) -> bytes:
+    now = int(time.time())
+    statuses = [{
+        "id": f"wamid.HBgLMTU1NTAwMDAwMDAVAgARGBI{n:08d}{i}",
+        "status": state,
+        "timestamp": str(now),
+        "recipient_id": "15550000000",
+        "conversation": {"id": "b1f3a8e2c0d94b7e", "origin": {"type": "service"}},
+        "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"},
+    } for i, state in enumerate(states)]
+    return json.dumps(_envelope({"statuses": statuses})).encode()
+
+def message_payload(n: int) -> bytes:
+    return json.dumps(_envelope({
+        "contacts": [{"profile": {"name": "Pat"}, "wa_id": "15550000000"}],
+        "messages": [{"from": "15550000000", "id": f"wamid.in.{n}", "timestamp": str(int(time.time())),
+                      "type": "text", "text": {"body": "Emma had 120ml of formula at 3pm"}}],
+    })).encode()
+
+def corpus(count: int, message_share: float) -> list:
+    rng = random.Random(7)
+    bodies = []
+    for n in range(count):
+        if rng.random() < message_share:
+            bodies.append(message_payload(n))
+        elif rng.random() < 0.15:
+            bodies.append(status_payload(n, ["delivered", "read"]))
+        else:
+            bodies.append(status_payload(n, [rng.choice(["sent", "delivered", "read"])]))
+    return bodies
+
+legacy_app = FastAPI()
+
+@legacy_app.post("/webhook")
+async def legacy_receive(request: Request):
+    try:
+        body = await request.json()
+        log_payload(main.logger, "Received webhook:", body)
+        result = await main.whatsapp_webhook.process_webhook(body)
+        return {"status": "success", "result": result}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+async def drive(app, bodies: list) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"Content-Type": "application/json"}
+        for body in bodies[:50]:
+            await client.post("/webhook", content=body, headers=headers)
+        # Fresh message ids for the timed pass, so messages are not short-circuited as redeliveries
+        main.whatsapp_webhook.deduplicator._seen.clear()
+        started = time.perf_counter()
+        for body in bodies:
+            response = await client.post("/webhook", content=body, headers=headers)
+            assert response.json()["status"] == "success"
+        return (time.perf_counter() - started) / len(bodies) * 1e6
+
+async def legacy_handler(raw: bytes) -> None:
+    body = json.loads(raw)
+    log_payload(main.logger, "Received webhook:", body)
+    await main.whatsapp_webhook.process_webhook(body)
+
+async def fastpath_handler(raw: bytes) -> None:
+    body = orjson.loads(raw)
+    kind = payload_kind(body)
+    if kind == "statuses":
+        main.whatsapp_webhook.process_statuses(body)
+    elif kind == "messages":
+        log_payload(main.logger, "Received webhook:", body)
+        await main.whatsapp_webhook.process_webhook(body)
+
+async def time_handler(handler, bodies: list) -> float:
+    main.whatsapp_webhook.deduplicator._seen.clear()
+    started = time.perf_counter()
+    for body in bodies:
+        await handler(body)
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+async def run(args) -> None:
+    async def handled(*_):
+        return {"status": "processed"}
+
+    webhook = main.whatsapp_webhook
+    webhook._handle_message = handled
+    webhook.admission.enabled = False
+
+    bodies = corpus(args.requests, args.message_share)
+    statuses_only = [b for b in bodies if b'"statuses"' in b]
+    print(f"{len(bodies)} deliveries, {len(bodies) - len(statuses_only)} with messages, "
+          f"{sum(len(b) for b in bodies) // len(bodies)} bytes average")
+    print(f"{'':<10}{'mixed us/req':>14}{'statuses us/req':>18}{'mixed handler us':>19}{'statuses handler us':>22}")
+    for name, app, handler in (("legacy", legacy_app, legacy_handler), ("fastpath", main.app, fastpath_handler)):
+        mixed = await drive(app, bodies)
+        statuses = await drive(app, statuses_only)
+        mixed_handler = await time_handler(handler, bodies)
+        statuses_handler = await time_handler(handler, statuses_only)
+        print(f"{name:<10}{mixed:>14.1f}{statuses:>18.1f}{mixed_handler:>19.1f}{statuses_handler:>22.1f}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--message-share", type=float, default=0.2)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main_cli()
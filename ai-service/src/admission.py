@@ -0,0 +1,151 @@
+import os
+import time
+import heapq
+import logging
+from array import array
+from typing import Dict, List
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ADMITTED = "admitted"
+RATE_LIMITED = "rate_limited"
+BUDGET_EXHAUSTED = "budget_exhausted"
+
+# Cheap replies for rejected messages; no LLM involved
+REJECT_REPLIES = {
+    RATE_LIMITED: "You're sending messages faster than I can keep up with. Please wait a minute and try again.",
+    BUDGET_EXHAUSTED: "You've reached today's message limit. I'll be ready to help again tomorrow!",
+}
+
+class SenderTable:
+    """Per-sender admission state in parallel typed arrays.
+
+    Each sender costs one dict entry (int phone number -> slot) plus 16 bytes
+    of array storage, instead of a Python object per sender.
+    """
+
+    def __init__(self):
+        self.slots: Dict[int, int] = {}
+        self.tokens = array("f")     # bucket level
+        self.updated = array("I")    # last refill, seconds since `epoch`
+        self.day = array("H")        # day number the spend counter belongs to
+        self.spent = array("H")      # LLM calls charged that day
+        self.notified = array("I")   # last reject reply, seconds since `epoch`
+        self._free: List[int] = []
+        self.epoch = int(time.time())
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def slot(self, key: int, burst: float, now: int, today: int) -> int:
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            self.tokens[slot], self.updated[slot] = burst, now
+            self.day[slot], self.spent[slot], self.notified[slot] = today, 0, 0
+        else:
+            slot = len(self.tokens)
+            self.tokens.append(burst)
+            self.updated.append(now)
+            self.day.append(today)
+            self.spent.append(0)
+            self.notified.append(0)
+        self.slots[key] = slot
+        return slot
+
+    def sweep(self, rate: float, burst: float, now: int, today: int) -> int:
+        """Free slots to make room, returning how many.
+
+        Senders indistinguishable from new ones (full bucket, nothing spent
+        today) go first; if that frees less than a tenth of the table, the
+        least recently seen senders go too (losing their spend for the day).
+        """
+        idle = [key for key, slot in self.slots.items()
+                if self.tokens[slot] + (now - self.updated[slot]) * rate >= burst
+                and (self.day[slot] != today or self.spent[slot] == 0)]
+        if len(idle) < len(self.slots) // 10:
+            idle = heapq.nsmallest(len(self.slots) // 10 or 1, self.slots, key=lambda k: self.updated[self.slots[k]])
+        for key in idle:
+            self._free.append(self.slots.pop(key))
+        return len(idle)
+
+class AdmissionController:
+    """Per-sender admission before any LLM work.
+
+    A token bucket per phone number (ADMISSION_BURST messages, refilled at
+    ADMISSION_RATE_PER_MINUTE) rejects floods, and a daily budget of
+    ADMISSION_DAILY_LLM_CALLS caps what one sender can spend on the LLM.
+    Limits are per deployment, so each cluster worker enforces its share.
+    """
+
+    def __init__(self):
+        workers = int(os.getenv("CLUSTER_WORKERS", 1))
+        self.enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        self.rate = float(os.getenv("ADMISSION_RATE_PER_MINUTE", 10)) / 60 / workers
+        self.burst = max(1.0, float(os.getenv("ADMISSION_BURST", 5)) / workers)
+        self.daily_llm_calls = int(os.getenv("ADMISSION_DAILY_LLM_CALLS", 400)) // workers
+        self.llm_calls_per_message = int(os.getenv("ADMISSION_LLM_CALLS_PER_MESSAGE", 2))
+        self.max_senders = int(os.getenv("ADMISSION_MAX_SENDERS", 500000))
+        self.notice_interval = int(os.getenv("ADMISSION_NOTICE_INTERVAL", 300))
+        self.table = SenderTable()
+
+    def admit(self, phone_number: str) -> str:
+        """ADMITTED, or why the message is rejected; charges the sender when admitted"""
+        if not self.enabled:
+            return ADMITTED
+
+        table = self.table
+        now = int(time.time()) - table.epoch
+        today = (table.epoch + now) // 86400
+        if len(table) >= self.max_senders:
+            swept = table.sweep(self.rate, self.burst, now, today)
+            metrics.incr("admission.swept", swept)
+
+        slot = table.slot(_key(phone_number), self.burst, now, today)
+        tokens = min(self.burst, table.tokens[slot] + (now - table.updated[slot]) * self.rate)
+        table.updated[slot] = now
+        if table.day[slot] != today:
+            table.day[slot], table.spent[slot] = today, 0
+
+        if tokens < 1:
+            table.tokens[slot] = tokens
+            return self._reject(RATE_LIMITED)
+        if table.spent[slot] + self.llm_calls_per_message > self.daily_llm_calls:
+            table.tokens[slot] = tokens
+            return self._reject(BUDGET_EXHAUSTED)
+
+        table.tokens[slot] = tokens - 1
+        table.spent[slot] = min(65535, table.spent[slot] + self.llm_calls_per_message)
+        metrics.incr("admission.admitted")
+        return ADMITTED
+
+    def _reject(self, reason: str) -> str:
+        metrics.incr(f"admission.rejected.{reason}")
+        return reason
+
+    def should_notify(self, phone_number: str) -> bool:
+        """Whether to send the reject reply (at most once per ADMISSION_NOTICE_INTERVAL per sender)"""
+        table = self.table
+        slot = table.slots.get(_key(phone_number))
+        if slot is None:
+            return True
+        now = int(time.time()) - table.epoch
+        if table.notified[slot] and now - table.notified[slot] < self.notice_interval:
+            return False
+        table.notified[slot] = max(now, 1)
+        return True
+
+    def get_stats(self) -> dict:
+        return {"senders": len(self.table), "capacity": len(self.table.tokens)}
+
+def _key(phone_number: str) -> int:
+    """Phone numbers are digits; store them as ints (smaller than strings)"""
+    digits = "".join(c for c in phone_number if c.isdigit())
+    return int(digits) if digits else hash(phone_number)
+
+# Global admission controller
+admission = AdmissionController()
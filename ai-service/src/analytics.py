@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from models import Child, QueryCommand, UserContext
+from metrics import metrics
+from cache_bus import cache_bus
+from temporal import get_timezone, local_now
+
+logger = logging.getLogger(__name__)
+
+# Query types answered here rather than by a single backend lookup
+ANALYTICS_QUERIES = {"summary", "feeding_interval", "sleep_total", "feeding_trend"}
+
+# Windows in days back from the user's local today: (days before today the window starts, length in days)
+WINDOWS = {
+    "today": (0, 1),
+    "yesterday": (1, 1),
+    "this_week": (6, 7),
+    "last_week": (13, 7),
+}
+
+DIAPER_CODES = {"WET": 1, "DIRTY": 2, "MIXED": 3}
+
+@dataclass
+class LogArrays:
+    """One kind of log for one child over one window, as parallel arrays sorted by time.
+
+    `times` are epoch seconds; `values` are ml for feedings, minutes for
+    sleeps and DIAPER_CODES for diapers.
+    """
+    times: np.ndarray   # int64
+    values: np.ndarray  # float32 (feeding, sleep) or uint8 (diapers)
+
+@dataclass
+class Window:
+    name: str
+    start: datetime  # local midnight, aware
+    days: int
+
+    @property
+    def day_starts(self) -> np.ndarray:
+        """Epoch seconds of each local midnight in the window, plus the end (DST-correct)"""
+        midnights = [self.start.replace(tzinfo=None) + timedelta(days=i) for i in range(self.days + 1)]
+        return np.array([int(m.replace(tzinfo=self.start.tzinfo).timestamp()) for m in midnights], dtype=np.int64)
+
+    @property
+    def utc_dates(self) -> List[date]:
+        """UTC dates the local window overlaps (the backend filters by UTC date)"""
+        first = self.start.astimezone(timezone.utc).date()
+        last = (self.start + timedelta(days=self.days) - timedelta(seconds=1)).astimezone(timezone.utc).date()
+        return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+def make_window(name: str, timezone_name: Optional[str]) -> Window:
+    back, days = WINDOWS[name]
+    today = local_now(timezone_name).date() - timedelta(days=back)
+    return Window(name, datetime.combine(today, datetime.min.time(), tzinfo=get_timezone(timezone_name)), days)
+
+def _epoch(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+def _to_arrays(kind: str, rows: list) -> LogArrays:
+    times, values = [], []
+    for row in rows:
+        if kind == "feeding":
+            at = _epoch(row.get("startTime"))
+            value = row.get("amount") or 0.0
+        elif kind == "sleep":
+            at = _epoch(row.get("startTime"))
+            end = _epoch(row.get("endTime"))
+            value = row.get("duration") or ((end - at) / 60 if end and at else None)
+            if value is None:
+                continue  # still asleep
+        else:
+            at = _epoch(row.get("timestamp"))
+            value = DIAPER_CODES.get(row.get("type"), 0)
+        if at is not None:
+            times.append(at)
+            values.append(value)
+
+    times_array = np.array(times, dtype=np.int64)
+    order = np.argsort(times_array, kind="stable")
+    value_type = np.uint8 if kind == "diapers" else np.float32
+    return LogArrays(times_array[order], np.array(values, dtype=value_type)[order])
+
+def per_day(arrays: LogArrays, window: Window, values: Optional[np.ndarray] = None) -> np.ndarray:
+    """Sum `values` (default: count) into one bucket per local day of the window"""
+    day_starts = window.day_starts
+    index = np.searchsorted(day_starts, arrays.times, side="right") - 1
+    inside = (index >= 0) & (index < window.days)
+    weights = np.ones(len(arrays.times)) if values is None else values.astype(np.float64)
+    return np.bincount(index[inside], weights=weights[inside], minlength=window.days)
+
+def _duration(minutes: float) -> str:
+    minutes = int(round(minutes))
+    return f"{minutes // 60}h {minutes % 60}m"
+
+class AnalyticsService:
+    """Trend and interval answers computed from each child's raw logs.
+
+    Logs are fetched once per (child, kind, window), held as compact NumPy
+    arrays and cached for ANALYTICS_CACHE_TTL seconds; writes through this
+    service drop the child's entries (in every worker, via the cache bus).
+    """
+
+    def __init__(self):
+        self.backend_url = os.getenv("BACKEND_API_URL")
+        self.ttl = float(os.getenv("ANALYTICS_CACHE_TTL", 300))
+        self.concurrency = int(os.getenv("ANALYTICS_FETCH_CONCURRENCY", 8))
+        self.max_entries = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", 10000))
+        self._cache: Dict[Tuple[str, str, str, int], Tuple[float, LogArrays]] = {}
+        self._inflight: Dict[Tuple[str, str, str, int], asyncio.Task] = {}
+        # Bumped by invalidate() so a fetch that was running at the time is not cached
+        self._generations: Dict[str, int] = {}
+        cache_bus.subscribe("analytics", lambda child_id: self.invalidate(child_id, broadcast=False))
+
+    def invalidate(self, child_id: str, broadcast: bool = True) -> None:
+        """Drop cached logs for a child (call after writing a log)"""
+        self._generations[child_id] = self._generations.get(child_id, 0) + 1
+        for key in [key for key in self._cache if key[0] == child_id]:
+            del self._cache[key]
+        # Callers from now on fetch afresh instead of joining a fetch that may miss the write
+        for key in [key for key in self._inflight if key[0] == child_id]:
+            del self._inflight[key]
+        if broadcast:
+            cache_bus.publish("analytics", child_id)
+
+    async def logs(self, child_id: str, kind: str, window: Window, token: str,
+                   client: httpx.AsyncClient) -> LogArrays:
+        """A child's logs of one kind over a window, from cache or fetched once"""
+        key = (child_id, kind, window.start.isoformat(), window.days)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            metrics.incr("analytics.cache_hits")
+            return cached[1]
+
+        generation = self._generations.get(child_id, 0)
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.incr("analytics.cache_misses")
+            task = asyncio.ensure_future(self._fetch(child_id, kind, window, token, client))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.get(key) is done and self._inflight.pop(key))
+        arrays = await asyncio.shield(task)
+        if generation != self._generations.get(child_id, 0):
+            # Invalidated while fetching: the result may predate the write
+            metrics.incr("analytics.stale_fetches")
+            return arrays
+        if len(self._cache) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[stale]
+        self._cache[key] = (time.monotonic() + self.ttl, arrays)
+        return arrays
+
+    async def _fetch(self, child_id: str, kind: str, window: Window, token: str,
+                     client: httpx.AsyncClient) -> LogArrays:
+        path = {"feeding": "/feeding", "sleep": "/sleep", "diapers": "/diapers"}[kind]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_day(day: date) -> list:
+            async with semaphore:
+                response = await client.get(
+                    f"{self.backend_url}{path}",
+                    headers={"Authorization": f"Bearer {token}"},
+                    params={"childId": child_id, "date": day.isoformat()}
+                )
+                response.raise_for_status()
+                return response.json()
+
+        days = await asyncio.gather(*(fetch_day(day) for day in window.utc_dates))
+        arrays = _to_arrays(kind, [row for rows in days for row in rows])
+        # The UTC dates overhang the local window at both ends
+        bounds = window.day_starts[[0, -1]]
+        inside = (arrays.times >= bounds[0]) & (arrays.times < bounds[1])
+        return LogArrays(arrays.times[inside], arrays.values[inside])
+
+    async def answer(self, command: QueryCommand, user_context: UserContext, token: str) -> Dict:
+        """Answer an analytics query for the named child, or all children"""
+        children = user_context.user.children
+        if command.child_name:
+            children = [c for c in children if c.name.lower() == command.child_name.lower()]
+            if not children:
+                return {"error": f"Child '{command.child_name}' not found"}
+
+        timezone_name = user_context.user.timezone
+        window_name = (command.details or {}).get("window")
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=15.0) as client:
+            handler = {
+                "summary": self._summary,
+                "feeding_interval": self._feeding_interval,
+                "sleep_total": self._sleep_total,
+                "feeding_trend": self._feeding_trend,
+            }[command.query_type]
+            lines = await asyncio.gather(*(
+                handler(child, window_name, timezone_name, token, client) for child in children
+            ))
+        metrics.observe("analytics.answer_ms", (time.perf_counter() - started) * 1000)
+        return {"success": True, "response": "\n".join(lines), "query_type": command.query_type}
+
+    async def _summary(self, child: Child, window_name: Optional[str], timezone_name: Optional[str],
+                       token: str, client: httpx.AsyncClient) -> str:
+        window = make_window(window_name if window_name in WINDOWS else "today", timezone_name)
+        feedings, sleeps, diapers = await asyncio.gather(
+            self.logs(child.id, "feeding", window, token, client),
+            self.logs(child.id, "sleep", window, token, client),
+            self.logs(child.id, "diapers", window, token, client),
+        )
+        feeds = per_day(feedings, window)
+        ml = per_day(feedings, window, feedings.values)
+        sleep = per_day(sleeps, window, sleeps.values)
+        diaper_count = per_day(diapers, window)
+        label = window.name.replace("_", " ")
+        return (f"{child.name} ({label}): {int(feeds.sum())} feeds, {ml.sum():.0f}ml, "
+                f"{_duration(sleep.sum())} sleep, {int(diaper_count.sum())} diapers")
+
+    async def _feeding_interval(self, child: Child, window_name: Optional[str], timezone_name: Optional[str],
+                                token: str, client: httpx.AsyncClient) -> str:
+        window = make_window(window_name if window_name in WINDOWS else "this_week", timezone_name)
+        feedings = await self.logs(child.id, "feeding", window, token, client)
+        label = window.name.replace("_", " ")
+        if len(feedings.times) < 2:
+            return f"{child.name}: not enough feedings {label} to measure intervals"
+        gaps = np.diff(feedings.times) / 60.0
+        return (f"{child.name}: {_duration(gaps.mean())} on average between feeds {label} "
+                f"(median {_duration(np.median(gaps))}, longest {_duration(gaps.max())}, {len(feedings.times)} feeds)")
+
+    async def _sleep_total(self, child: Child, window_name: Optional[str], timezone_name: Optional[str],
+                           token: str, client: httpx.AsyncClient) -> str:
+        window = make_window(window_name if window_name in WINDOWS else "yesterday", timezone_name)
+        # Compare against the seven days before the window
+        baseline = Window("previous week", window.start - timedelta(days=7), 7)
+        current, previous = await asyncio.gather(
+            self.logs(child.id, "sleep", window, token, client),
+            self.logs(child.id, "sleep", baseline, token, client),
+        )
+        total = per_day(current, window, current.values)
+        daily = per_day(previous, baseline, previous.values)
+        average = daily.mean() * window.days
+        change = total.sum() - average
+        sign = "+" if change >= 0 else "-"
+        return (f"{child.name} slept {_duration(total.sum())} {window.name.replace('_', ' ')} vs "
+                f"{_duration(average)} for the same length the week before ({sign}{_duration(abs(change))})")
+
+    async def _feeding_trend(self, child: Child, window_name: Optional[str], timezone_name: Optional[str],
+                             token: str, client: httpx.AsyncClient) -> str:
+        window = make_window(window_name if window_name in ("this_week", "last_week") else "this_week", timezone_name)
+        feedings = await self.logs(child.id, "feeding", window, token, client)
+        daily = per_day(feedings, window, feedings.values)
+        logged = daily > 0
+        if logged.sum() < 2:
+            return f"{child.name}: not enough feeding data {window.name.replace('_', ' ')} for a trend"
+        days = np.arange(window.days)[logged]
+        slope = np.polyfit(days, daily[logged], 1)[0]
+        rolling = np.convolve(daily, np.ones(3) / 3, mode="valid")
+        return (f"{child.name}: {' / '.join(f'{v:.0f}' for v in daily)} ml per day, "
+                f"3-day average now {rolling[-1]:.0f}ml (trend {slope:+.0f}ml/day)")
+
+# Global analytics instance
+analytics = AnalyticsService()
@@ -2,16 +2,28 @@ import os
 import httpx
 import logging
 from typing import Optional, Dict, Any
+from backend_client import backend
+from token_manager import token_manager
 
 logger = logging.getLogger(__name__)
 
+class TokenRejected(Exception):
+    """The token is expired, forged or refused by the backend, as opposed to the backend being unreachable"""
+
 class AuthMiddleware:
-    """Handle authentication with the backend API"""
+    """Handle authentication with the backend API.
+
+    A token's profile is fetched from the backend once and then served from
+    the token manager until the token expires, so verifying a known token is
+    local. The backend can revoke a token earlier (e.g. a deleted user); set
+    AUTH_CHECK_REVOCATION=true to ask it on every verification instead.
+    """
 
     def __init__(self):
         self.backend_url = os.getenv("BACKEND_API_URL")
         if not self.backend_url:
             raise ValueError("BACKEND_API_URL environment variable is required")
+        self.check_revocation = os.getenv("AUTH_CHECK_REVOCATION", "false").lower() == "true"
 
     async def authenticate_user(self, email: str, password: str) -> Optional[Dict[str, Any]]:
         """Authenticate user and get JWT token"""
@@ -30,11 +42,11 @@ class AuthMiddleware:
                         "user": data.get("user")
                     }
                 else:
-                    logger.error(f"Authentication failed: {response.text}")
+                    logger.error("Authentication failed: %s", response.text)
                     return None
 
         except Exception as e:
-            logger.error(f"Error during authentication: {e}")
+            logger.error("Error during authentication: %s", e)
             return None
 
     async def register_user(self, email: str, password: str, name: str) -> Optional[Dict[str, Any]]:
@@ -58,56 +70,81 @@ class AuthMiddleware:
                         "user": data.get("user")
                     }
                 else:
-                    logger.error(f"Registration failed: {response.text}")
+                    logger.error("Registration failed: %s", response.text)
                     return None
 
         except Exception as e:
-            logger.error(f"Error during registration: {e}")
+            logger.error("Error during registration: %s", e)
             return None
 
     async def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
         """Verify JWT token and get user info"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.backend_url}/auth/profile",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json"
-                    }
-                )
+            return await self.get_profile(token)
+        except TokenRejected:
+            return None
 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Token verification failed: {response.text}")
-                    return None
+    async def get_profile(self, token: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """User info for a token; raises TokenRejected if the token is no good, None if the backend failed.
 
+        A profile already verified for this token is returned without a
+        backend call unless `fresh` (or AUTH_CHECK_REVOCATION) asks for one.
+        """
+        # Expired or forged tokens are rejected locally, without asking the backend
+        if token_manager.check(token) is None:
+            raise TokenRejected("Token expired or invalid")
+        if not fresh and not self.check_revocation:
+            profile = token_manager.profile(token)
+            if profile is not None:
+                return profile
+
+        try:
+            # Not through the read cache: its stale window would hide a revocation here
+            response = await backend.get("/auth/me", token, cache=False)
         except Exception as e:
-            logger.error(f"Error verifying token: {e}")
+            logger.error("Error verifying token: %s", e)
             return None
 
+        if response.status_code == 200:
+            profile = response.json()
+            token_manager.remember_profile(token, profile)
+            return profile
+        logger.error("Token verification failed: %s", response.text)
+        # Only these mean the token is bad; anything else is the backend failing
+        if response.status_code in (401, 403):
+            token_manager.drop_profile(token)
+            raise TokenRejected(f"Backend refused the token ({response.status_code})")
+        return None
+
     async def get_user_children(self, token: str) -> Optional[list]:
-        """Get user's children from backend"""
+        """Get user's children from backend; None if the backend failed"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.backend_url}/children",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json"
-                    }
-                )
+            response = await backend.get("/children", token)
 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get children: {response.text}")
-                    return []
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error("Failed to get children: %s", response.text)
+                return None
+
+        except Exception as e:
+            logger.error("Error getting children: %s", e)
+            return None
+
+    async def get_user_timezone(self, token: str) -> Optional[str]:
+        """Get the user's IANA timezone preference from backend"""
+        try:
+            response = await backend.get("/users/timezone", token)
+
+            if response.status_code == 200:
+                return response.json().get("timezone")
+            else:
+                logger.warning("Failed to get timezone: %s", response.text)
+                return None
 
         except Exception as e:
-            logger.error(f"Error getting children: {e}")
-            return []
+            logger.warning("Error getting timezone: %s", e)
+            return None
 
     def create_authenticated_headers(self, token: str) -> Dict[str, str]:
         """Create headers with authentication token"""
@@ -116,5 +153,18 @@ class AuthMiddleware:
             "Content-Type": "application/json"
         }
 
-# Global auth instance
-auth = AuthMiddleware()
\ No newline at end of file
+# Global auth instance, created on first use so importing this module stays cheap
+_auth: Optional[AuthMiddleware] = None
+
+def get_auth() -> AuthMiddleware:
+    """Return the shared AuthMiddleware, creating it on first use"""
+    global _auth
+    if _auth is None:
+        _auth = AuthMiddleware()
+    return _auth
+
+def __getattr__(name: str):
+    # Keeps `from auth_middleware import auth` working without constructing it at import time
+    if name == "auth":
+        return get_auth()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Optional, Set
+
+import httpx
+
+from metrics import metrics
+from cache_bus import cache_bus
+from single_flight import backend_reads
+
+logger = logging.getLogger(__name__)
+
+_CHILD_PATH = re.compile(r"^/[\w-]+/last/(?P<child_id>[\w-]+)$")
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    content: bytes
+    headers: Dict[str, str]
+    stored_at: float
+    max_age: float
+    child_ids: Set[str] = field(default_factory=set)
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers that revalidate this body"""
+        headers = {}
+        if "etag" in self.headers:
+            headers["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+    def response(self) -> httpx.Response:
+        return httpx.Response(self.status_code, content=self.content, headers=self.headers)
+
+class BackendClient:
+    """Shared HTTP client for the backend API with a conditional-request cache for reads.
+
+    Successful GETs are kept with their ETag/Last-Modified. A cached body is
+    served as-is for BACKEND_CACHE_MAX_AGE seconds (or the response's
+    Cache-Control max-age), then served stale for up to
+    BACKEND_CACHE_STALE_SECONDS while a conditional request revalidates it in
+    the background; older bodies are revalidated before answering. A 304
+    refreshes the entry without transferring the body.
+
+    Entries are tagged with the child they describe; `invalidate_child`
+    drops them (in every worker, via the cache bus) after we write that
+    child's logs.
+    """
+
+    def __init__(self):
+        self.backend_url = os.getenv("BACKEND_API_URL")
+        self.max_age = float(os.getenv("BACKEND_CACHE_MAX_AGE", 5))
+        self.stale = float(os.getenv("BACKEND_CACHE_STALE_SECONDS", 60))
+        self.max_entries = int(os.getenv("BACKEND_CACHE_MAX_ENTRIES", 5000))
+        self._cache: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._revalidating: Set[asyncio.Task] = set()
+        # Bumped by every invalidation; a fetch that straddles one must not be stored
+        self._generation = 0
+        cache_bus.subscribe("backend", lambda child_id: self.invalidate_child(child_id, broadcast=False))
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """One pooled client per event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=15.0)
+            self._client_loop = loop
+        return self._client
+
+    async def close(self) -> None:
+        for task in list(self._revalidating):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, path: str, token: str, params: Optional[Dict[str, str]] = None,
+                  cache: bool = True) -> httpx.Response:
+        """GET a backend endpoint with the user's token, from cache when possible (`cache=False` always asks)"""
+        key = (path, token, tuple(sorted(params.items())) if params else None)
+        if not cache:
+            metrics.incr("backend_cache.bypassed")
+            # Not cached, but concurrent identical reads still share one request
+            return await backend_reads.do(("uncached",) + key, lambda: self.client.get(
+                f"{self.backend_url}{path}", params=params,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            age = time.monotonic() - cached.stored_at
+            if age < cached.max_age:
+                metrics.incr("backend_cache.fresh_hits")
+                return cached.response()
+            if age < cached.max_age + self.stale:
+                metrics.incr("backend_cache.stale_hits")
+                self._revalidate_in_background(key, path, token, params)
+                return cached.response()
+        else:
+            metrics.incr("backend_cache.misses")
+
+        # Concurrent readers of the same key share one request
+        entry = await backend_reads.do(key, lambda: self._fetch(key, path, token, params))
+        return entry.response()
+
+    def _revalidate_in_background(self, key: Hashable, path: str, token: str,
+                                  params: Optional[Dict[str, str]]) -> None:
+        task = asyncio.ensure_future(backend_reads.do(key, lambda: self._fetch(key, path, token, params)))
+        self._revalidating.add(task)
+        task.add_done_callback(self._revalidated)
+
+    def _revalidated(self, task: asyncio.Task) -> None:
+        self._revalidating.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background revalidation failed: %s", task.exception())
+
+    async def _fetch(self, key: Hashable, path: str, token: str,
+                     params: Optional[Dict[str, str]]) -> CachedResponse:
+        generation = self._generation
+        cached = self._cache.get(key)
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        if cached is not None:
+            headers.update(cached.validators)
+
+        response = await self.client.get(f"{self.backend_url}{path}", headers=headers, params=params)
+
+        current = generation == self._generation
+        if response.status_code == 304 and cached is not None:
+            metrics.incr("backend_cache.revalidated")
+            if current and key in self._cache:
+                cached.stored_at = time.monotonic()
+                if "cache-control" in response.headers:
+                    cached.max_age = self._max_age(response.headers)
+            return cached
+
+        entry = CachedResponse(
+            status_code=response.status_code,
+            content=response.content,
+            headers={name: response.headers[name] for name in ("content-type", "etag", "last-modified")
+                     if name in response.headers},
+            stored_at=time.monotonic(),
+            max_age=self._max_age(response.headers),
+            child_ids=_child_ids(path, params),
+        )
+        if current and response.status_code == 200 and "no-store" not in response.headers.get("cache-control", ""):
+            self._store(key, entry)
+        else:
+            self._cache.pop(key, None)
+        return entry
+
+    def _max_age(self, headers: httpx.Headers) -> float:
+        cache_control = headers.get("cache-control", "")
+        if "no-cache" in cache_control:
+            return 0.0
+        match = _MAX_AGE.search(cache_control)
+        return float(match.group(1)) if match else self.max_age
+
+    def _store(self, key: Hashable, entry: CachedResponse) -> None:
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def invalidate_child(self, child_id: str, broadcast: bool = True) -> None:
+        """Drop cached reads about a child (call after writing its logs)"""
+        self._generation += 1
+        for key in [key for key, entry in self._cache.items() if child_id in entry.child_ids]:
+            del self._cache[key]
+        if broadcast:
+            cache_bus.publish("backend", child_id)
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._cache), "revalidating": len(self._revalidating)}
+
+def _child_ids(path: str, params: Optional[Dict[str, str]]) -> Set[str]:
+    """Children a read is about: a childId parameter or a child id path segment (e.g. /feeding/last/{id})"""
+    ids = set()
+    if params and params.get("childId"):
+        ids.add(params["childId"])
+    match = _CHILD_PATH.match(path)
+    if match:
+        ids.add(match.group("child_id"))
+    return ids
+
+# Global backend client
+backend = BackendClient()
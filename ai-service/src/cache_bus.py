@@ -0,0 +1,146 @@
+import os
+import socket
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], None]
+
+class CacheInvalidationBus:
+    """Broadcast cache invalidations between worker processes.
+
+    Each worker keeps its own in-memory caches; when one of them changes or
+    drops a user's cached data it publishes "<topic>:<key>" and every other
+    worker applies the same invalidation locally. Transport is chosen by
+    CACHE_BUS_URL:
+    - redis://host:port/db  Redis pub/sub (works across hosts)
+    - unix:///path/to/dir   one datagram socket per worker in a shared directory
+    - unset                 single process, nothing to broadcast
+    """
+
+    CHANNEL = "twins:cache-invalidate"
+
+    def __init__(self):
+        self.url = os.getenv("CACHE_BUS_URL", "")
+        self.origin = str(os.getpid())
+        self.handlers: Dict[str, List[Handler]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._redis = None
+        self._sock: Optional[socket.socket] = None
+        self._sock_path: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        """Call `handler(key)` when another worker invalidates `topic:key`"""
+        self.handlers.setdefault(topic, []).append(handler)
+
+    async def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+
+        # Workers are forked after import, so take the pid now
+        self.origin = str(os.getpid())
+        if self.url.startswith("redis://") or self.url.startswith("rediss://"):
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url)
+            pubsub = self._redis.pubsub()
+            await pubsub.subscribe(self.CHANNEL)
+            self._task = asyncio.create_task(self._listen_redis(pubsub))
+        elif self.url.startswith("unix://"):
+            directory = self.url[len("unix://"):]
+            os.makedirs(directory, exist_ok=True)
+            self._sock_path = os.path.join(directory, f"{self.origin}.sock")
+            if os.path.exists(self._sock_path):
+                os.unlink(self._sock_path)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self._sock_path)
+            self._sock.setblocking(False)
+            self._task = asyncio.create_task(self._listen_unix())
+        else:
+            logger.error("Unsupported CACHE_BUS_URL %s; cache invalidations stay local", self.url)
+            return
+
+        logger.info("Cache invalidation bus started on %s", self.url)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            if self._sock_path and os.path.exists(self._sock_path):
+                os.unlink(self._sock_path)
+
+    def publish(self, topic: str, key: str) -> None:
+        """Tell the other workers to invalidate `topic:key` (fire and forget)"""
+        if self._task is None:
+            return
+
+        payload = f"{self.origin}|{topic}:{key}"
+        metrics.incr("cache_bus.published")
+        if self._redis is not None:
+            asyncio.get_running_loop().create_task(self._publish_redis(payload))
+        elif self._sock is not None:
+            self._publish_unix(payload.encode())
+
+    async def _publish_redis(self, payload: str) -> None:
+        try:
+            await self._redis.publish(self.CHANNEL, payload)
+        except Exception as e:
+            logger.warning("Failed to publish cache invalidation: %s", e)
+
+    def _publish_unix(self, data: bytes) -> None:
+        directory = os.path.dirname(self._sock_path)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if path == self._sock_path or not name.endswith(".sock"):
+                continue
+            try:
+                self._sock.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker behind this socket is gone (e.g. recycled)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                metrics.incr("cache_bus.dropped")
+
+    def _dispatch(self, payload: str) -> None:
+        origin, _, message = payload.partition("|")
+        if origin == self.origin:
+            return
+        topic, _, key = message.partition(":")
+        metrics.incr("cache_bus.received")
+        for handler in self.handlers.get(topic, []):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.error("Cache invalidation handler for %s failed: %s", topic, e)
+
+    async def _listen_redis(self, pubsub) -> None:
+        async for message in pubsub.listen():
+            if message.get("type") == "message":
+                data = message["data"]
+                self._dispatch(data.decode() if isinstance(data, bytes) else data)
+
+    async def _listen_unix(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.sock_recv(self._sock, 4096)
+            self._dispatch(data.decode())
+
+# Global bus instance
+cache_bus = CacheInvalidationBus()
@@ -0,0 +1,65 @@
+"""Production launcher: gunicorn managing uvicorn workers.
+
+    python cluster.py
+
+Environment:
+- PORT: listen port (default 8000)
+- CLUSTER_WORKERS: worker processes (default: CPU count)
+- WORKER_MAX_REQUESTS: recycle a worker after this many requests (default 10000, 0 disables)
+- WORKER_GRACEFUL_TIMEOUT: seconds a recycled worker gets to finish in-flight requests (default 30)
+- CACHE_BUS_URL: cache invalidation transport; defaults to a per-launch unix socket directory
+"""
+import os
+import tempfile
+import multiprocessing
+
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+class ClusterApplication(BaseApplication):
+    """Embed gunicorn so the launcher needs no separate config file"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # With preload_app this runs once in the master, so workers fork with
+        # our modules already imported instead of each paying the import cost
+        from main import app
+        if os.getenv("LLM_BACKEND", "openai").lower() == "langchain":
+            import langchain_openai  # noqa: F401
+        return app
+
+def build_options() -> dict:
+    workers = int(os.getenv("CLUSTER_WORKERS", multiprocessing.cpu_count()))
+    max_requests = int(os.getenv("WORKER_MAX_REQUESTS", 10000))
+    return {
+        "bind": f"0.0.0.0:{os.getenv('PORT', 8000)}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": max_requests,
+        # Stagger recycling so workers don't all restart at once
+        "max_requests_jitter": max_requests // 10,
+        "graceful_timeout": int(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30)),
+        "timeout": int(os.getenv("WORKER_TIMEOUT", 120)),
+        "keepalive": 5,
+    }
+
+def main():
+    load_dotenv()
+    options = build_options()
+
+    # Workers read these when they import our modules
+    os.environ["CLUSTER_WORKERS"] = str(options["workers"])
+    os.environ.setdefault("CACHE_BUS_URL", "unix://" + tempfile.mkdtemp(prefix="twins-cache-bus-"))
+
+    ClusterApplication(options).run()
+
+if __name__ == "__main__":
+    main()
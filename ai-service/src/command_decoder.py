@@ -0,0 +1,92 @@
+import os
+import re
+import logging
+from typing import Optional, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from models import Command
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+# Built once: validates a raw JSON string straight into the right command model
+COMMAND_ADAPTER: TypeAdapter = TypeAdapter(Command)
+
+# Only this much of a reply is scanned for wrapped JSON
+MAX_SCAN_CHARS = int(os.getenv("DECODE_MAX_SCAN_CHARS", 8192))
+_FENCE = re.compile(r"```(?:json|JSON)?[ \t]*\n?(.*?)```", re.DOTALL)
+_STRUCTURAL = re.compile(r'"(?:[^"\\]|\\.)*"|[{}]', re.DOTALL)
+
+class CommandDecodeError(ValueError):
+    """LLM output that is not a valid command"""
+
+def decode_command(raw: str, expected: Optional[Type[T]] = None) -> T:
+    """Validate an LLM reply into a command model in one pass.
+
+    The fast path validates the raw string with pydantic's JSON parser. Only
+    replies with something around the JSON (prose, a code fence) go through
+    the recovery scanner, which extracts the first complete JSON object.
+    """
+    candidate = raw
+    if not raw.lstrip().startswith("{"):
+        # Not bare JSON (prose or a code fence first): don't pay for a failed parse
+        candidate = _recover(raw)
+        if candidate is None:
+            raise CommandDecodeError("no JSON object in LLM output")
+        metrics.incr("decode.recovered")
+
+    try:
+        command = COMMAND_ADAPTER.validate_json(candidate)
+    except ValidationError as e:
+        if candidate is not raw or not _is_json_error(e):
+            raise CommandDecodeError(_summary(e)) from e
+        # Starts like JSON but has trailing text
+        candidate = _recover(raw)
+        if candidate is None:
+            raise CommandDecodeError("no JSON object in LLM output") from e
+        metrics.incr("decode.recovered")
+        try:
+            command = COMMAND_ADAPTER.validate_json(candidate)
+        except ValidationError as e2:
+            raise CommandDecodeError(_summary(e2)) from e2
+
+    if expected is not None and not isinstance(command, expected):
+        raise CommandDecodeError(f"expected {expected.__name__}, got action {command.action!r}")
+    return command
+
+def _is_json_error(error: ValidationError) -> bool:
+    return any(item["type"] == "json_invalid" for item in error.errors(include_url=False))
+
+def _summary(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in item['loc']) or 'value'}: {item['msg']}"
+        for item in error.errors(include_url=False)[:3]
+    )
+
+def _recover(raw: str) -> Optional[str]:
+    """First balanced {...} in the reply (inside a code fence if there is one), or None"""
+    text = raw[:MAX_SCAN_CHARS]
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+        if text.startswith("{") and text.endswith("}"):
+            return text
+
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    # Linear scan for the matching brace; string literals are matched whole so braces in them don't count
+    depth = 0
+    for match in _STRUCTURAL.finditer(text, start):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:match.end()]
+    return None
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+
+from user_service import get_user_service
+from metrics import metrics
+from load_shedder import load_shedder
+from token_manager import token_manager
+
+logger = logging.getLogger(__name__)
+
+class ContextRefresher:
+    """Refresh-ahead of cached user contexts.
+
+    Periodically re-fetches profile and children for users who were active
+    recently and whose cached context is about to expire, so a message never
+    has to rebuild it on its critical path. Contexts whose auth token has
+    expired are dropped in the same pass.
+    """
+
+    def __init__(self):
+        self.interval = int(os.getenv("CONTEXT_REFRESH_INTERVAL", 60))
+        self.active_window = int(os.getenv("CONTEXT_ACTIVE_WINDOW", 86400))
+        self.refresh_margin = int(os.getenv("CONTEXT_REFRESH_MARGIN", 300))
+        self.concurrency = int(os.getenv("CONTEXT_REFRESH_CONCURRENCY", 10))
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if load_shedder.defer("context_refresh"):
+                continue
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logger.error("Context refresh pass failed: %s", e)
+            try:
+                self.expire_tokens()
+            except Exception as e:
+                logger.error("Token expiry pass failed: %s", e)
+
+    async def refresh_due(self) -> int:
+        """Refresh every context that is due; returns how many were refreshed"""
+        user_service = get_user_service()
+        candidates = user_service.storage.get_refresh_candidates(self.active_window, self.refresh_margin)
+        if not candidates:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(user_id: str) -> bool:
+            async with semaphore:
+                try:
+                    return await user_service.refresh_user_data(user_id) is not None
+                except Exception as e:
+                    logger.error("Error refreshing user %s: %s", user_id, e)
+                    return False
+
+        results = await asyncio.gather(*(refresh(user_id) for user_id in candidates))
+        refreshed = sum(results)
+        metrics.incr("context_refresh.refreshed", refreshed)
+        metrics.incr("context_refresh.failed", len(results) - refreshed)
+        logger.info("Refreshed %s of %s expiring user contexts", refreshed, len(candidates))
+        return refreshed
+
+    def expire_tokens(self) -> int:
+        """Drop cached contexts whose auth token has expired; returns how many"""
+        expired = token_manager.expired()
+        user_service = get_user_service()
+        for user_id in expired:
+            user_service.expire_user(user_id)
+        metrics.incr("auth.token.contexts_expired", len(expired))
+        return len(expired)
+
+# Global refresher instance
+context_refresher = ContextRefresher()
@@ -0,0 +1,86 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class MessageDeduplicator:
+    """Recognise webhook redeliveries by WhatsApp message id.
+
+    Keeps a bounded, time-windowed LRU of seen ids in-process. When
+    DEDUP_REDIS_URL (or REDIS_URL) is set, ids are also claimed in Redis with
+    SET NX so that every worker sees the same seen-set.
+    """
+
+    def __init__(self):
+        self.window = int(os.getenv("DEDUP_WINDOW_SECONDS", 86400))  # Meta retries for up to 24h
+        self.max_entries = int(os.getenv("DEDUP_MAX_ENTRIES", 100000))
+        self.redis_url = os.getenv("DEDUP_REDIS_URL") or os.getenv("REDIS_URL")
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._redis = None
+        self.duplicates = 0
+
+    def _get_redis(self):
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.redis_url)
+        return self._redis
+
+    def _seen_locally(self, message_id: str, now: float) -> bool:
+        """Check the local window, recording the id if it is new"""
+        seen_at = self._seen.get(message_id)
+        if seen_at is not None and now - seen_at < self.window:
+            self._seen.move_to_end(message_id)
+            return True
+
+        self._seen[message_id] = now
+        self._seen.move_to_end(message_id)
+
+        # Evict from the old end: anything past the window, then anything over capacity
+        while self._seen:
+            oldest_id, oldest_at = next(iter(self._seen.items()))
+            if now - oldest_at >= self.window or len(self._seen) > self.max_entries:
+                del self._seen[oldest_id]
+            else:
+                break
+        return False
+
+    async def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """Return True if this message id was already seen within the window"""
+        if not message_id:
+            return False
+
+        if self._seen_locally(message_id, time.monotonic()):
+            self.duplicates += 1
+            return True
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                claimed = await client.set(f"wa:msg:{message_id}", 1, nx=True, ex=self.window)
+                if not claimed:
+                    self.duplicates += 1
+                    return True
+            except Exception as e:
+                # The local window still protects this worker
+                logger.warning("Dedup store unavailable, using local window only: %s", e)
+
+        return False
+
+    async def forget(self, message_id: Optional[str]) -> None:
+        """Release a message id so a redelivery is processed again (e.g. after a failure)"""
+        if not message_id:
+            return
+
+        self._seen.pop(message_id, None)
+        client = self._get_redis()
+        if client is not None:
+            try:
+                await client.delete(f"wa:msg:{message_id}")
+            except Exception as e:
+                logger.warning("Failed to release message id %s: %s", message_id, e)
+
+# Global deduplicator instance
+deduplicator = MessageDeduplicator()
@@ -0,0 +1,312 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from models import User
+from metrics import metrics
+from load_shedder import load_shedder
+from temporal import get_timezone, local_now, DEFAULT_TIMEZONE
+from user_service import get_user_service
+from whatsapp_sender import whatsapp_sender, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Replies are rendered from these templates; no LLM call is involved
+CHILD_TEMPLATE = """*{name}*
+🍼 {feedings} feedings, {feeding_ml:.0f}ml total{last_feeding}
+😴 {sleep} of sleep ({sleeps} sessions)
+🧷 {diapers} diapers ({wet} wet, {dirty} dirty)"""
+DIGEST_TEMPLATE = "🌙 Today's summary ({day}):\n\n{children}"
+NO_ACTIVITY = "*{name}*\nNothing logged today."
+
+@dataclass
+class Subscription:
+    user_id: str
+    phone_number: str
+    send_at: str  # local "HH:MM"
+    timezone: str
+    last_sent: Optional[str] = None  # local date of the last digest
+
+class DigestSubscriptions:
+    """SQLite-backed list of users who opted in to the evening digest"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS digest_subscriptions (
+                user_id TEXT PRIMARY KEY,
+                phone_number TEXT NOT NULL,
+                send_at TEXT NOT NULL,
+                timezone TEXT NOT NULL,
+                last_sent TEXT
+            )"""
+        )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def upsert(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO digest_subscriptions (user_id, phone_number, send_at, timezone)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET
+                       phone_number = excluded.phone_number,
+                       send_at = excluded.send_at,
+                       timezone = excluded.timezone""",
+                (subscription.user_id, subscription.phone_number, subscription.send_at, subscription.timezone)
+            )
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM digest_subscriptions WHERE user_id = ?", (user_id,))
+
+    def all(self) -> List[Subscription]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, phone_number, send_at, timezone, last_sent FROM digest_subscriptions"
+            ).fetchall()
+        return [Subscription(*row) for row in rows]
+
+    def claim(self, subscriptions: List[Subscription], days: Dict[str, str]) -> List[Subscription]:
+        """Mark today's digest as taken; returns the ones no other worker had taken already"""
+        claimed = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for subscription in subscriptions:
+                    cursor = self._conn.execute(
+                        "UPDATE digest_subscriptions SET last_sent = ? WHERE user_id = ? AND last_sent IS ?",
+                        (days[subscription.user_id], subscription.user_id, subscription.last_sent)
+                    )
+                    if cursor.rowcount == 1:
+                        claimed.append(subscription)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def release(self, subscription: Subscription, day: str) -> None:
+        """Undo a claim whose digest could not be sent, so a later run retries it"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE digest_subscriptions SET last_sent = ? WHERE user_id = ? AND last_sent = ?",
+                (subscription.last_sent, subscription.user_id, day)
+            )
+
+class DigestJob:
+    """Evening digest of each child's day, pushed to opted-in users over WhatsApp.
+
+    Every DIGEST_CHECK_INTERVAL seconds, subscribers whose local send time has
+    passed and who haven't had today's digest are processed in batches: their
+    day's logs are prefetched with bounded concurrency across users, summaries
+    are rendered from templates, and replies are queued to the WhatsApp sender
+    at DIGEST_SEND_RATE so digests don't crowd out interactive replies.
+
+    Users need a cached session (they messaged since the last restart); the
+    others are skipped and counted.
+    """
+
+    def __init__(self):
+        self.backend_url = os.getenv("BACKEND_API_URL")
+        self.interval = int(os.getenv("DIGEST_CHECK_INTERVAL", 60))
+        self.default_send_at = os.getenv("DIGEST_SEND_AT", "19:00")
+        self.batch_size = int(os.getenv("DIGEST_BATCH_SIZE", 100))
+        self.concurrency = int(os.getenv("DIGEST_FETCH_CONCURRENCY", 10))
+        self.send_rate = float(os.getenv("DIGEST_SEND_RATE", 5))  # messages per second
+        self.subscriptions = DigestSubscriptions(os.getenv("DIGEST_DB_PATH", "digest.db"))
+        self.last_report: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self._task is None:
+            await asyncio.to_thread(self.subscriptions.open)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await asyncio.to_thread(self.subscriptions.close)
+
+    async def subscribe(self, user_id: str, phone_number: str, send_at: Optional[str] = None) -> Subscription:
+        """Opt a user in (or update their send time); raises LookupError for users we don't know"""
+        user = await get_user_service().get_user_by_id(user_id)
+        if user is None:
+            raise LookupError(f"Unknown user {user_id}")
+        # Zero-padded, so "7:00" compares correctly as text
+        send_at = f"{datetime.strptime(send_at or self.default_send_at, '%H:%M'):%H:%M}"
+        subscription = Subscription(user_id, phone_number, send_at, user.timezone or DEFAULT_TIMEZONE)
+        await asyncio.to_thread(self.subscriptions.upsert, subscription)
+        return subscription
+
+    async def unsubscribe(self, user_id: str) -> None:
+        await asyncio.to_thread(self.subscriptions.remove, user_id)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            # Digests can wait a pass while the service is overloaded
+            if load_shedder.defer("digest"):
+                continue
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error("Digest run failed: %s", e)
+
+    def _due(self, subscriptions: List[Subscription]) -> List[Subscription]:
+        due = []
+        for subscription in subscriptions:
+            now = local_now(subscription.timezone)
+            # Compared as times: rows stored before send_at was zero-padded may read "7:00"
+            send_at = datetime.strptime(subscription.send_at, "%H:%M").time()
+            if subscription.last_sent != now.date().isoformat() and now.time() >= send_at:
+                due.append(subscription)
+        return due
+
+    async def run_due(self, force: bool = False) -> Dict[str, Any]:
+        """Send today's digest to every subscriber who is due (all of them with force)"""
+        async with self._running:
+            subscriptions = await asyncio.to_thread(self.subscriptions.all)
+            due = subscriptions if force else self._due(subscriptions)
+            if not due:
+                return {"due": 0}
+
+            started = time.perf_counter()
+            report = {"due": len(due), "sent": 0, "skipped_no_session": 0, "failed": 0, "backend_requests": 0}
+            bucket = TokenBucket(self.send_rate, max(1.0, self.send_rate))
+            async with httpx.AsyncClient(timeout=15.0) as client:
+                for offset in range(0, len(due), self.batch_size):
+                    await self._run_batch(due[offset:offset + self.batch_size], client, bucket, report)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            report["runtime_ms"] = round(elapsed_ms, 1)
+            report["per_user_ms"] = round(elapsed_ms / len(due), 2)
+            report["backend_requests_per_user"] = round(report["backend_requests"] / len(due), 2)
+            metrics.observe("digest.run_ms", elapsed_ms)
+            metrics.incr("digest.sent", report["sent"])
+            metrics.incr("digest.failed", report["failed"])
+            logger.info("Digest run finished", extra=report)
+            self.last_report = report
+            return report
+
+    async def _run_batch(self, batch: List[Subscription], client: httpx.AsyncClient,
+                         bucket: TokenBucket, report: Dict[str, Any]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def prepare(subscription: Subscription) -> Optional[str]:
+            async with semaphore:
+                user = await get_user_service().get_user_by_id(subscription.user_id)
+                if not user or not user.auth_token:
+                    report["skipped_no_session"] += 1
+                    return None
+                try:
+                    return await self.render(user, client, report)
+                except Exception as e:
+                    logger.error("Failed to build digest for user %s: %s", subscription.user_id, e)
+                    report["failed"] += 1
+                    return None
+
+        # Claim first so that with several workers each digest is sent once
+        days = {s.user_id: local_now(s.timezone).date().isoformat() for s in batch}
+        claimed = await asyncio.to_thread(self.subscriptions.claim, batch, days)
+        bodies = await asyncio.gather(*(prepare(subscription) for subscription in claimed))
+
+        for subscription, body in zip(claimed, bodies):
+            if body is not None:
+                await bucket.acquire()
+                if await whatsapp_sender.enqueue(subscription.phone_number, body):
+                    report["sent"] += 1
+                    continue
+                report["failed"] += 1
+            await asyncio.to_thread(self.subscriptions.release, subscription, days[subscription.user_id])
+
+    async def render(self, user: User, client: httpx.AsyncClient, report: Dict[str, Any]) -> str:
+        """Fetch the user's local day of logs and render the digest text"""
+        tz = get_timezone(user.timezone)
+        today = local_now(user.timezone).date()
+        day_start = datetime.combine(today, datetime.min.time(), tzinfo=tz)
+        day_end = day_start + timedelta(days=1)
+
+        # The backend filters by UTC date, and a local day spans up to two of them.
+        # Fetch by account (not per child) and split by child locally.
+        utc_days = sorted({day_start.astimezone(timezone.utc).date(),
+                           (day_end - timedelta(seconds=1)).astimezone(timezone.utc).date()})
+        headers = {"Authorization": f"Bearer {user.auth_token}"}
+
+        async def fetch(path: str, day: date) -> list:
+            report["backend_requests"] += 1
+            response = await client.get(f"{self.backend_url}{path}", headers=headers, params={"date": day.isoformat()})
+            response.raise_for_status()
+            return response.json()
+
+        requests = [(path, day) for path in ("/feeding", "/sleep", "/diapers") for day in utc_days]
+        results = await asyncio.gather(*(fetch(path, day) for path, day in requests))
+        logs: Dict[str, list] = {"/feeding": [], "/sleep": [], "/diapers": []}
+        for (path, _), rows in zip(requests, results):
+            logs[path].extend(rows)
+
+        def in_day(row: dict, field: str) -> bool:
+            value = row.get(field)
+            if not value:
+                return False
+            at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return day_start <= at < day_end
+
+        sections = []
+        for child in user.children:
+            feedings = [r for r in logs["/feeding"] if r.get("childId") == child.id and in_day(r, "startTime")]
+            sleeps = [r for r in logs["/sleep"] if r.get("childId") == child.id and in_day(r, "startTime")]
+            diapers = [r for r in logs["/diapers"] if r.get("childId") == child.id and in_day(r, "timestamp")]
+            sections.append(summarize(child.name, feedings, sleeps, diapers, tz))
+
+        return DIGEST_TEMPLATE.format(day=today.strftime("%a %b %d"), children="\n\n".join(sections))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"running": self._task is not None, "last_run": self.last_report}
+
+def summarize(name: str, feedings: list, sleeps: list, diapers: list, tz) -> str:
+    """Render one child's day from its logs"""
+    if not (feedings or sleeps or diapers):
+        return NO_ACTIVITY.format(name=name)
+
+    last_feeding = ""
+    if feedings:
+        latest = max(datetime.fromisoformat(r["startTime"].replace("Z", "+00:00")) for r in feedings)
+        last_feeding = f", last at {latest.astimezone(tz).strftime('%H:%M')}"
+
+    sleep_minutes = sum(r.get("duration") or 0 for r in sleeps)
+    return CHILD_TEMPLATE.format(
+        name=name,
+        feedings=len(feedings),
+        feeding_ml=sum(r.get("amount") or 0 for r in feedings),
+        last_feeding=last_feeding,
+        sleep=f"{int(sleep_minutes // 60)}h {int(sleep_minutes % 60)}m",
+        sleeps=len(sleeps),
+        diapers=len(diapers),
+        wet=sum(1 for r in diapers if r.get("type") in ("WET", "MIXED")),
+        dirty=sum(1 for r in diapers if r.get("type") in ("DIRTY", "MIXED")),
+    )
+
+# Global digest job instance
+digest_job = DigestJob()
@@ -0,0 +1,267 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+from metrics import metrics
+from processes import process_alive
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class JournalEntry:
+    id: int
+    message_id: Optional[str]
+    from_number: str
+    sender_name: str
+    body: str
+    attempts: int = 0
+    received_at: float = 0.0
+
+class InboundJournal:
+    """Write-ahead journal of inbound WhatsApp messages (SQLite, WAL mode).
+
+    A message is appended before it is processed and marked done once its
+    backend write and reply are through, so a restart mid-processing loses
+    nothing: unfinished entries are claimed and replayed on the next start.
+    Appends and done-marks from concurrent requests are group-committed: one
+    writer task applies everything that queued up while the previous commit
+    was syncing (plus JOURNAL_COMMIT_WINDOW_MS, if set) in a single
+    transaction, so there is one fsync per batch instead of one per message.
+    The writer also purges entries finished more than JOURNAL_RETENTION_SECONDS
+    ago, every JOURNAL_PURGE_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.path = os.getenv("INBOUND_JOURNAL_PATH", "inbound_journal.db")
+        self.commit_window = float(os.getenv("JOURNAL_COMMIT_WINDOW_MS", 0)) / 1000
+        self.max_batch = int(os.getenv("JOURNAL_MAX_BATCH", 256))
+        self.max_attempts = int(os.getenv("JOURNAL_MAX_ATTEMPTS", 3))
+        self.retention = float(os.getenv("JOURNAL_RETENTION_SECONDS", 3600))
+        self.synchronous = os.getenv("JOURNAL_SYNCHRONOUS", "FULL").upper()
+        self.purge_interval = float(os.getenv("JOURNAL_PURGE_INTERVAL", 300))
+        # Message ids this process is handling right now; redeliveries of them are duplicates
+        self._inflight: Set[str] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._ops: Optional["asyncio.Queue[Tuple[str, tuple, asyncio.Future]]"] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None
+
+    async def start(self) -> None:
+        """Open the journal and start the group-commit writer"""
+        if self._writer is not None:
+            return
+        await asyncio.to_thread(self._open)
+        self._ops = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self) -> None:
+        """Flush queued writes and close; unfinished entries stay for the next start"""
+        if self._writer is None:
+            return
+        self._ops.put_nowait(("stop", (), None))
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+        await asyncio.to_thread(self._close)
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS inbound (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT UNIQUE,
+                from_number TEXT NOT NULL,
+                sender_name TEXT NOT NULL DEFAULT '',
+                body TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                received_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                finished_at REAL,
+                claimed_by INTEGER
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS inbound_status ON inbound (status, claimed_by)")
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def append(self, message_id: Optional[str], from_number: str, sender_name: str,
+                     body: str) -> Optional[JournalEntry]:
+        """Durably record an inbound message; returns once it is committed.
+
+        Returns None if this message id was already handled or is being
+        handled by a live worker. An unfinished entry left by a dead worker,
+        or by an earlier failed attempt here, is taken over and returned.
+        """
+        received_at = time.time()
+        row = await self._submit("append", (message_id, from_number, sender_name or "", body, received_at))
+        if row is None:
+            return None
+        entry_id, _, attempts = row
+        return JournalEntry(entry_id, message_id, from_number, sender_name or "", body, attempts, received_at)
+
+    async def mark_done(self, entry: JournalEntry) -> None:
+        """The message was handled (backend written, reply queued); it won't be replayed"""
+        try:
+            await self._submit("done", (entry.id,))
+        finally:
+            self._inflight.discard(entry.message_id)
+
+    async def mark_failed(self, entry: JournalEntry) -> None:
+        """Count a failed attempt; entries out of attempts are not replayed again"""
+        entry.attempts += 1
+        try:
+            await self._submit("failed", (entry.id, entry.attempts))
+        finally:
+            # A redelivery may now retry it
+            self._inflight.discard(entry.message_id)
+
+    async def _submit(self, op: str, args: tuple):
+        future = asyncio.get_running_loop().create_future()
+        self._ops.put_nowait((op, args, future))
+        return await future
+
+    async def _write_loop(self) -> None:
+        stopping = False
+        next_purge = time.monotonic() + self.purge_interval
+        while not stopping:
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + self.purge_interval
+                try:
+                    purged = await asyncio.to_thread(self._purge)
+                    metrics.incr("journal.purged", purged)
+                except Exception as e:
+                    logger.error("Inbound journal purge failed: %s", e)
+            try:
+                batch = [await asyncio.wait_for(self._ops.get(), timeout=max(0.0, next_purge - time.monotonic()))]
+            except asyncio.TimeoutError:
+                continue
+            if self.commit_window > 0:
+                # Optionally hold the commit open briefly so more requests can join it
+                await asyncio.sleep(self.commit_window)
+            # Everything queued while the previous commit was syncing joins this one
+            while len(batch) < self.max_batch and not self._ops.empty():
+                batch.append(self._ops.get_nowait())
+
+            stopping = any(op == "stop" for op, _, _ in batch)
+            writes = [item for item in batch if item[0] != "stop"]
+            if not writes:
+                continue
+            try:
+                results = await asyncio.to_thread(self._commit, [(op, args) for op, args, _ in writes])
+                metrics.incr("journal.commits")
+                metrics.observe("journal.batch_size", len(writes))
+                for (_, _, future), result in zip(writes, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                logger.error("Inbound journal commit failed: %s", e)
+                for _, _, future in writes:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, ops: List[Tuple[str, tuple]]) -> list:
+        """Apply a batch of journal operations in one transaction"""
+        results = []
+        pid = os.getpid()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, args in ops:
+                if op == "append":
+                    message_id, from_number, sender_name, body, received_at = args
+                    row = self._conn.execute(
+                        """INSERT INTO inbound (message_id, from_number, sender_name, body, received_at, claimed_by)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (message_id) DO NOTHING
+                           RETURNING id, status, attempts""",
+                        (message_id, from_number, sender_name, body, received_at, pid)
+                    ).fetchone()
+                    if row is None:
+                        row = self._take_over(message_id, pid)
+                    elif message_id is not None:
+                        self._inflight.add(message_id)
+                    results.append(row)
+                elif op == "done":
+                    self._conn.execute(
+                        "UPDATE inbound SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), args[0])
+                    )
+                    results.append(None)
+                elif op == "failed":
+                    entry_id, attempts = args
+                    status = "failed" if attempts >= self.max_attempts else "pending"
+                    self._conn.execute(
+                        "UPDATE inbound SET attempts = ?, status = ?, finished_at = ? WHERE id = ?",
+                        (attempts, status, time.time() if status == "failed" else None, entry_id)
+                    )
+                    results.append(None)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def _take_over(self, message_id: str, pid: int) -> Optional[tuple]:
+        """A redelivered message's entry if it may be handled again here, else None (duplicate)"""
+        entry_id, status, attempts, owner = self._conn.execute(
+            "SELECT id, status, attempts, claimed_by FROM inbound WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        if status != "pending":
+            return None
+        if owner == pid:
+            if message_id in self._inflight:
+                return None
+        elif process_alive(owner):
+            return None
+        self._conn.execute("UPDATE inbound SET claimed_by = ? WHERE id = ?", (pid, entry_id))
+        self._inflight.add(message_id)
+        return entry_id, status, attempts
+
+    def _purge(self) -> int:
+        """Delete entries finished longer than JOURNAL_RETENTION_SECONDS ago"""
+        cursor = self._conn.execute(
+            "DELETE FROM inbound WHERE status != 'pending' AND finished_at < ?", (time.time() - self.retention,)
+        )
+        return cursor.rowcount
+
+    async def claim_pending(self) -> List[JournalEntry]:
+        """Take over unfinished entries of this or any dead worker, oldest first"""
+        return await asyncio.to_thread(self._claim_pending)
+
+    def _claim_pending(self) -> List[JournalEntry]:
+        pid = os.getpid()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._purge()
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT claimed_by FROM inbound WHERE status = 'pending'"
+            )]
+            for owner in owners:
+                if owner != pid and not process_alive(owner):
+                    self._conn.execute(
+                        "UPDATE inbound SET claimed_by = ? WHERE status = 'pending' AND claimed_by IS ?", (pid, owner)
+                    )
+            rows = self._conn.execute(
+                """SELECT id, message_id, from_number, sender_name, body, attempts, received_at
+                   FROM inbound WHERE status = 'pending' AND claimed_by = ? ORDER BY id""",
+                (pid,)
+            ).fetchall()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._inflight.update(row[1] for row in rows if row[1] is not None)
+        return [JournalEntry(*row) for row in rows]
+
+# Global journal instance
+inbound_journal = InboundJournal()
@@ -0,0 +1,312 @@
+"""Local intent classifier learned from the LLM's past classifications.
+
+Every LLM classification is logged (redacted) to INTENT_LABEL_LOG_PATH. A
+multinomial naive Bayes model over hashed word n-grams is trained offline from
+that log and loaded at startup; messages it classifies with confidence of at
+least INTENT_MODEL_THRESHOLD skip the LLM call.
+
+    python intent_model.py train [--labels intent_labels.db] [--out intent_model.npz] [--holdout 0.2]
+    python intent_model.py evaluate [--labels intent_labels.db] [--model intent_model.npz] [--all]
+
+`train` fits on the oldest labels and reports on the newest --holdout share;
+it refuses to save a model unless every intent has --min-per-class training
+labels. `evaluate` reports accuracy and projected LLM calls saved per
+confidence threshold against the labels the model was not trained on (the
+ones after its training set), or all recorded labels with --all.
+"""
+import os
+import re
+import time
+import zlib
+import random
+import sqlite3
+import asyncio
+import logging
+import argparse
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("feeding", "sleep", "diaper", "health", "query", "other")
+
+_EMAIL = re.compile(r"\S+@\S+\.\w+")
+_URL = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_PHONE = re.compile(r"\+?\d[\d\s().-]{6,}\d")
+_DIGITS = re.compile(r"\d+")
+_TOKEN = re.compile(r"<\w+>|[a-z0]+|[?!]")
+
+def redact(text: str, children_names: Sequence[str] = ()) -> str:
+    """The message with child names, contacts and digits masked, as logged and as the model sees it"""
+    text = _EMAIL.sub("<email>", text)
+    text = _URL.sub("<url>", text)
+    text = _PHONE.sub("<phone>", text)
+    for name in children_names:
+        if name:
+            text = re.sub(rf"\b{re.escape(name)}\b", "<child>", text, flags=re.IGNORECASE)
+    # Amounts and times matter only as "a number"; keeps values out of the log too
+    return _DIGITS.sub("0", text.lower())
+
+def features(redacted: str, n_features: int) -> np.ndarray:
+    """Hashed word unigrams and bigrams (crc32, so stable across processes)"""
+    tokens = ["^"] + _TOKEN.findall(redacted) + ["$"]
+    grams = tokens[1:-1] + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.fromiter((zlib.crc32(g.encode()) % n_features for g in grams), dtype=np.int64, count=len(grams))
+
+class IntentModel:
+    """Multinomial naive Bayes over hashed n-gram counts"""
+
+    def __init__(self, classes: Sequence[str], log_prior: np.ndarray, log_likelihood: np.ndarray,
+                 samples: int = 0, trained_at: float = 0.0):
+        self.classes = list(classes)
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+        self.samples = samples
+        self.trained_at = trained_at
+
+    @property
+    def n_features(self) -> int:
+        return self.log_likelihood.shape[1]
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str],
+              n_features: int = 2 ** 16, alpha: float = 0.1) -> "IntentModel":
+        """Fit on redacted texts and their intents"""
+        classes = [intent for intent in INTENTS if intent in set(labels)]
+        index = {intent: i for i, intent in enumerate(classes)}
+        counts = np.zeros((len(classes), n_features), dtype=np.float64)
+        class_counts = np.zeros(len(classes), dtype=np.float64)
+        for text, label in zip(texts, labels):
+            row = index[label]
+            np.add.at(counts[row], features(text, n_features), 1)
+            class_counts[row] += 1
+        log_prior = np.log(class_counts / class_counts.sum())
+        smoothed = counts + alpha
+        log_likelihood = np.log(smoothed / smoothed.sum(axis=1, keepdims=True)).astype(np.float32)
+        return cls(classes, log_prior.astype(np.float32), log_likelihood, samples=len(texts), trained_at=time.time())
+
+    def predict(self, redacted: str) -> Tuple[str, float]:
+        """Most likely intent and its posterior probability"""
+        scores = self.log_prior + self.log_likelihood[:, features(redacted, self.n_features)].sum(axis=1)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, classes=np.array(self.classes), log_prior=self.log_prior,
+                 log_likelihood=self.log_likelihood, samples=self.samples, trained_at=self.trained_at)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls([str(c) for c in data["classes"]], data["log_prior"], data["log_likelihood"],
+                       samples=int(data["samples"]), trained_at=float(data["trained_at"]))
+
+class LabelLog:
+    """SQLite log of (redacted message, LLM intent) pairs, the model's training data"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS labels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                text TEXT NOT NULL,
+                intent TEXT NOT NULL
+            )"""
+        )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def append(self, rows: Iterable[Tuple[float, str, str]]) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT INTO labels (created_at, text, intent) VALUES (?, ?, ?)", rows)
+
+    def read(self) -> List[Tuple[str, str]]:
+        """All (text, intent) pairs, oldest first"""
+        return self._conn.execute("SELECT text, intent FROM labels ORDER BY id").fetchall()
+
+class IntentClassifier:
+    """Answers intent classification locally when the trained model is confident.
+
+    Without a model at INTENT_MODEL_PATH every message goes to the LLM, whose
+    answers are still logged for training. A share of confident local answers
+    (INTENT_MODEL_AUDIT_RATE) also goes to the LLM, to keep labels coming and
+    to measure how often the model agrees with it.
+    """
+
+    def __init__(self):
+        self.model_path = os.getenv("INTENT_MODEL_PATH", "intent_model.npz")
+        self.threshold = float(os.getenv("INTENT_MODEL_THRESHOLD", 0.9))
+        self.audit_rate = float(os.getenv("INTENT_MODEL_AUDIT_RATE", 0.02))
+        self.log_labels = os.getenv("INTENT_LABEL_LOG", "true").lower() == "true"
+        self.flush_interval = float(os.getenv("INTENT_LABEL_FLUSH_SECONDS", 5))
+        self.labels = LabelLog(os.getenv("INTENT_LABEL_LOG_PATH", "intent_labels.db"))
+        self.model: Optional[IntentModel] = None
+        self._pending: List[Tuple[float, str, str]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the model if one was trained and start logging labels"""
+        if os.path.exists(self.model_path):
+            try:
+                self.model = await asyncio.to_thread(IntentModel.load, self.model_path)
+                logger.info("Loaded intent model from %s (%s samples, threshold %.2f)",
+                            self.model_path, self.model.samples, self.threshold)
+            except Exception as e:
+                logger.error("Failed to load intent model %s: %s", self.model_path, e)
+        if self.log_labels and self._flusher is None:
+            await asyncio.to_thread(self.labels.open)
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self._flush()
+        await asyncio.to_thread(self.labels.close)
+
+    def classify(self, message: str, children_names: Sequence[str]) -> Tuple[Optional[str], bool]:
+        """The model's confident intent (None without one) and whether to use it instead of the LLM.
+
+        An audited answer is returned as not to be used, so the LLM's intent
+        can be compared with it in record().
+        """
+        if self.model is None:
+            return None, False
+        try:
+            intent, confidence = self.model.predict(redact(message, children_names))
+        except Exception as e:
+            logger.error("Intent model failed, falling back to the LLM: %s", e)
+            metrics.incr("intent_model.errors")
+            return None, False
+        metrics.observe("intent_model.confidence", confidence)
+        if confidence < self.threshold:
+            metrics.incr("intent_model.unsure")
+            return None, False
+        if random.random() < self.audit_rate:
+            metrics.incr("intent_model.audited")
+            return intent, False
+        metrics.incr("intent_model.answered")
+        return intent, True
+
+    def record(self, message: str, children_names: Sequence[str], intent: str,
+               predicted: Optional[str] = None) -> None:
+        """Log the LLM's intent for a message, and whether an audited model answer (`predicted`) agreed"""
+        if predicted is not None:
+            metrics.incr("intent_model.agreed" if predicted == intent else "intent_model.disagreed")
+        if self._flusher is not None and intent in INTENTS:
+            self._pending.append((time.time(), redact(message, children_names), intent))
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self.labels.append, rows)
+            metrics.incr("intent_model.labels_logged", len(rows))
+        except Exception as e:
+            logger.error("Failed to log %s intent labels: %s", len(rows), e)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    def get_stats(self) -> dict:
+        counters = metrics.counters
+        agreed, disagreed = counters.get("intent_model.agreed", 0), counters.get("intent_model.disagreed", 0)
+        return {
+            "loaded": self.model is not None,
+            "samples": self.model.samples if self.model else 0,
+            "threshold": self.threshold,
+            "answered": counters.get("intent_model.answered", 0),
+            "agreement": round(agreed / (agreed + disagreed), 3) if agreed + disagreed else None,
+        }
+
+# Global intent classifier (answers locally only once a model is trained)
+intent_classifier = IntentClassifier()
+
+def evaluate(model: IntentModel, rows: Sequence[Tuple[str, str]],
+             thresholds: Sequence[float] = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99), note: str = "") -> None:
+    """Print accuracy, and per threshold the share answered locally and its accuracy"""
+    predictions = [model.predict(text) for text, _ in rows]
+    correct = [predicted == label for (predicted, _), (_, label) in zip(predictions, rows)]
+    print(f"{len(rows)} labels{note}, accuracy {sum(correct) / len(rows):.1%}")
+    print(f"{'threshold':>10}{'answered':>10}{'accuracy':>10}{'errors':>8}{'LLM calls saved':>17}")
+    for threshold in thresholds:
+        answered = [ok for (_, confidence), ok in zip(predictions, correct) if confidence >= threshold]
+        accuracy = f"{sum(answered) / len(answered):.1%}" if answered else "-"
+        print(f"{threshold:>10.2f}{len(answered) / len(rows):>10.1%}{accuracy:>10}"
+              f"{len(answered) - sum(answered):>8}{len(answered):>17}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="fit a model on the label log")
+    train.add_argument("--holdout", type=float, default=0.2, help="newest share of labels kept out for evaluation")
+    train.add_argument("--min-per-class", type=int, default=20, help="training labels required for every intent")
+    train.add_argument("--features", type=int, default=2 ** 16)
+    train.add_argument("--alpha", type=float, default=0.1)
+    train.add_argument("--out", default=os.getenv("INTENT_MODEL_PATH", "intent_model.npz"))
+    check = commands.add_parser("evaluate", help="score a trained model against the label log")
+    check.add_argument("--model", default=os.getenv("INTENT_MODEL_PATH", "intent_model.npz"))
+    check.add_argument("--all", action="store_true", help="also score the labels the model was trained on")
+    for command in (train, check):
+        command.add_argument("--labels", default=os.getenv("INTENT_LABEL_LOG_PATH", "intent_labels.db"))
+    args = parser.parse_args()
+    if args.command == "train" and not 0 <= args.holdout < 1:
+        parser.error("--holdout must be at least 0 and less than 1")
+
+    log = LabelLog(args.labels)
+    log.open()
+    rows = log.read()
+    log.close()
+    if not rows:
+        parser.exit(1, f"No labels in {args.labels}\n")
+
+    if args.command == "train":
+        split = len(rows) - int(len(rows) * args.holdout)
+        counts = {intent: 0 for intent in INTENTS}
+        for _, intent in rows[:split]:
+            counts[intent] = counts.get(intent, 0) + 1
+        short = {intent: counts[intent] for intent in INTENTS if counts[intent] < args.min_per_class}
+        if short:
+            parser.exit(1, f"Not enough training labels (need {args.min_per_class} per intent): "
+                           f"{', '.join(f'{intent} {n}' for intent, n in short.items())}; model not saved\n")
+        model = IntentModel.train([text for text, _ in rows[:split]], [intent for _, intent in rows[:split]],
+                                  n_features=args.features, alpha=args.alpha)
+        model.save(args.out)
+        print(f"Trained on {split} labels, saved to {args.out}")
+        if split < len(rows):
+            print("Held-out newest labels:")
+            evaluate(model, rows[split:])
+    else:
+        model = IntentModel.load(args.model)
+        if args.all:
+            evaluate(model, rows, note=f" (including the {model.samples} it was trained on)")
+        elif model.samples < len(rows):
+            # Training used the oldest labels, so the ones after them are unseen
+            evaluate(model, rows[model.samples:], note=" not seen in training")
+        else:
+            parser.exit(1, f"No labels newer than the model's {model.samples} training labels; use --all\n")
+
+if __name__ == "__main__":
+    main()
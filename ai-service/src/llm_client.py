@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional, Dict
+
+import httpx
+
+from metrics import metrics
+from token_counter import record_usage
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class LLMResult:
+    """A chat completion plus the timing and usage data we account for"""
+    content: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None  # input tokens served from the provider's prompt cache
+    total_ms: float = 0.0
+    model_ms: float = 0.0  # time spent waiting on the provider
+
+    @property
+    def overhead_ms(self) -> float:
+        """Client-side cost of the call: prompt building, serialisation, parsing"""
+        return max(0.0, self.total_ms - self.model_ms)
+
+def _cached_tokens(usage: dict) -> Optional[int]:
+    """Prompt-cache hits from an OpenAI-style usage block, None if the provider does not report them"""
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens")
+
+class LLMClient(ABC):
+    """Minimal chat interface used by MessageProcessor: one system and one user message in, text out"""
+
+    name = "base"
+
+    async def complete(self, system: str, user: str, stage: str = "llm") -> LLMResult:
+        """Run a completion and record total, model and overhead time for the stage"""
+        start = time.perf_counter()
+        result = await self._complete(system, user, stage)
+        result.total_ms = (time.perf_counter() - start) * 1000
+
+        metrics.incr(f"llm.{stage}.calls")
+        metrics.observe(f"llm.{stage}.model_ms", result.model_ms)
+        metrics.observe(f"llm.{stage}.overhead_ms", result.overhead_ms)
+        if result.cached_tokens is not None:
+            # Split provider latency by prompt cache hit to see what the cache buys
+            cache_state = "hit" if result.cached_tokens > 0 else "miss"
+            metrics.observe(f"llm.{stage}.model_ms.cache_{cache_state}", result.model_ms)
+        record_usage(stage, system, user, result.content, result.input_tokens, result.output_tokens,
+                     result.cached_tokens)
+        return result
+
+    @abstractmethod
+    async def _complete(self, system: str, user: str, stage: str) -> LLMResult:
+        ...
+
+    async def aclose(self) -> None:
+        """Release any pooled connections"""
+
+class OpenAIChatClient(LLMClient):
+    """Thin client for OpenAI-compatible /chat/completions endpoints over a pooled connection"""
+
+    name = "openai"
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+        self.model = os.getenv("LLM_MODEL", "gpt-4")
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                transport=self._transport
+            )
+        return self._client
+
+    async def _complete(self, system: str, user: str, stage: str) -> LLMResult:
+        payload = {
+            "model": self.model,
+            "temperature": 0,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
+            ]
+        }
+
+        client = self._get_client()
+        sent = time.perf_counter()
+        response = await client.post("/chat/completions", json=payload)
+        model_ms = (time.perf_counter() - sent) * 1000
+        response.raise_for_status()
+
+        data = response.json()
+        usage = data.get("usage") or {}
+        return LLMResult(
+            content=data["choices"][0]["message"]["content"] or "",
+            input_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens"),
+            cached_tokens=_cached_tokens(usage),
+            model_ms=model_ms
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Per-call slot the timing proxy writes provider latency into
+_provider_timing: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("provider_timing", default=None)
+
+class _TimedCompletions:
+    """Wraps the OpenAI SDK completions resource to time the provider round-trip"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def create(self, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.inner.create(**kwargs)
+        finally:
+            timing = _provider_timing.get()
+            if timing is not None:
+                timing["model_ms"] = (time.perf_counter() - start) * 1000
+
+class LangChainClient(LLMClient):
+    """The original LangChain ChatOpenAI path, kept for parity and comparison"""
+
+    name = "langchain"
+
+    def __init__(self, llm=None):
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(
+                temperature=0,
+                model=os.getenv("LLM_MODEL", "gpt-4"),
+                openai_api_key=os.getenv("OPENAI_API_KEY")
+            )
+        llm.async_client = _TimedCompletions(llm.async_client)
+        self.llm = llm
+
+    async def _complete(self, system: str, user: str, stage: str) -> LLMResult:
+        from langchain.schema import SystemMessage, HumanMessage
+
+        timing: Dict[str, float] = {}
+        token = _provider_timing.set(timing)
+        try:
+            result = await self.llm.agenerate([[SystemMessage(content=system), HumanMessage(content=user)]])
+        finally:
+            _provider_timing.reset(token)
+
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        return LLMResult(
+            content=result.generations[0][0].text,
+            input_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens"),
+            cached_tokens=_cached_tokens(usage),
+            model_ms=timing.get("model_ms", 0.0)
+        )
+
+class StubLLMClient(LLMClient):
+    """Deterministic offline backend for tests and benchmarks.
+
+    Answers from keyword rules, picks the first child named in the prompt, and
+    can simulate provider latency with LLM_STUB_LATENCY_MS.
+    """
+
+    name = "stub"
+
+    _INTENT_KEYWORDS = [
+        ("query", ("when", "how much", "how many", "last time", "?", "summary", "status")),
+        ("feeding", ("fed", "feed", "bottle", "breast", "formula", "milk", "ate", "ml")),
+        ("sleep", ("sleep", "nap", "woke", "wake", "asleep", "bed")),
+        ("diaper", ("diaper", "poop", "pee", "wet", "dirty")),
+        ("health", ("temperature", "fever", "medicine", "weight", "height", "kg")),
+    ]
+    _CHILD_NAMES = re.compile(r"(?:Child names available|children named):\s*(.+)")
+    _AMOUNT = re.compile(r"(\d+(?:\.\d+)?)\s*ml", re.IGNORECASE)
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv("LLM_STUB_LATENCY_MS", 0))
+        self.latency_ms = latency_ms
+
+    def _classify(self, text: str) -> str:
+        lowered = text.lower()
+        for intent, keywords in self._INTENT_KEYWORDS:
+            if any(keyword in lowered for keyword in keywords):
+                return intent
+        return "other"
+
+    def _respond(self, system: str, user: str, stage: str) -> str:
+        match = self._CHILD_NAMES.search(system)
+        names = [name.strip() for name in match.group(1).split(",")] if match else ["Baby"]
+        lowered = user.lower()
+        child = next((name for name in names if name.lower() in lowered), names[0])
+
+        if stage == "classify":
+            return self._classify(user)
+        if stage == "feeding":
+            amount = self._AMOUNT.search(user)
+            return json.dumps({
+                "action": "create_feeding_log", "child_name": child,
+                "amount": float(amount.group(1)) if amount else None,
+                "type": "BREAST" if "breast" in lowered else "BOTTLE", "time": None, "notes": None
+            })
+        if stage == "sleep":
+            action = "end_sleep" if ("woke" in lowered or "wake" in lowered) else "start_sleep"
+            return json.dumps({"action": action, "child_name": child, "type": "NAP"})
+        if stage == "diaper":
+            kind = "DIRTY" if ("poop" in lowered or "dirty" in lowered) else "WET"
+            return json.dumps({"action": "create_diaper_log", "child_name": child, "type": kind})
+        if stage == "health":
+            return json.dumps({"action": "create_health_log", "child_name": child, "type": "SYMPTOM", "value": user})
+        if stage == "query":
+            return json.dumps({"action": "query", "query_type": "last_feeding", "child_name": child, "details": {}})
+        return ""
+
+    async def _complete(self, system: str, user: str, stage: str) -> LLMResult:
+        start = time.perf_counter()
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        model_ms = (time.perf_counter() - start) * 1000
+        content = self._respond(system, user, stage)
+        # Token counts are left to the local estimator
+        return LLMResult(content=content, model_ms=model_ms)
+
+LLM_BACKENDS = {
+    OpenAIChatClient.name: OpenAIChatClient,
+    LangChainClient.name: LangChainClient,
+    StubLLMClient.name: StubLLMClient,
+}
+
+_llm_client: Optional[LLMClient] = None
+
+def create_llm_client(backend: Optional[str] = None) -> LLMClient:
+    """Build a client for LLM_BACKEND: "openai" (default), "langchain" or "stub" """
+    backend = (backend or os.getenv("LLM_BACKEND", "openai")).lower()
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected one of {sorted(LLM_BACKENDS)}")
+    return LLM_BACKENDS[backend]()
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide LLM client, creating it on first use"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = create_llm_client()
+        logger.info("Using %s LLM backend", _llm_client.name)
+    return _llm_client
+
+async def close_llm_client() -> None:
+    """Close the process-wide client if one was created"""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Requests that can wait: test traffic, bulk imports and manual digest runs
+LOW_PRIORITY_PATHS = ("/process", "/import/", "/digest/run")
+
+class LoadShedder:
+    """Event-loop lag and in-flight request tracking, and what to do when overloaded.
+
+    A monitor task sleeps LOAD_LAG_INTERVAL_MS at a time and treats any
+    overshoot as loop lag (smoothed). While the smoothed lag exceeds
+    LOAD_SHED_LAG_MS, or more than LOAD_SHED_MAX_INFLIGHT requests are in
+    flight, the service is overloaded: low-priority requests get a 503 with
+    Retry-After and background jobs defer their passes. WhatsApp webhooks,
+    health checks and metrics are never shed.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LOAD_SHED_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("LOAD_LAG_INTERVAL_MS", 100)) / 1000
+        self.lag_threshold = float(os.getenv("LOAD_SHED_LAG_MS", 200))
+        self.max_inflight = int(os.getenv("LOAD_SHED_MAX_INFLIGHT", 200))
+        self.retry_after = int(os.getenv("LOAD_SHED_RETRY_AFTER", 10))
+        self.lag_ms = 0.0
+        self.inflight = 0
+        self._overloaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _monitor(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, (time.perf_counter() - started - self.interval) * 1000)
+            # Smooth over a few samples so one slow callback does not flip the state
+            self.lag_ms = 0.7 * self.lag_ms + 0.3 * lag
+            metrics.observe("loop.lag_ms", lag)
+            self._update()
+
+    def _update(self) -> None:
+        overloaded = self.lag_ms > self.lag_threshold or self.inflight > self.max_inflight
+        if overloaded != self._overloaded:
+            self._overloaded = overloaded
+            if overloaded:
+                metrics.incr("load_shed.overloaded")
+                logger.warning("Overloaded (loop lag %.0fms, %s requests in flight); shedding low-priority work",
+                               self.lag_ms, self.inflight)
+            else:
+                logger.info("Load back to normal (loop lag %.0fms, %s requests in flight)",
+                            self.lag_ms, self.inflight)
+
+    @property
+    def overloaded(self) -> bool:
+        return self.enabled and self._overloaded
+
+    def defer(self, job: str) -> bool:
+        """Whether a background job should skip this pass (counted per job)"""
+        if self.overloaded:
+            metrics.incr(f"load_shed.deferred.{job}")
+            return True
+        return False
+
+    def get_stats(self) -> dict:
+        return {
+            "overloaded": self.overloaded,
+            "lag_ms": round(self.lag_ms, 1),
+            "inflight": self.inflight,
+            "lag_samples_ms": metrics.summary("loop.lag_ms"),
+        }
+
+class LoadSheddingMiddleware:
+    """ASGI middleware counting in-flight requests and rejecting low-priority ones under load"""
+
+    def __init__(self, app, shedder: Optional[LoadShedder] = None):
+        self.app = app
+        self.shedder = shedder or load_shedder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        shedder = self.shedder
+        if shedder.overloaded and scope["path"].startswith(LOW_PRIORITY_PATHS):
+            prefix = next(p for p in LOW_PRIORITY_PATHS if scope["path"].startswith(p))
+            metrics.incr(f"load_shed.rejected.{prefix.strip('/').replace('/', '_')}")
+            await self._unavailable(send, shedder.retry_after)
+            return
+
+        shedder.inflight += 1
+        if shedder.inflight > shedder.max_inflight:
+            shedder._update()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            shedder.inflight -= 1
+
+    async def _unavailable(self, send, retry_after: int) -> None:
+        body = json.dumps({"detail": "Service is busy, please retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+# Global load shedder
+load_shedder = LoadShedder()
@@ -0,0 +1,309 @@
+import os
+import re
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Union
+
+from models import FeedingCommand, DiaperCommand, SleepCommand
+from metrics import metrics
+from temporal import get_timezone
+
+logger = logging.getLogger(__name__)
+
+ImportCommand = Union[FeedingCommand, DiaperCommand, SleepCommand]
+
+# "9:30 - FEEDING - (90ml) - BURPED", "12.20pm - WAKE UP"
+_ENTRY = re.compile(r"^\s*(\d{1,2})[:.](\d{2})\s*(am|pm)?\s*[-–]\s*(.+)$", re.IGNORECASE)
+_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)\s*ml", re.IGNORECASE)
+# "MONDAY PM - DEC 22, 2025": a section header, whose AM/PM applies to the entries below it
+_HEADER = re.compile(r"^\s*(?:MON|TUE|WED|THU|FRI|SAT|SUN)[A-Z]*\b", re.IGNORECASE)
+_MERIDIEM = re.compile(r"\b(AM|PM)\b", re.IGNORECASE)
+_SEGMENT = re.compile(r"\s+[-–]\s+|\s*[-–]\s*(?=\()")
+
+_FEEDING_WORDS = re.compile(r"\b(FEED(ING)?|BOTTLE|EBM|FORMULA|BREAST|NURS(E|ED|ING))\b")
+# Doses and readings look like feedings ("2.5ml PARACETAMOL"); such lines go to the LLM
+_HEALTH_WORDS = re.compile(r"\b(MEDICINE|MEDS?|DOSE|DROPS|SYRUP|VITAMIN\w*|PARACETAMOL|IBUPROFEN|CALPOL|TYLENOL|"
+                           r"TEMP\w*|FEVER|VACCIN\w*|WEIGHT|HEIGHT)\b")
+_WAKE_WORDS = re.compile(r"\bWOKE\b|\bWAKE\b|\bAWAKE\b")
+_SLEEP_WORDS = re.compile(r"\b(SLEEP|ASLEEP|NAP|BED ?TIME|DOWN FOR)\b")
+_WET_WORDS = re.compile(r"\b(URINE|PEE|WET)\b")
+_DIRTY_WORDS = re.compile(r"\b(POOP|POO|DIRTY|STOOL|BM)\b")
+
+@dataclass
+class LogEvent:
+    """One recognised event from a log line"""
+    kind: str  # feeding, diaper, wake, sleep
+    at: datetime
+    line: str
+    amount: Optional[float] = None
+    type: Optional[str] = None
+    notes: List[str] = field(default_factory=list)
+
+@dataclass
+class ParsedLog:
+    """Commands read from a day's log, plus what the parser couldn't read"""
+    feedings: List[FeedingCommand] = field(default_factory=list)
+    diapers: List[DiaperCommand] = field(default_factory=list)
+    sleeps: List[SleepCommand] = field(default_factory=list)
+    unparsed: List[str] = field(default_factory=list)
+    unpaired_wakes: List[str] = field(default_factory=list)
+
+    @property
+    def commands(self) -> List[ImportCommand]:
+        return [*self.feedings, *self.diapers, *self.sleeps]
+
+class _Clock:
+    """Resolve hand-written clock times to datetimes, inferring AM/PM from order"""
+
+    def __init__(self, day: date):
+        self.start = datetime.combine(day, datetime.min.time())
+        self.previous: Optional[int] = None  # minutes since the day's midnight
+        self.hint: Optional[str] = None  # "am"/"pm" from the last section header
+
+    def resolve(self, hour: int, minute: int, meridiem: Optional[str]) -> datetime:
+        if meridiem:
+            candidates = [hour % 12 * 60 + minute + (720 if meridiem.lower() == "pm" else 0)]
+        elif hour > 12 or hour == 0:
+            candidates = [hour * 60 + minute]
+        else:
+            candidates = [hour % 12 * 60 + minute, hour % 12 * 60 + minute + 720]
+
+        if self.previous is None:
+            # Day logs start in the morning; a bare 12 or 1-4 o'clock is afternoon
+            # unless an AM header says otherwise
+            if len(candidates) == 1 or 5 <= hour <= 11 or self.hint == "am":
+                minutes = candidates[0]
+            else:
+                minutes = candidates[1]
+        else:
+            # Entries are chronological: take the earliest reading not before the last one
+            later = [c + day for day in (0, 1440) for c in candidates if c + day >= self.previous]
+            minutes = min(later)
+
+        self.previous = minutes
+        return self.start + timedelta(minutes=minutes)
+
+    def section(self, meridiem: str) -> None:
+        """Note a section header's AM/PM.
+
+        Only a hint: headers are not reliable ("MONDAY PM" logs often start
+        at 8:45 in the morning), so it breaks the tie for an ambiguous first
+        entry and the chronological order decides everything else.
+        """
+        self.hint = meridiem.lower()
+
+def _read_entry(at: datetime, text: str, line: str) -> List[LogEvent]:
+    """Turn the text after the time into events; an empty list means unreadable"""
+    upper = text.upper()
+    segments = [s.strip(" ()") for s in _SEGMENT.split(text) if s.strip(" ()")]
+    events: List[LogEvent] = []
+    used = set()
+
+    if _HEALTH_WORDS.search(upper):
+        return []
+
+    amount = _AMOUNT.search(text)
+    # An amount alone is not a feeding; it needs a feeding word
+    if _FEEDING_WORDS.search(upper):
+        if "FORMULA" in upper:
+            feeding_type = "FORMULA"
+        elif "BREAST" in upper and not amount:
+            feeding_type = "BREAST"
+        elif "SOLID" in upper or "PUREE" in upper:
+            feeding_type = "SOLID"
+        else:
+            # EBM (expressed breast milk) and plain amounts are bottle feeds
+            feeding_type = "BOTTLE"
+        events.append(LogEvent("feeding", at, line, float(amount.group(1)) if amount else None, feeding_type))
+        used.update(i for i, s in enumerate(segments)
+                    if _FEEDING_WORDS.search(s.upper()) or _AMOUNT.fullmatch(s.replace(" ", "")))
+
+    if _WAKE_WORDS.search(upper):
+        events.append(LogEvent("wake", at, line))
+        used.update(i for i, s in enumerate(segments) if _WAKE_WORDS.search(s.upper()))
+    elif _SLEEP_WORDS.search(upper):
+        events.append(LogEvent("sleep", at, line))
+        used.update(i for i, s in enumerate(segments) if _SLEEP_WORDS.search(s.upper()))
+
+    wet, dirty = _WET_WORDS.search(upper), _DIRTY_WORDS.search(upper)
+    if wet or dirty:
+        diaper_type = "MIXED" if wet and dirty else "DIRTY" if dirty else "WET"
+        events.append(LogEvent("diaper", at, line, type=diaper_type))
+        used.update(i for i, s in enumerate(segments)
+                    if _WET_WORDS.search(s.upper()) or _DIRTY_WORDS.search(s.upper()))
+
+    if events:
+        notes = [s for i, s in enumerate(segments) if i not in used]
+        events[0].notes.extend(notes)
+    return events
+
+def parse_daily_log(text: str, day: date, child_name: str) -> ParsedLog:
+    """Parse a transcribed nanny log (one "H:MM - EVENT - details" entry per line)"""
+    parsed = ParsedLog()
+    clock = _Clock(day)
+    events: List[LogEvent] = []
+    last: Optional[LogEvent] = None
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+
+        match = _ENTRY.match(line)
+        if not match:
+            if last is None or _HEADER.match(line):
+                # Header such as "MONDAY PM - DEC 22, 2025"
+                header_meridiem = _MERIDIEM.search(line)
+                if header_meridiem:
+                    clock.section(header_meridiem.group(1))
+                last = None
+                continue
+            # Continuation of the previous entry: extra amounts or free-text notes
+            amount = _AMOUNT.search(line)
+            if last.kind == "feeding" and amount and "ADDITIONAL" in line.upper():
+                last.amount = (last.amount or 0) + float(amount.group(1))
+            last.notes.append(line)
+            continue
+
+        hour, minute, meridiem, rest = match.groups()
+        if int(minute) > 59 or int(hour) > 23:
+            parsed.unparsed.append(line)
+            last = None
+            continue
+
+        at = clock.resolve(int(hour), int(minute), meridiem)
+        line_events = _read_entry(at, rest, line)
+        if not line_events:
+            parsed.unparsed.append(line)
+            last = None
+            continue
+        events.extend(line_events)
+        last = line_events[0]
+
+    sleep_start: Optional[LogEvent] = None
+    for event in events:
+        notes = " - ".join(event.notes) or None
+        if event.kind == "feeding":
+            parsed.feedings.append(FeedingCommand(
+                action="create_feeding_log", child_name=child_name, amount=event.amount,
+                type=event.type, time=event.at.isoformat(), notes=notes
+            ))
+        elif event.kind == "diaper":
+            parsed.diapers.append(DiaperCommand(
+                action="create_diaper_log", child_name=child_name, type=event.type,
+                time=event.at.isoformat(), notes=notes
+            ))
+        elif event.kind == "sleep":
+            if sleep_start is None:
+                sleep_start = event
+        elif event.kind == "wake":
+            if sleep_start is None:
+                # Woke from a sleep that started before this log
+                parsed.unpaired_wakes.append(event.line)
+                continue
+            parsed.sleeps.append(SleepCommand(
+                action="create_sleep_log", child_name=child_name,
+                start_time=sleep_start.at.isoformat(), end_time=event.at.isoformat(),
+                type=_sleep_type(sleep_start.at), notes=" - ".join(sleep_start.notes) or None
+            ))
+            sleep_start = None
+
+    if sleep_start is not None:
+        # Still asleep at the end of the log
+        parsed.sleeps.append(SleepCommand(
+            action="start_sleep", child_name=child_name, start_time=sleep_start.at.isoformat(),
+            type=_sleep_type(sleep_start.at), notes=" - ".join(sleep_start.notes) or None
+        ))
+
+    return parsed
+
+def _sleep_type(start: datetime) -> str:
+    return "NIGHT" if start.hour >= 19 or start.hour < 6 else "NAP"
+
+class LogImporter:
+    """Import a day's transcribed log: parse locally, write to the backend concurrently.
+
+    Only lines the parser can't read go through the LLM pipeline.
+    """
+
+    def __init__(self):
+        self.concurrency = int(os.getenv("IMPORT_WRITE_CONCURRENCY", 8))
+
+    async def import_log(self, user_id: str, text: str, day: date,
+                         child_name: Optional[str] = None, dry_run: bool = False) -> Dict:
+        from message_processor import get_message_processor
+        processor = get_message_processor()
+
+        user_context = await processor.user_service.create_user_context(user_id)
+        if not user_context:
+            return {"success": False, "error": "user_not_found"}
+        if not user_context.children_names:
+            return {"success": False, "error": "no_children"}
+
+        child_name = child_name or user_context.children_names[0]
+        parsed = parse_daily_log(text, day, child_name)
+        metrics.incr("import.lines_parsed", len(parsed.commands))
+        metrics.incr("import.lines_unparsed", len(parsed.unparsed))
+
+        summary = {
+            "success": True,
+            "child_name": child_name,
+            "parsed": {
+                "feedings": len(parsed.feedings),
+                "diapers": len(parsed.diapers),
+                "sleeps": len(parsed.sleeps),
+            },
+            "unparsed": parsed.unparsed,
+            "unpaired_wakes": parsed.unpaired_wakes,
+        }
+        if dry_run:
+            summary["commands"] = [command.dict() for command in parsed.commands]
+            return summary
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def write(command: ImportCommand) -> Dict:
+            async with semaphore:
+                try:
+                    if isinstance(command, FeedingCommand):
+                        return await processor._execute_feeding(command, user_context)
+                    if isinstance(command, DiaperCommand):
+                        return await processor._execute_diaper(command, user_context)
+                    return await processor._execute_sleep(command, user_context)
+                except Exception as e:
+                    logger.error("Failed to import %s: %s", command.action, e)
+                    return {"success": False, "error": str(e)}
+
+        # Times in fallback lines are on the imported day: resolve them as of its end (or now, for today)
+        day_end = datetime.combine(day + timedelta(days=1), datetime.min.time(),
+                                   tzinfo=get_timezone(user_context.user.timezone)) - timedelta(minutes=1)
+        reference_time = min(day_end, datetime.now(day_end.tzinfo))
+
+        async def fallback(line: str) -> Dict:
+            async with semaphore:
+                metrics.incr("import.llm_fallback")
+                try:
+                    return await processor.process_message(line, user_id, reference_time=reference_time)
+                except Exception as e:
+                    logger.error("LLM fallback failed for import line: %s", e)
+                    return {"success": False, "error": str(e)}
+
+        # Completed logs are independent; an open sleep goes last so it stays the active one
+        batch = [c for c in parsed.commands if c.action != "start_sleep"]
+        open_sleeps = [c for c in parsed.commands if c.action == "start_sleep"]
+        results = list(await asyncio.gather(*(write(c) for c in batch)))
+        fallbacks = await asyncio.gather(*(fallback(line) for line in parsed.unparsed))
+        for command in open_sleeps:
+            results.append(await write(command))
+
+        summary["written"] = sum(1 for r in results if r.get("success"))
+        summary["failed"] = [r.get("error") for r in results if not r.get("success")]
+        summary["llm_results"] = [r.get("response") for r in fallbacks]
+        summary["success"] = not summary["failed"]
+        metrics.incr("import.written", summary["written"])
+        return summary
+
+# Global importer instance
+log_importer = LogImporter()
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Attributes every LogRecord carries; anything else on a record came from `extra=`
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LazyJSON:
+    """Defer JSON serialisation of a payload until a handler formats the record.
+
+    Formatting happens on the listener thread, so the event loop only pays for
+    wrapping the reference. Output longer than `max_chars` is truncated.
+    """
+
+    __slots__ = ("payload", "max_chars")
+
+    def __init__(self, payload: Any, max_chars: Optional[int] = None):
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(self.payload, default=str, ensure_ascii=False)
+        except (TypeError, ValueError):
+            text = repr(self.payload)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}...<truncated {len(text) - self.max_chars} chars>"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as single-line JSON objects"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonFormattingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands the record over untouched.
+
+    The stock QueueHandler formats the message in the calling thread so that the
+    record can be pickled; our listener lives in the same process, so message
+    interpolation is left to the background thread instead.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_module_levels(spec: str) -> Dict[str, str]:
+    """Parse "module=LEVEL,other=LEVEL" into a mapping"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener(handler: logging.Handler) -> None:
+    """Install a fresh queue on the root logger and start the thread draining it into `handler`"""
+    global _listener
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(NonFormattingQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # Threads do not survive fork (e.g. gunicorn preload), so each worker needs its own listener
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def setup_logging() -> None:
+    """Route all logging through a queue drained by a background thread.
+
+    Configured from the environment:
+    - LOG_LEVEL: root level (default INFO)
+    - LOG_LEVELS: per-module overrides, e.g. "webhook_handler=DEBUG,httpx=WARNING"
+    - LOG_FORMAT: "json" (default) or "text"
+    """
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter: logging.Formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_module_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _start_listener(stream_handler)
+    atexit.register(shutdown_logging)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# Payload logging: full bodies only at DEBUG, sampled and truncated at INFO
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 1000))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.05))
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any) -> None:
+    """Log a potentially large payload without building the string on the caller's thread"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %s", message, LazyJSON(payload))
+    elif logger.isEnabledFor(logging.INFO) and random.random() < PAYLOAD_SAMPLE_RATE:
+        logger.info("%s %s", message, LazyJSON(payload, PAYLOAD_MAX_CHARS), extra={"sampled": True})
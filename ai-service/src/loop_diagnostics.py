@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Audit events that block the calling thread (checked only on the event loop's thread)
+BLOCKING_EVENTS = {
+    "open", "time.sleep", "socket.connect", "socket.getaddrinfo", "socket.gethostbyname",
+    "sqlite3.connect", "subprocess.Popen", "os.system",
+}
+
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_DIR = os.path.dirname(os.__file__)
+
+def _where(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.relpath(code.co_filename, _SRC_DIR) if code.co_filename.startswith(_SRC_DIR) else code.co_filename}:{frame.f_lineno} {code.co_name}"
+
+def _stack(frame, limit: int) -> List[str]:
+    """Innermost-last "file:line function" entries, without reading source files"""
+    entries = []
+    while frame is not None and len(entries) < limit:
+        entries.append(_where(frame))
+        frame = frame.f_back
+    return entries[::-1]
+
+def _describe(handle: asyncio.Handle) -> str:
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return f"task {owner.get_name()} ({getattr(coro, '__qualname__', coro)})"
+    return repr(callback)[:200]
+
+class LoopDiagnostics:
+    """Event-loop stall finder, enabled with ASYNC_DIAGNOSTICS=true.
+
+    - every loop callback is timed; ones over ASYNC_DIAGNOSTICS_SLOW_MS are
+      reported with the stack a watchdog thread sampled while they ran
+    - an audit hook flags blocking calls (file opens, sleeps, blocking
+      connects, DNS, sqlite, subprocesses) made on the loop thread while a
+      callback is running
+    - the watchdog samples the loop thread every ASYNC_DIAGNOSTICS_SAMPLE_MS
+      while it is busy, building a profile of where loop time goes
+
+    The report is written to ASYNC_DIAGNOSTICS_REPORT every
+    ASYNC_DIAGNOSTICS_REPORT_INTERVAL seconds and served on /debug/async.
+    This adds overhead to every callback; it is meant for load tests and
+    short production investigations, not to be left on.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ASYNC_DIAGNOSTICS", "false").lower() == "true"
+        self.slow_threshold = float(os.getenv("ASYNC_DIAGNOSTICS_SLOW_MS", 100)) / 1000
+        self.sample_interval = float(os.getenv("ASYNC_DIAGNOSTICS_SAMPLE_MS", 10)) / 1000
+        self.report_path = os.getenv("ASYNC_DIAGNOSTICS_REPORT", "async_diagnostics.json")
+        self.report_interval = float(os.getenv("ASYNC_DIAGNOSTICS_REPORT_INTERVAL", 60))
+        self.stack_depth = int(os.getenv("ASYNC_DIAGNOSTICS_STACK_DEPTH", 20))
+        self.slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("ASYNC_DIAGNOSTICS_MAX_EVENTS", 200)))
+        self.blocking_calls: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.self_samples: Counter = Counter()
+        self.inclusive_samples: Counter = Counter()
+        self.busy_samples = 0
+        self.idle_samples = 0
+        self.started_at: Optional[str] = None
+        # Guards the sample counters, written by the sampler thread and read by report()
+        self._lock = threading.Lock()
+        self._current: Optional[Tuple[asyncio.Handle, float]] = None
+        self._stall: Optional[Tuple[asyncio.Handle, List[str]]] = None
+        self._loop_thread: Optional[int] = None
+        self._original_run = None
+        self._hook_installed = False
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if not self.enabled or self._original_run is not None:
+            return
+
+        self._loop_thread = threading.get_ident()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._patch_handles()
+        if not self._hook_installed:
+            # Audit hooks cannot be removed; the hook checks `_original_run` to know if it is active
+            sys.addaudithook(self._audit)
+            self._hook_installed = True
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name="loop-diagnostics", daemon=True)
+        self._sampler.start()
+        self._writer = asyncio.create_task(self._write_periodically())
+        logger.warning("Async diagnostics enabled: slow callbacks > %.0fms, sampling every %.0fms, report at %s",
+                       self.slow_threshold * 1000, self.sample_interval * 1000, self.report_path)
+
+    async def stop(self) -> None:
+        if self._original_run is None:
+            return
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._stop.set()
+        self._sampler.join(timeout=1)
+        asyncio.events.Handle._run = self._original_run
+        self._original_run = None
+        await asyncio.to_thread(self.write_report)
+
+    def _patch_handles(self) -> None:
+        original = asyncio.events.Handle._run
+        self._original_run = original
+        diagnostics = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            diagnostics._current = (handle, started)
+            try:
+                return original(handle)
+            finally:
+                diagnostics._current = None
+                elapsed = time.perf_counter() - started
+                if elapsed >= diagnostics.slow_threshold:
+                    diagnostics._record_slow(handle, elapsed)
+
+        asyncio.events.Handle._run = _run
+
+    def _record_slow(self, handle: asyncio.Handle, elapsed: float) -> None:
+        stall = self._stall
+        self.slow_callbacks.append({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "callback": _describe(handle),
+            "duration_ms": round(elapsed * 1000, 1),
+            "stack": stall[1] if stall is not None and stall[0] is handle else None,
+        })
+        metrics.incr("diagnostics.slow_callbacks")
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            current = self._current
+            if current is None:
+                self.idle_samples += 1
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+
+            functions = set()
+            walker = frame
+            while walker is not None:
+                code = walker.f_code
+                functions.add(f"{code.co_filename}:{code.co_firstlineno} {code.co_name}")
+                walker = walker.f_back
+            with self._lock:
+                self.busy_samples += 1
+                self.self_samples[_where(frame)] += 1
+                self.inclusive_samples.update(functions)
+
+            # Capture the stack of a stall while it is happening
+            handle, started = current
+            stall = self._stall
+            if time.perf_counter() - started >= self.slow_threshold and (stall is None or stall[0] is not handle):
+                self._stall = (handle, _stack(frame, self.stack_depth))
+
+    def _audit(self, event: str, args: tuple) -> None:
+        if event not in BLOCKING_EVENTS or self._original_run is None:
+            return
+        if threading.get_ident() != self._loop_thread or self._current is None:
+            return
+        if event == "time.sleep" and args and args[0] == 0:
+            return
+        if event == "socket.connect" and args and getattr(args[0], "gettimeout", lambda: None)() == 0.0:
+            return  # non-blocking socket, as asyncio uses
+
+        # Attribute the call to the innermost frame of our own code, else to the nearest non-stdlib frame
+        frame = sys._getframe(1)
+        culprit = None
+        walker = frame
+        while walker is not None:
+            filename = walker.f_code.co_filename
+            if filename.startswith(_SRC_DIR) and filename != __file__:
+                culprit = walker
+                break
+            if culprit is None and not filename.startswith(_STDLIB_DIR) and filename != __file__:
+                culprit = walker
+            walker = walker.f_back
+        where = _where(culprit or frame)
+
+        entry = self.blocking_calls.get((event, where))
+        if entry is None:
+            detail = str(args[0])[:200] if args else ""
+            entry = self.blocking_calls[(event, where)] = {
+                "event": event, "where": where, "count": 0, "example": detail,
+                "stack": _stack(frame, self.stack_depth),
+            }
+            metrics.incr("diagnostics.blocking_calls")
+        entry["count"] += 1
+
+    def report(self, top: int = 25) -> Dict[str, Any]:
+        """Everything collected so far"""
+        with self._lock:
+            busy = self.busy_samples or 1
+            self_top = self.self_samples.most_common(top)
+            inclusive_top = self.inclusive_samples.most_common(top)
+        return {
+            "enabled": self.enabled,
+            "started_at": self.started_at,
+            "slow_callback_threshold_ms": self.slow_threshold * 1000,
+            "slow_callbacks": list(self.slow_callbacks),
+            "blocking_calls": sorted(self.blocking_calls.values(), key=lambda e: -e["count"]),
+            "profile": {
+                "sample_interval_ms": self.sample_interval * 1000,
+                "busy_samples": self.busy_samples,
+                "idle_samples": self.idle_samples,
+                "self": [{"function": k, "samples": n, "share": round(n / busy, 3)}
+                         for k, n in self_top],
+                "inclusive": [{"function": k, "samples": n, "share": round(n / busy, 3)}
+                              for k, n in inclusive_top],
+            },
+        }
+
+    def write_report(self) -> None:
+        report = self.report()
+        tmp_path = f"{self.report_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, self.report_path)
+
+    async def _write_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            try:
+                await asyncio.to_thread(self.write_report)
+            except Exception as e:
+                logger.error("Failed to write async diagnostics report: %s", e)
+
+# Global diagnostics instance (inactive unless ASYNC_DIAGNOSTICS=true)
+loop_diagnostics = LoopDiagnostics()
@@ -1,27 +1,85 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import os
+import asyncio
 from dotenv import load_dotenv
-import uvicorn
 import logging
+from contextlib import asynccontextmanager
 
-# Import our modules
-from message_processor import MessageProcessor
-from webhook_handler import WhatsAppWebhook
-from user_service import user_service
-from models import ProcessMessageRequest, RegisterUserRequest, APIResponse
+import orjson
 
-# Load environment variables
+# Load environment variables before our modules read them
 load_dotenv()
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Import our modules (heavy dependencies such as LangChain are loaded on first use)
+from message_processor import get_message_processor
+from llm_client import get_llm_client, close_llm_client
+from webhook_handler import WhatsAppWebhook, payload_kind
+from user_service import get_user_service
+from auth_middleware import get_auth
+from models import ProcessMessageRequest, RegisterUserRequest, ImportDailyLogRequest, DigestSubscribeRequest, APIResponse
+from log_import import log_importer
+from logging_config import setup_logging, shutdown_logging, log_payload
+from whatsapp_sender import whatsapp_sender
+from inbound_journal import inbound_journal
+from cache_bus import cache_bus
+from context_refresher import context_refresher
+from digest import digest_job
+from admission import admission
+from backend_client import backend
+from token_manager import token_manager
+from load_shedder import load_shedder, LoadSheddingMiddleware
+from speculation import speculator
+from intent_model import intent_classifier
+from loop_diagnostics import loop_diagnostics
+from metrics import metrics
+
+# Setup logging (queue-backed, formatted off the event loop)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await loop_diagnostics.start()
+    await load_shedder.start()
+    await cache_bus.start()
+    await whatsapp_sender.start()
+    # Claim unfinished messages before serving, so only the previous run's entries are replayed
+    await inbound_journal.start()
+    replay = asyncio.create_task(whatsapp_webhook.replay(await inbound_journal.claim_pending()))
+    await context_refresher.start()
+    await digest_job.start()
+    await intent_classifier.start()
+    # Build the LLM client in the background so startup is not blocked by
+    # heavy imports (e.g. the LangChain backend), but the first message usually finds it ready
+    warmup = None
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true":
+        warmup = asyncio.create_task(asyncio.to_thread(get_llm_client))
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    if not replay.done():
+        replay.cancel()
+    await asyncio.gather(replay, return_exceptions=True)
+    await close_llm_client()
+    await backend.close()
+    await intent_classifier.stop()
+    await digest_job.stop()
+    await context_refresher.stop()
+    await inbound_journal.stop()
+    await whatsapp_sender.stop()
+    await cache_bus.stop()
+    await load_shedder.stop()
+    await loop_diagnostics.stop()
+    shutdown_logging()
+
 # Initialize FastAPI app
-app = FastAPI(title="Twin Parenting AI Service")
+app = FastAPI(title="Twin Parenting AI Service", lifespan=lifespan)
+
+# Shed low-priority requests when the event loop is congested
+app.add_middleware(LoadSheddingMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,8 +90,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-message_processor = MessageProcessor()
+# Initialize services (the webhook shares the process-wide MessageProcessor)
 whatsapp_webhook = WhatsAppWebhook()
 
 # Health check endpoint
@@ -45,6 +102,28 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Service metrics
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        **metrics.snapshot(),
+        "whatsapp_sender": whatsapp_sender.get_stats(),
+        "digest": digest_job.get_stats(),
+        "admission": admission.get_stats(),
+        "backend_cache": backend.get_stats(),
+        "auth_tokens": token_manager.get_stats(),
+        "load": load_shedder.get_stats(),
+        "speculation": speculator.get_stats(),
+        "intent_model": intent_classifier.get_stats()
+    }
+
+# Event-loop diagnostics report (ASYNC_DIAGNOSTICS=true)
+@app.get("/debug/async")
+async def async_diagnostics():
+    if not loop_diagnostics.enabled:
+        raise HTTPException(status_code=404, detail="Async diagnostics are disabled")
+    return loop_diagnostics.report()
+
 # WhatsApp webhook verification
 @app.get("/webhook")
 async def verify_webhook(request: Request):
@@ -66,15 +145,22 @@ async def verify_webhook(request: Request):
 async def receive_message(request: Request):
     """Handle incoming WhatsApp messages"""
     try:
-        body = await request.json()
-        logger.info(f"Received webhook: {body}")
-        
-        # Process the webhook
+        body = orjson.loads(await request.body())
+
+        # Most deliveries are status callbacks; record them without the message pipeline
+        kind = payload_kind(body)
+        metrics.incr(f"webhook.{kind}")
+        if kind == "statuses":
+            return {"status": "success", "result": whatsapp_webhook.process_statuses(body)}
+        if kind == "other":
+            return {"status": "success", "result": {"status": "no_message"}}
+
+        log_payload(logger, "Received webhook:", body)
         result = await whatsapp_webhook.process_webhook(body)
         return {"status": "success", "result": result}
     
     except Exception as e:
-        logger.error(f"Error processing webhook: {e}")
+        logger.error("Error processing webhook: %s", e)
         return {"status": "error", "message": str(e)}
 
 # Direct message processing endpoint (for testing)
@@ -84,7 +170,7 @@ async def receive_message(request: Request):
 async def process_message(request: ProcessMessageRequest):
     """Process a message directly (for testing)"""
     try:
-        result = await message_processor.process_message(
+        result = await get_message_processor().process_message(
             message=request.message,
             user_id=request.user_id,
             user_phone=request.user_phone,
@@ -93,7 +179,65 @@ async def process_message(request: ProcessMessageRequest):
         return {"status": "success", "result": result}
 
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        logger.error("Error processing message: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/import/daily-log")
+async def import_daily_log(request: ImportDailyLogRequest):
+    """Bulk import a transcribed daily nanny log"""
+    try:
+        result = await log_importer.import_log(
+            user_id=request.user_id,
+            text=request.text,
+            day=request.date,
+            child_name=request.child_name,
+            dry_run=request.dry_run
+        )
+        return {"status": "success", "result": result}
+
+    except Exception as e:
+        logger.error("Error importing daily log: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def require_user(user_id: str, authorization: Optional[str]) -> None:
+    """Reject the request unless it carries a bearer token of `user_id` itself"""
+    token = authorization[7:].strip() if authorization and authorization.lower().startswith("bearer ") else None
+    if not token:
+        raise HTTPException(status_code=401, detail="Bearer token required")
+    # /auth/me answers with the user row itself: {"id", "email", "name", "role", ...}
+    profile = await get_auth().verify_token(token)
+    if not profile:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if str(profile.get("id")) != user_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this user")
+
+@app.post("/digest/subscribe")
+async def subscribe_digest(request: DigestSubscribeRequest, authorization: Optional[str] = Header(None)):
+    """Opt a user in to the evening digest (the user's own token is required)"""
+    await require_user(request.user_id, authorization)
+    try:
+        subscription = await digest_job.subscribe(request.user_id, request.phone_number, request.send_at)
+        return {"status": "success", "subscription": subscription.__dict__}
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/digest/unsubscribe")
+async def unsubscribe_digest(user_id: str, authorization: Optional[str] = Header(None)):
+    """Opt a user out of the evening digest (the user's own token is required)"""
+    await require_user(user_id, authorization)
+    await digest_job.unsubscribe(user_id)
+    return {"status": "success"}
+
+@app.post("/digest/run")
+async def run_digest():
+    """Run the digest now for due subscribers; each gets at most one per day, so repeating this is harmless"""
+    try:
+        report = await digest_job.run_due()
+        return {"status": "success", "report": report}
+    except Exception as e:
+        logger.error("Error running digest: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 # User registration endpoint
@@ -101,7 +245,7 @@ async def process_message(request: ProcessMessageRequest):
 async def register_user(request: RegisterUserRequest):
     """Register a new user"""
     try:
-        user = await user_service.register_new_user(
+        user = await get_user_service().register_new_user(
             email=request.email,
             password=request.password,
             name=request.name,
@@ -126,7 +270,7 @@ async def register_user(request: RegisterUserRequest):
             )
 
     except Exception as e:
-        logger.error(f"Error registering user: {e}")
+        logger.error("Error registering user: %s", e)
         return APIResponse(
             success=False,
             message="Registration failed",
@@ -138,7 +282,7 @@ async def register_user(request: RegisterUserRequest):
 async def authenticate_user(email: str, password: str):
     """Authenticate user and return user context"""
     try:
-        user = await user_service.authenticate_user_by_credentials(email, password)
+        user = await get_user_service().authenticate_user_by_credentials(email, password)
 
         if user:
             return APIResponse(
@@ -159,7 +303,7 @@ async def authenticate_user(email: str, password: str):
             )
 
     except Exception as e:
-        logger.error(f"Error authenticating user: {e}")
+        logger.error("Error authenticating user: %s", e)
         return APIResponse(
             success=False,
             message="Authentication failed",
@@ -173,14 +317,20 @@ async def root():
         "service": "Twin Parenting AI Service",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "webhook_verify": "GET /webhook",
             "webhook_receive": "POST /webhook",
             "process_message": "POST /process",
+            "import_daily_log": "POST /import/daily-log",
+            "digest_subscribe": "POST /digest/subscribe",
+            "digest_unsubscribe": "POST /digest/unsubscribe",
+            "digest_run": "POST /digest/run",
             "register": "POST /register",
             "authenticate": "POST /authenticate"
         }
     }
 
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.getenv("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
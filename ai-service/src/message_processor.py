@@ -1,31 +1,48 @@
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
 from typing import Optional, Literal, Dict, Any
-import json
 import httpx
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 from models import (
     FeedingCommand, SleepCommand, DiaperCommand, HealthCommand, QueryCommand,
     UserContext, Child
 )
-from user_service import user_service
+from user_service import UserService, get_user_service
+from llm_client import LLMClient, get_llm_client
+from backend_client import backend
+from analytics import analytics, ANALYTICS_QUERIES
+from speculation import speculator, Speculation
+from intent_model import intent_classifier
+from prompts import classify_prompt, extraction_prompt, prompt_time
+from command_decoder import decode_command, CommandDecodeError
+from temporal import resolve_times, mentions_time, normalize_time, to_utc_iso
 
 logger = logging.getLogger(__name__)
 
+_message_processor: Optional["MessageProcessor"] = None
+
+def get_message_processor() -> "MessageProcessor":
+    """Return the process-wide MessageProcessor"""
+    global _message_processor
+    if _message_processor is None:
+        _message_processor = MessageProcessor()
+    return _message_processor
+
 class MessageProcessor:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            temperature=0,
-            model="gpt-4",
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
         self.backend_url = os.getenv("BACKEND_API_URL")
-        self.user_service = user_service
 
-    async def process_message(self, message: str, user_id: str, user_phone: Optional[str] = None, user_name: Optional[str] = None) -> Dict:
-        """Process a natural language message with dynamic user context"""
+    @property
+    def llm(self) -> LLMClient:
+        return get_llm_client()
+
+    @property
+    def user_service(self) -> UserService:
+        return get_user_service()
+
+    async def process_message(self, message: str, user_id: str, user_phone: Optional[str] = None, user_name: Optional[str] = None,
+                              reference_time: Optional[datetime] = None) -> Dict:
+        """Process a natural language message with dynamic user context (times relative to `reference_time`, default now)"""
 
         # Get user context
         user_context = await self.user_service.create_user_context(user_id, user_phone)
@@ -34,6 +51,7 @@ class MessageProcessor:
                 "response": "User not found. Please make sure you're authenticated.",
                 "error": "user_not_found"
             }
+        user_context.reference_time = reference_time
 
         if not user_context.children_names:
             return {
@@ -41,30 +59,45 @@ class MessageProcessor:
                 "intent": "no_children"
             }
 
-        # First, classify the intent
-        intent = await self._classify_intent(message, user_context)
-        logger.info(f"Classified intent: {intent} for user: {user_context.user.name}")
-
-        # Parse the message based on intent
+        # Classify the intent, extracting for the likely intents in parallel when speculating
+        speculation = speculator.start(
+            message, user_context.user.id,
+            lambda stage: getattr(self, f"_parse_{stage}")(message, user_context)
+        )
+        try:
+            intent = await self._classify_intent(message, user_context)
+            speculation.classified(intent)
+            logger.info("Classified intent: %s for user: %s", intent, user_context.user.name)
+            return await self._handle(intent, message, user_id, user_context, speculation)
+        finally:
+            speculation.close()
+
+    async def _handle(self, intent: str, message: str, user_id: str, user_context: UserContext,
+                      speculation: Speculation) -> Dict:
+        """Parse the message based on intent and execute the command"""
         try:
             if intent == "feeding":
-                command = await self._parse_feeding(message, user_context)
+                command = await speculation.take(intent, lambda: self._parse_feeding(message, user_context))
+                self._apply_times(command, message, user_context)
                 return await self._execute_feeding(command, user_context)
 
             elif intent == "sleep":
-                command = await self._parse_sleep(message, user_context)
+                command = await speculation.take(intent, lambda: self._parse_sleep(message, user_context))
+                self._apply_times(command, message, user_context)
                 return await self._execute_sleep(command, user_context)
 
             elif intent == "diaper":
-                command = await self._parse_diaper(message, user_context)
+                command = await speculation.take(intent, lambda: self._parse_diaper(message, user_context))
+                self._apply_times(command, message, user_context)
                 return await self._execute_diaper(command, user_context)
 
             elif intent == "health":
-                command = await self._parse_health(message, user_context)
+                command = await speculation.take(intent, lambda: self._parse_health(message, user_context))
+                self._apply_times(command, message, user_context)
                 return await self._execute_health(command, user_context)
 
             elif intent == "query":
-                command = await self._parse_query(message, user_context)
+                command = await speculation.take(intent, lambda: self._parse_query(message, user_context))
                 return await self._execute_query(command, user_context)
 
             else:
@@ -74,245 +107,83 @@ class MessageProcessor:
                     "intent": "unknown"
                 }
         except Exception as e:
-            logger.error(f"Error parsing message: {e}")
+            logger.error("Error parsing message: %s", e)
             return {
                 "response": f"I understood this is about {intent}, but had trouble processing the details. Please try rephrasing.",
                 "error": str(e)
             }
 
+    def _prompt_time(self, message: str, user_context: UserContext) -> Optional[str]:
+        """Current time for the extraction prompt, only when the LLM has a time phrase to resolve"""
+        if resolve_times(message, user_context.user.timezone, user_context.reference_time) or not mentions_time(message):
+            return None
+        return prompt_time(user_context.user.timezone, user_context.reference_time)
+
+    def _apply_times(self, command, message: str, user_context: UserContext) -> None:
+        """Overwrite the command's times with the ones resolved locally from the message"""
+        times = resolve_times(message, user_context.user.timezone, user_context.reference_time)
+        if not times:
+            return
+
+        if isinstance(command, SleepCommand):
+            if times.start:
+                command.start_time, command.end_time = to_utc_iso(times.start), to_utc_iso(times.end)
+                command.action = "create_sleep_log"
+            elif times.at and command.action == "start_sleep":
+                command.start_time = to_utc_iso(times.at)
+        elif times.at:
+            command.time = to_utc_iso(times.at)
+
     async def _classify_intent(self, message: str, user_context: UserContext) -> str:
-        """Classify the intent of the message"""
-        children_names = ", ".join(user_context.children_names)
+        """Classify the intent of the message, locally when the trained model is confident"""
+        predicted, confident = intent_classifier.classify(message, user_context.children_names)
+        if confident:
+            return predicted
+
+        system_msg = classify_prompt(", ".join(user_context.children_names))
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", f"""You are an assistant that classifies messages about baby care.
-            The user has children named: {children_names}
+        result = await self.llm.complete(system_msg, message, stage="classify")
+        intent = result.content.strip().lower()
+        intent_classifier.record(message, user_context.children_names, intent, predicted)
+        return intent
 
-            Classify the message into one of these categories:
-            - feeding: anything about feeding, bottles, breast, formula, milk, eating, drinking
-            - sleep: anything about sleep, nap, wake, rest, awake, bedtime
-            - diaper: anything about diapers, poop, pee, wet, dirty, change
-            - health: temperature, medicine, symptoms, weight, height, fever, illness
-            - query: questions asking for information (when, how much, last time, status, summary, etc.)
-            - other: anything else
+    async def _extract(self, stage: str, message: str, user_context: UserContext, command_type):
+        """Ask the LLM for the stage's command and decode its reply"""
+        current_time = self._prompt_time(message, user_context) if stage != "query" else None
+        system_msg = extraction_prompt(stage, ", ".join(user_context.children_names), current_time)
 
-            Respond with only the category name."""),
-            ("user", "{message}")
-        ])
+        result = await self.llm.complete(system_msg, message, stage=stage)
 
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-        return result.content.strip().lower()
+        try:
+            return decode_command(result.content, command_type)
+        except CommandDecodeError:
+            logger.error("Failed to decode %s command: %s", stage, result.content)
+            raise
 
     async def _parse_feeding(self, message: str, user_context: UserContext) -> FeedingCommand:
         """Parse feeding-related message with dynamic child names"""
-        current_time = datetime.now().isoformat()
-        children_names = ", ".join(user_context.children_names)
-
-        system_msg = f"""Extract feeding information from the message and return ONLY valid JSON.
-        Child names available: {children_names}
-        Current time: {current_time}
-
-        Return a JSON object with these exact fields:
-        - action: must be "create_feeding_log"
-        - child_name: must be one of the available child names (exact match)
-        - amount: number (ml amount) or null
-        - type: must be "BOTTLE", "BREAST", "FORMULA", "MIXED", or "SOLID"
-        - time: ISO datetime string (use current time if not specified)
-        - notes: string or null
-
-        If the child name is unclear or not mentioned, use the first available child.
-
-        Return ONLY the JSON object, no other text."""
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "{message}")
-        ])
-
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-
-        # Parse the JSON response
-        try:
-            data = json.loads(result.content)
-            return FeedingCommand(**data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {result.content}")
-            # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', result.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return FeedingCommand(**data)
-            raise e
+        return await self._extract("feeding", message, user_context, FeedingCommand)
 
     async def _parse_sleep(self, message: str, user_context: UserContext) -> SleepCommand:
         """Parse sleep-related message with dynamic child names"""
-        current_time = datetime.now().isoformat()
-        children_names = ", ".join(user_context.children_names)
-
-        system_msg = f"""Extract sleep information from the message and return ONLY valid JSON.
-        Child names available: {children_names}
-        Current time: {current_time}
-
-        Determine the action:
-        - "start_sleep" if child is going to sleep now
-        - "end_sleep" if child just woke up
-        - "create_sleep_log" if reporting a past sleep
-
-        Return a JSON object with these fields:
-        - action: must be "start_sleep", "end_sleep", or "create_sleep_log"
-        - child_name: must be one of the available child names (exact match)
-        - start_time: ISO datetime or null
-        - end_time: ISO datetime or null
-        - type: must be "NAP" or "NIGHT"
-        - quality: "DEEP", "RESTLESS", "INTERRUPTED", or null
-        - notes: string or null
-
-        If the child name is unclear, use the first available child.
-
-        Return ONLY the JSON object, no other text."""
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "{message}")
-        ])
-
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-
-        try:
-            data = json.loads(result.content)
-            return SleepCommand(**data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {result.content}")
-            import re
-            json_match = re.search(r'\{.*\}', result.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return SleepCommand(**data)
-            raise e
+        return await self._extract("sleep", message, user_context, SleepCommand)
 
     async def _parse_diaper(self, message: str, user_context: UserContext) -> DiaperCommand:
         """Parse diaper-related message with dynamic child names"""
-        current_time = datetime.now().isoformat()
-        children_names = ", ".join(user_context.children_names)
-
-        system_msg = f"""Extract diaper information from the message and return ONLY valid JSON.
-        Child names available: {children_names}
-        Current time: {current_time}
-
-        Return a JSON object with these exact fields:
-        - action: must be "create_diaper_log"
-        - child_name: must be one of the available child names (exact match)
-        - type: must be "WET", "DIRTY", or "MIXED"
-        - consistency: "NORMAL", "WATERY", "HARD", or null
-        - time: ISO datetime string (use current time if not specified)
-        - notes: string or null
-
-        If the child name is unclear, use the first available child.
-
-        Return ONLY the JSON object, no other text."""
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "{message}")
-        ])
-
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-
-        try:
-            data = json.loads(result.content)
-            return DiaperCommand(**data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {result.content}")
-            import re
-            json_match = re.search(r'\{.*\}', result.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return DiaperCommand(**data)
-            raise e
+        return await self._extract("diaper", message, user_context, DiaperCommand)
 
     async def _parse_health(self, message: str, user_context: UserContext) -> HealthCommand:
         """Parse health-related message with dynamic child names"""
-        current_time = datetime.now().isoformat()
-        children_names = ", ".join(user_context.children_names)
-
-        system_msg = f"""Extract health information from the message and return ONLY valid JSON.
-        Child names available: {children_names}
-        Current time: {current_time}
-
-        Return a JSON object with these exact fields:
-        - action: must be "create_health_log"
-        - child_name: must be one of the available child names (exact match)
-        - type: must be "TEMPERATURE", "MEDICINE", "WEIGHT", "HEIGHT", or "SYMPTOM"
-        - value: string value
-        - unit: string unit or null
-        - time: ISO datetime string (use current time if not specified)
-        - notes: string or null
-
-        If the child name is unclear, use the first available child.
-
-        Return ONLY the JSON object, no other text."""
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "{message}")
-        ])
-
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-
-        try:
-            data = json.loads(result.content)
-            return HealthCommand(**data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {result.content}")
-            import re
-            json_match = re.search(r'\{.*\}', result.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return HealthCommand(**data)
-            raise e
+        return await self._extract("health", message, user_context, HealthCommand)
 
     async def _parse_query(self, message: str, user_context: UserContext) -> QueryCommand:
         """Parse query/question message with dynamic child names"""
-        children_names = ", ".join(user_context.children_names)
-
-        system_msg = f"""Extract query information from the message and return ONLY valid JSON.
-        Child names available: {children_names}
-
-        Return a JSON object with these exact fields:
-        - action: must be "query"
-        - query_type: describe the type of query (e.g., "last_feeding", "last_sleep", "last_diaper", "summary", "status")
-        - child_name: one of the available child names, or null if asking about all children
-        - details: empty object
-
-        If asking about all children or no specific child mentioned, set child_name to null.
-
-        Return ONLY the JSON object, no other text."""
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_msg),
-            ("user", "{message}")
-        ])
+        return await self._extract("query", message, user_context, QueryCommand)
 
-        chain = prompt | self.llm
-        result = await chain.ainvoke({"message": message})
-
-        try:
-            data = json.loads(result.content)
-            return QueryCommand(**data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON: {result.content}")
-            import re
-            json_match = re.search(r'\{.*\}', result.content, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return QueryCommand(**data)
-            raise e
+    def _invalidate(self, child_id: str) -> None:
+        """Drop cached reads about a child after we write one of its logs"""
+        backend.invalidate_child(child_id)
+        analytics.invalidate(child_id)
 
     async def _execute_feeding(self, command: FeedingCommand, user_context: UserContext) -> Dict:
         """Execute feeding command by calling backend API"""
@@ -326,17 +197,10 @@ class MessageProcessor:
         if not token:
             return {"error": "Authentication token not found"}
 
-        # Ensure we have a valid datetime
-        try:
-            if command.time:
-                dt = datetime.fromisoformat(command.time.replace('Z', '+00:00'))
-                formatted_time = dt.isoformat()
-            else:
-                formatted_time = datetime.now().isoformat()
-        except:
-            formatted_time = datetime.now().isoformat()
+        # Backend stores UTC; naive times from the LLM are in the user's timezone
+        formatted_time = normalize_time(command.time, user_context.user.timezone)
 
-        logger.info(f"Sending feeding log with time: {formatted_time}")
+        logger.debug("Sending feeding log with time: %s", formatted_time)
 
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -352,13 +216,14 @@ class MessageProcessor:
             )
 
             if response.status_code == 201:
+                self._invalidate(child.id)
                 return {
                     "success": True,
                     "response": f"✅ Logged feeding for {command.child_name}: {command.amount}ml {command.type.lower()}",
                     "data": response.json()
                 }
             else:
-                logger.error(f"Failed to create feeding log: {response.text}")
+                logger.error("Failed to create feeding log: %s", response.text)
                 return {
                     "success": False,
                     "response": "Failed to log feeding",
@@ -385,6 +250,7 @@ class MessageProcessor:
                 )
 
                 if response.status_code == 200:
+                    self._invalidate(child.id)
                     return {
                         "success": True,
                         "response": f"✅ {command.child_name} woke up from {command.type.lower()}",
@@ -410,13 +276,14 @@ class MessageProcessor:
                     headers={"Authorization": f"Bearer {token}"},
                     json={
                         "childId": child.id,
-                        "startTime": command.start_time or datetime.now().isoformat(),
+                        "startTime": normalize_time(command.start_time, user_context.user.timezone),
                         "type": command.type,
                         "notes": command.notes or f"{command.child_name} went to sleep"
                     }
                 )
 
                 if response.status_code == 201:
+                    self._invalidate(child.id)
                     return {
                         "success": True,
                         "response": f"✅ {command.child_name} started {command.type.lower()}",
@@ -429,6 +296,36 @@ class MessageProcessor:
                         "error": response.text
                     }
 
+        elif command.action == "create_sleep_log" and command.start_time:
+            # Record a completed (past) sleep
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.backend_url}/sleep",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={
+                        "childId": child.id,
+                        "startTime": normalize_time(command.start_time, user_context.user.timezone),
+                        "endTime": normalize_time(command.end_time, user_context.user.timezone),
+                        "type": command.type,
+                        "quality": command.quality,
+                        "notes": command.notes or ""
+                    }
+                )
+
+                if response.status_code == 201:
+                    self._invalidate(child.id)
+                    return {
+                        "success": True,
+                        "response": f"✅ Sleep logged for {command.child_name}",
+                        "data": response.json()
+                    }
+                else:
+                    return {
+                        "success": False,
+                        "response": "Failed to log sleep",
+                        "error": response.text
+                    }
+
         return {
             "success": True,
             "response": f"✅ Sleep logged for {command.child_name}",
@@ -446,15 +343,8 @@ class MessageProcessor:
         if not token:
             return {"error": "Authentication token not found"}
 
-        # Ensure we have a valid datetime
-        try:
-            if command.time:
-                dt = datetime.fromisoformat(command.time.replace('Z', '+00:00'))
-                formatted_time = dt.isoformat()
-            else:
-                formatted_time = datetime.now().isoformat()
-        except:
-            formatted_time = datetime.now().isoformat()
+        # Backend stores UTC; naive times from the LLM are in the user's timezone
+        formatted_time = normalize_time(command.time, user_context.user.timezone)
 
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -470,6 +360,7 @@ class MessageProcessor:
             )
 
             if response.status_code == 201:
+                self._invalidate(child.id)
                 return {
                     "success": True,
                     "response": f"✅ Diaper change logged for {command.child_name}: {command.type.lower()}",
@@ -493,15 +384,8 @@ class MessageProcessor:
         if not token:
             return {"error": "Authentication token not found"}
 
-        # Ensure we have a valid datetime
-        try:
-            if command.time:
-                dt = datetime.fromisoformat(command.time.replace('Z', '+00:00'))
-                formatted_time = dt.isoformat()
-            else:
-                formatted_time = datetime.now().isoformat()
-        except:
-            formatted_time = datetime.now().isoformat()
+        # Backend stores UTC; naive times from the LLM are in the user's timezone
+        formatted_time = normalize_time(command.time, user_context.user.timezone)
 
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -518,6 +402,7 @@ class MessageProcessor:
             )
 
             if response.status_code == 201:
+                self._invalidate(child.id)
                 return {
                     "success": True,
                     "response": f"✅ Health data logged for {command.child_name}: {command.type.lower()} = {command.value}{command.unit or ''}",
@@ -544,34 +429,33 @@ class MessageProcessor:
                 return {"error": f"Child '{command.child_name}' not found. Available children: {available_children}"}
             child_id = child.id
 
+        if command.query_type in ANALYTICS_QUERIES:
+            return await analytics.answer(command, user_context, token)
+
         if command.query_type == "last_feeding":
             if not child_id:
                 available_children = await self.user_service.get_child_names_for_prompts(user_context.user.id)
                 return {"response": f"Please specify which child. Available children: {available_children}"}
 
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.backend_url}/feeding/last/{child_id}",
-                    headers={"Authorization": f"Bearer {token}"}
-                )
+            response = await backend.get(f"/feeding/last/{child_id}", token)
 
-                if response.status_code == 200:
-                    data = response.json()
-                    time = datetime.fromisoformat(data['startTime'].replace('Z', '+00:00'))
-                    time_ago = datetime.now() - time.replace(tzinfo=None)
-                    hours = int(time_ago.total_seconds() // 3600)
-                    minutes = int((time_ago.total_seconds() % 3600) // 60)
+            if response.status_code == 200:
+                data = response.json()
+                time = datetime.fromisoformat(data['startTime'].replace('Z', '+00:00'))
+                time_ago = datetime.now(timezone.utc) - time
+                hours = int(time_ago.total_seconds() // 3600)
+                minutes = int((time_ago.total_seconds() % 3600) // 60)
 
-                    return {
-                        "success": True,
-                        "response": f"{command.child_name} last ate {hours}h {minutes}m ago ({data['amount']}ml {data['type'].lower()})",
-                        "data": data
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "response": f"No feeding records found for {command.child_name}"
-                    }
+                return {
+                    "success": True,
+                    "response": f"{command.child_name} last ate {hours}h {minutes}m ago ({data['amount']}ml {data['type'].lower()})",
+                    "data": data
+                }
+            else:
+                return {
+                    "success": False,
+                    "response": f"No feeding records found for {command.child_name}"
+                }
 
         return {
             "success": True,
@@ -0,0 +1,44 @@
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Any
+
+class Metrics:
+    """In-process counters and latency summaries exposed on /metrics"""
+
+    def __init__(self, sample_size: int = 1000):
+        self.started_at = time.time()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=sample_size))
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """Increment a counter"""
+        self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a measurement (e.g. a latency in ms) in a bounded recent-sample window"""
+        self.samples[name].append(value)
+
+    def summary(self, name: str) -> Dict[str, float]:
+        """Count, mean and percentiles over the recent samples of a measurement"""
+        values = sorted(self.samples.get(name, ()))
+        if not values:
+            return {"count": 0}
+        n = len(values)
+        return {
+            "count": n,
+            "mean": round(sum(values) / n, 3),
+            "p50": round(values[n // 2], 3),
+            "p95": round(values[min(n - 1, int(n * 0.95))], 3),
+            "max": round(values[-1], 3),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All counters and measurement summaries"""
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "counters": dict(self.counters),
+            "timings": {name: self.summary(name) for name in list(self.samples)},
+        }
+
+# Global metrics instance
+metrics = Metrics()
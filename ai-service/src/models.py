@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal, Dict, Any, List
-from datetime import datetime
+from typing import Annotated, Optional, Literal, Dict, Any, List, Union
+from datetime import datetime, date
 
 # User and Child models
 class Child(BaseModel):
@@ -15,12 +15,15 @@ class User(BaseModel):
     name: str
     role: str
     auth_token: Optional[str] = None
+    timezone: Optional[str] = None  # IANA name, e.g. "America/New_York"
     children: List[Child] = []
 
 class UserContext(BaseModel):
     user: User
     phone_number: Optional[str] = None
     children_names: List[str] = []
+    # What times in the message are relative to; None means now (set when importing a past day)
+    reference_time: Optional[datetime] = None
 
 # Command models with dynamic child support
 class FeedingCommand(BaseModel):
@@ -63,6 +66,12 @@ class QueryCommand(BaseModel):
     child_name: Optional[str] = None
     details: Dict[str, Any] = {}
 
+# Any command the LLM can produce, told apart by its action
+Command = Annotated[
+    Union[FeedingCommand, SleepCommand, DiaperCommand, HealthCommand, QueryCommand],
+    Field(discriminator="action")
+]
+
 # API Request/Response models
 class ProcessMessageRequest(BaseModel):
     message: str
@@ -70,6 +79,18 @@ class ProcessMessageRequest(BaseModel):
     user_phone: Optional[str] = None
     user_name: Optional[str] = None
 
+class ImportDailyLogRequest(BaseModel):
+    user_id: str
+    text: str = Field(..., description="Transcribed log, one entry per line")
+    date: date
+    child_name: Optional[str] = None
+    dry_run: bool = False
+
+class DigestSubscribeRequest(BaseModel):
+    user_id: str
+    phone_number: str
+    send_at: Optional[str] = Field(None, description="Local time as HH:MM (default DIGEST_SEND_AT)")
+
 class RegisterUserRequest(BaseModel):
     phone_number: str
     email: str
@@ -0,0 +1,14 @@
+import os
+from typing import Optional
+
+def process_alive(pid: Optional[int]) -> bool:
+    """Whether a process with this pid exists (used to find rows owned by dead workers)"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,103 @@
+from functools import lru_cache
+from datetime import datetime
+from typing import Optional
+
+from temporal import get_timezone, local_now
+
+def compact(text: str) -> str:
+    """Normalise prompt whitespace: no indentation, trailing spaces or blank lines"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+# Instructions shared by every extraction prompt, written once
+_CHILD_FIELD = "- child_name: one of the available child names (exact match)"
+_TIME_FIELD = "- time: ISO datetime, or null if no time is mentioned"
+_NOTES_FIELD = "- notes: string or null"
+_FOOTER = compact("""If the child name is unclear or not mentioned, use the first available child.
+Return ONLY the JSON object, no other text.""")
+
+CLASSIFY_INSTRUCTIONS = compact("""Classify this baby care message into one category:
+- feeding: feeding, bottles, breast, formula, milk, eating, drinking
+- sleep: sleep, nap, wake, rest, awake, bedtime
+- diaper: diapers, poop, pee, wet, dirty, change
+- health: temperature, medicine, symptoms, weight, height, fever, illness
+- query: questions asking for information (when, how much, last time, status, summary)
+- other: anything else
+Respond with only the category name.""")
+
+EXTRACTION_SPECS = {
+    "feeding": ("Extract feeding information from the message as JSON.", [
+        '- action: "create_feeding_log"',
+        _CHILD_FIELD,
+        "- amount: number (ml) or null",
+        '- type: "BOTTLE", "BREAST", "FORMULA", "MIXED" or "SOLID"',
+        _TIME_FIELD,
+        _NOTES_FIELD,
+    ]),
+    "sleep": ("""Extract sleep information from the message as JSON.
+action: "start_sleep" if going to sleep now, "end_sleep" if just woke up, "create_sleep_log" if reporting a past sleep.""", [
+        '- action: "start_sleep", "end_sleep" or "create_sleep_log"',
+        _CHILD_FIELD,
+        "- start_time: ISO datetime or null",
+        "- end_time: ISO datetime or null",
+        '- type: "NAP" or "NIGHT"',
+        '- quality: "DEEP", "RESTLESS", "INTERRUPTED" or null',
+        _NOTES_FIELD,
+    ]),
+    "diaper": ("Extract diaper information from the message as JSON.", [
+        '- action: "create_diaper_log"',
+        _CHILD_FIELD,
+        '- type: "WET", "DIRTY" or "MIXED"',
+        '- consistency: "NORMAL", "WATERY", "HARD" or null',
+        _TIME_FIELD,
+        _NOTES_FIELD,
+    ]),
+    "health": ("Extract health information from the message as JSON.", [
+        '- action: "create_health_log"',
+        _CHILD_FIELD,
+        '- type: "TEMPERATURE", "MEDICINE", "WEIGHT", "HEIGHT" or "SYMPTOM"',
+        "- value: string",
+        "- unit: string or null",
+        _TIME_FIELD,
+        _NOTES_FIELD,
+    ]),
+    "query": ("Extract query information from the message as JSON.", [
+        '- action: "query"',
+        '- query_type: "last_feeding", "summary", "feeding_interval" (time between feeds), '
+        '"sleep_total" (sleep amount or comparison), "feeding_trend" (ml per day), or another short name',
+        "- child_name: one of the available child names, or null if about all children or none named",
+        '- details: {"window": "today", "yesterday", "this_week" or "last_week"} if a period is mentioned, else empty object',
+    ]),
+}
+
+# Stages whose fields take times, and therefore need the current time
+TIMED_STAGES = {"feeding", "sleep", "diaper", "health"}
+
+@lru_cache(maxsize=None)
+def static_prefix(stage: str) -> str:
+    """The part of a stage's system prompt that never changes.
+
+    Prompts put it first and the per-user/per-request lines (children, time)
+    last, so every call of a stage starts with the same prefix and the
+    provider's prompt cache can reuse it.
+    """
+    if stage == "classify":
+        return CLASSIFY_INSTRUCTIONS
+    intro, fields = EXTRACTION_SPECS[stage]
+    footer = _FOOTER if stage != "query" else _FOOTER.splitlines()[-1]
+    return f"{compact(intro)}\nFields:\n" + "\n".join(fields) + "\n" + footer
+
+def prompt_time(timezone_name: Optional[str] = None, now: Optional[datetime] = None) -> str:
+    """User's local time for prompts; minute precision is all extraction needs and saves tokens"""
+    local = now.astimezone(get_timezone(timezone_name)) if now else local_now(timezone_name)
+    return local.strftime("%Y-%m-%dT%H:%M")
+
+def classify_prompt(children_names: str) -> str:
+    """System prompt for intent classification"""
+    return f"{static_prefix('classify')}\nChildren: {children_names}"
+
+def extraction_prompt(stage: str, children_names: str, current_time: Optional[str] = None) -> str:
+    """System prompt for extracting a command of the given stage"""
+    context = f"Child names available: {children_names}"
+    if current_time and stage in TIMED_STAGES:
+        context += f"\nCurrent time: {current_time}"
+    return f"{static_prefix(stage)}\n{context}"
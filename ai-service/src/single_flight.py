@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from metrics import metrics
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one.
+
+    Callers using the same key while a call is in flight await that call's
+    result instead of starting their own. Nothing is kept once the call
+    completes; caching results is up to the caller (see BackendClient).
+    Results are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return fn()'s result, sharing it with concurrent callers of the same key"""
+        metrics.incr(f"single_flight.{self.name}.calls")
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr(f"single_flight.{self.name}.collapsed")
+        else:
+            # Run in its own task so one caller being cancelled doesn't fail the others
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._complete(key, done))
+
+        return await asyncio.shield(task)
+
+    def _complete(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+# Shared by backend read endpoints; keys are (endpoint, token, params)
+backend_reads = SingleFlight("backend")
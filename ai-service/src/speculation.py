@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics import metrics
+from prompts import static_prefix
+from token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Intents that have an extraction stage worth starting early
+EXTRACTION_INTENTS = ("feeding", "sleep", "diaper", "health", "query")
+
+# Cheap cues per intent; each matching cue raises that intent's odds
+INTENT_CUES = {
+    "query": re.compile(r"\?|^\s*(?:when|how|what|did|has|is|was)\b|\b(?:last time|summary|status)\b", re.IGNORECASE),
+    "feeding": re.compile(r"\b(?:fed|feed\w*|bottle|breast\w*|formula|milk|ate|eat\w*|nursed|\d+\s*(?:ml|oz))\b", re.IGNORECASE),
+    "sleep": re.compile(r"\b(?:sleep\w*|slept|nap\w*|woke|wake|awake|asleep|bed\w*)\b", re.IGNORECASE),
+    "diaper": re.compile(r"\b(?:diaper\w*|nappy|poo\w*|pee\w*|wet|dirty|changed?)\b", re.IGNORECASE),
+    "health": re.compile(r"\b(?:temp\w*|fever|medicine|meds|tylenol|vaccin\w*|weigh\w*|height|kg|lbs?|cm|cough\w*|sick|rash)\b", re.IGNORECASE),
+}
+
+# Tokens of an extraction call besides its static prefix and the message:
+# the per-user prompt suffix and a short JSON reply
+_EXTRA_TOKENS = 90
+
+@lru_cache(maxsize=None)
+def _prefix_tokens(stage: str) -> int:
+    return count_tokens(static_prefix(stage))
+
+class Speculation:
+    """Extractions started alongside the classification of one message"""
+
+    def __init__(self, speculator: Optional["Speculator"] = None, user_id: Optional[str] = None):
+        self.speculator = speculator
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.classified_at: Optional[float] = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.costs: Dict[str, int] = {}
+        self.finished: Dict[str, float] = {}
+
+    def _launch(self, stage: str, extraction: Awaitable, cost: int) -> None:
+        self.tasks[stage] = asyncio.create_task(self._timed(stage, extraction))
+        self.costs[stage] = cost
+
+    async def _timed(self, stage: str, extraction: Awaitable):
+        try:
+            return await extraction
+        finally:
+            self.finished[stage] = time.perf_counter()
+
+    def classified(self, intent: str) -> None:
+        """Note the final intent and cancel the extractions that do not match it"""
+        self.classified_at = time.perf_counter()
+        if self.speculator is not None:
+            self.speculator.learn(self.user_id, intent)
+        if not self.tasks:
+            return
+        metrics.incr("speculation.hits" if intent in self.tasks else "speculation.misses")
+        for stage in [s for s in self.tasks if s != intent]:
+            self._discard(stage)
+
+    async def take(self, intent: str, parse: Callable[[], Awaitable]):
+        """The speculative extraction for `intent` if one was started, else run `parse` now"""
+        task = self.tasks.pop(intent, None)
+        if task is None:
+            return await parse()
+        self.costs.pop(intent, None)
+        result = await task
+        # Sequentially the extraction would have started once classification finished
+        classify_s = (self.classified_at or time.perf_counter()) - self.started
+        extract_s = self.finished.get(intent, time.perf_counter()) - self.started
+        metrics.observe("speculation.saved_ms", min(classify_s, extract_s) * 1000)
+        return result
+
+    def close(self) -> None:
+        """Cancel whatever was not used, e.g. after classification failed"""
+        for stage in list(self.tasks):
+            self._discard(stage)
+
+    def _discard(self, stage: str) -> None:
+        task = self.tasks.pop(stage)
+        cost = self.costs.pop(stage, 0)
+        if not task.done():
+            task.cancel()
+        # Retrieve any error so an unused extraction failing is not reported as unhandled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        metrics.incr("speculation.wasted")
+        metrics.incr("speculation.tokens_wasted", cost)
+        if self.speculator is not None:
+            self.speculator.charge(cost)
+
+class Speculator:
+    """Runs extraction in parallel with classification for the likely intents.
+
+    With SPECULATIVE_EXTRACTION=true, the SPECULATION_WIDTH most likely
+    intents (from keyword cues and the user's recent intents) whose estimated
+    probability is at least SPECULATION_MIN_PROBABILITY have their extraction
+    started together with classification. The one matching the final intent
+    is kept and the rest are cancelled.
+
+    Wasted extractions are charged, at their estimated token cost, against a
+    budget of SPECULATION_WASTE_TOKENS_PER_HOUR (per deployment, so each
+    cluster worker gets its share); once it is spent, messages are handled
+    sequentially until it refills.
+    """
+
+    def __init__(self):
+        workers = int(os.getenv("CLUSTER_WORKERS", 1))
+        self.enabled = os.getenv("SPECULATIVE_EXTRACTION", "false").lower() == "true"
+        self.width = int(os.getenv("SPECULATION_WIDTH", 1))
+        self.min_probability = float(os.getenv("SPECULATION_MIN_PROBABILITY", 0.3))
+        self.budget = float(os.getenv("SPECULATION_WASTE_TOKENS_PER_HOUR", 200000)) / workers
+        self.history_size = int(os.getenv("SPECULATION_HISTORY_SIZE", 10))
+        self.max_users = int(os.getenv("SPECULATION_MAX_USERS", 10000))
+        self.history: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._allowance = self.budget
+        self._refilled_at = time.monotonic()
+
+    def predict(self, message: str, user_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Intents with their estimated probability, most likely first"""
+        recent = self.history.get(user_id, ()) if user_id else ()
+        scores = {}
+        for intent in EXTRACTION_INTENTS + ("other",):
+            cues = INTENT_CUES.get(intent)
+            hits = len(cues.findall(message)) if cues is not None else 0
+            # Recent intents are the prior; every cue found multiplies the odds
+            prior = 1 + sum(1 for seen in recent if seen == intent)
+            scores[intent] = prior * 5 ** hits
+        total = sum(scores.values())
+        return sorted(((intent, score / total) for intent, score in scores.items()), key=lambda p: -p[1])
+
+    def start(self, message: str, user_id: Optional[str],
+              extract: Callable[[str], Awaitable]) -> Speculation:
+        """Start the extractions worth speculating on; `extract(stage)` builds one"""
+        speculation = Speculation(self if self.enabled else None, user_id)
+        if not self.enabled or self.width <= 0:
+            return speculation
+
+        for intent, probability in self.predict(message, user_id):
+            if len(speculation.tasks) >= self.width or probability < self.min_probability:
+                break
+            if intent not in EXTRACTION_INTENTS:
+                continue
+            cost = _prefix_tokens(intent) + count_tokens(message) + _EXTRA_TOKENS
+            if not self._affordable(cost):
+                metrics.incr("speculation.skipped_budget")
+                break
+            speculation._launch(intent, extract(intent), cost)
+        if speculation.tasks:
+            metrics.incr("speculation.started", len(speculation.tasks))
+        return speculation
+
+    def _affordable(self, cost: int) -> bool:
+        now = time.monotonic()
+        self._allowance = min(self.budget, self._allowance + (now - self._refilled_at) * self.budget / 3600)
+        self._refilled_at = now
+        return self._allowance >= cost
+
+    def charge(self, tokens: int) -> None:
+        """Spend waste budget on a discarded extraction"""
+        self._allowance -= tokens
+
+    def learn(self, user_id: Optional[str], intent: str) -> None:
+        """Remember a user's classified intent as a prior for their next message"""
+        if not user_id:
+            return
+        recent = self.history.get(user_id)
+        if recent is None:
+            if len(self.history) >= self.max_users:
+                self.history.popitem(last=False)
+            recent = self.history[user_id] = deque(maxlen=self.history_size)
+        else:
+            self.history.move_to_end(user_id)
+        recent.append(intent)
+
+    def get_stats(self) -> dict:
+        counters = metrics.counters
+        hits, misses = counters.get("speculation.hits", 0), counters.get("speculation.misses", 0)
+        return {
+            "enabled": self.enabled,
+            "width": self.width,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "tokens_wasted": counters.get("speculation.tokens_wasted", 0),
+            "waste_allowance": round(self._allowance),
+            "saved_ms": metrics.summary("speculation.saved_ms"),
+        }
+
+# Global speculator (inactive unless SPECULATIVE_EXTRACTION=true)
+speculator = Speculator()
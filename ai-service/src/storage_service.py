@@ -1,17 +1,78 @@
 import json
 import os
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+import sys
+import time
+from typing import Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 import logging
+from cache_bus import cache_bus
+from models import User, Child
 
 logger = logging.getLogger(__name__)
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Share one copy of strings that repeat across users (roles, genders, timezones, common names)"""
+    return sys.intern(value) if value else value
+
+class ChildRecord:
+    """A cached child; the birth date is kept as epoch seconds"""
+    __slots__ = ("id", "name", "born", "gender")
+
+    def __init__(self, id: str, name: str, born: int, gender: Optional[str]):
+        self.id = id
+        self.name = _intern(name)
+        self.born = born
+        self.gender = _intern(gender)
+
+    @classmethod
+    def from_child(cls, child: Child) -> "ChildRecord":
+        return cls(child.id, child.name, int(child.date_of_birth.timestamp()), child.gender)
+
+    def to_child(self) -> Child:
+        # Validated when it was cached, so skip validation on the way out
+        return Child.model_construct(id=self.id, name=self.name, gender=self.gender,
+                                     date_of_birth=datetime.fromtimestamp(self.born, timezone.utc))
+
+class ContextRecord:
+    """A cached user context in slots rather than nested dicts; `cached_at` is epoch seconds"""
+    __slots__ = ("user_id", "email", "name", "role", "auth_token", "timezone", "children", "cached_at")
+
+    def __init__(self, user_id: str, email: str, name: str, role: str, auth_token: Optional[str],
+                 timezone: Optional[str], children: Tuple[ChildRecord, ...], cached_at: int = 0):
+        self.user_id = user_id
+        self.email = email
+        self.name = name
+        self.role = _intern(role)
+        self.auth_token = auth_token
+        self.timezone = _intern(timezone)
+        self.children = children
+        self.cached_at = cached_at
+
+    @classmethod
+    def from_user(cls, user: User) -> "ContextRecord":
+        return cls(user.id, user.email, user.name, user.role, user.auth_token, user.timezone,
+                   tuple(ChildRecord.from_child(child) for child in user.children))
+
+    def to_user(self) -> User:
+        return User.model_construct(id=self.user_id, email=self.email, name=self.name, role=self.role,
+                                    auth_token=self.auth_token, timezone=self.timezone,
+                                    children=[child.to_child() for child in self.children])
+
 class StorageService:
     """Simple in-memory storage service for caching user data"""
 
     def __init__(self):
         self.cache: Dict[str, Dict[str, Any]] = {}
+        # User contexts, the bulk of the cache, as compact records keyed by user id
+        self.contexts: Dict[str, ContextRecord] = {}
         self.cache_ttl = int(os.getenv("CACHE_TTL", 3600))  # 1 hour default
+        # How long past expiry a context may still be served while it is being refreshed
+        self.max_stale = int(os.getenv("CACHE_MAX_STALE", 3600))
+        # Last time (epoch seconds) each user sent a message, used to decide whose context to refresh ahead of expiry
+        self.last_activity: Dict[str, int] = {}
+        # Keep per-worker caches coherent: when another worker changes a user, mark our copy
+        # stale (keeping the token so it can be rebuilt in the background)
+        cache_bus.subscribe("user", self.expire_user_cache)
 
     def _is_expired(self, timestamp: datetime) -> bool:
         """Check if cached data is expired"""
@@ -33,7 +94,7 @@ class StorageService:
             "user_data": user_data,
             "timestamp": datetime.now()
         }
-        logger.info(f"Cached user data for phone: {phone_number}")
+        logger.debug("Cached user data for phone: %s", phone_number)
 
     def get_user_children(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get cached children data for a user"""
@@ -51,28 +112,52 @@ class StorageService:
             "children_data": children_data,
             "timestamp": datetime.now()
         }
-        logger.info(f"Cached children data for user: {user_id}")
-
-    def get_user_context(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get complete cached user context"""
-        cache_key = f"context:{user_id}"
-        if cache_key in self.cache:
-            data = self.cache[cache_key]
-            if not self._is_expired(data.get("timestamp", datetime.min)):
-                return data.get("context_data")
+        logger.debug("Cached children data for user: %s", user_id)
+
+    def get_user_context(self, user_id: str, allow_stale: bool = False) -> Optional[ContextRecord]:
+        """Get complete cached user context (expired entries, up to CACHE_MAX_STALE past expiry, only with allow_stale)"""
+        record = self.contexts.get(user_id)
+        if record is None:
+            return None
+        age = time.time() - record.cached_at
+        if age <= self.cache_ttl or (allow_stale and age <= self.cache_ttl + self.max_stale):
+            return record
         return None
 
-    def cache_user_context(self, user_id: str, context_data: Dict[str, Any]) -> None:
+    def get_context_timestamp(self, user_id: str) -> Optional[datetime]:
+        """When the user's context was last cached"""
+        record = self.contexts.get(user_id)
+        return datetime.fromtimestamp(record.cached_at) if record is not None else None
+
+    def touch_user(self, user_id: str) -> None:
+        """Record user activity"""
+        self.last_activity[user_id] = int(time.time())
+
+    def get_refresh_candidates(self, active_within: int, refresh_margin: int) -> list:
+        """Users active in the last `active_within` seconds whose context expires within `refresh_margin` seconds"""
+        now = int(time.time())
+        active_since = now - active_within
+        refresh_before = now - max(0, self.cache_ttl - refresh_margin)
+        candidates = []
+        for user_id, last_seen in list(self.last_activity.items()):
+            if last_seen < active_since:
+                # Inactive users fall out of the refresh set
+                del self.last_activity[user_id]
+                continue
+            record = self.contexts.get(user_id)
+            if record is not None and record.cached_at <= refresh_before:
+                candidates.append(user_id)
+        return candidates
+
+    def cache_user_context(self, user_id: str, record: ContextRecord) -> None:
         """Cache complete user context"""
-        cache_key = f"context:{user_id}"
-        self.cache[cache_key] = {
-            "context_data": context_data,
-            "timestamp": datetime.now()
-        }
-        logger.info(f"Cached user context for user: {user_id}")
+        record.cached_at = int(time.time())
+        self.contexts[user_id] = record
+        logger.debug("Cached user context for user: %s", user_id)
 
-    def invalidate_user_cache(self, user_id: str) -> None:
-        """Invalidate all cached data for a user"""
+    def invalidate_user_cache(self, user_id: str, broadcast: bool = True) -> None:
+        """Invalidate all cached data for a user (and, by default, in other workers too)"""
+        self.contexts.pop(user_id, None)
         keys_to_remove = []
         for key in self.cache.keys():
             if user_id in key:
@@ -81,7 +166,19 @@ class StorageService:
         for key in keys_to_remove:
             del self.cache[key]
 
-        logger.info(f"Invalidated cache for user: {user_id}")
+        if broadcast:
+            cache_bus.publish("user", user_id)
+        logger.info("Invalidated cache for user: %s", user_id)
+
+    def expire_user_cache(self, user_id: str) -> None:
+        """Mark a user's cached data stale without discarding it"""
+        record = self.contexts.get(user_id)
+        if record is not None:
+            # Just expired, so the max-stale window starts now
+            record.cached_at = min(record.cached_at, int(time.time()) - self.cache_ttl - 1)
+        for key, data in self.cache.items():
+            if user_id in key:
+                data["timestamp"] = datetime.min
 
     def clear_expired_cache(self) -> None:
         """Remove expired entries from cache"""
@@ -93,8 +190,26 @@ class StorageService:
         for key in expired_keys:
             del self.cache[key]
 
-        if expired_keys:
-            logger.info(f"Cleared {len(expired_keys)} expired cache entries")
-
-# Global storage instance
-storage = StorageService()
\ No newline at end of file
+        cutoff = time.time() - self.cache_ttl - self.max_stale
+        expired_users = [user_id for user_id, record in self.contexts.items() if record.cached_at < cutoff]
+        for user_id in expired_users:
+            del self.contexts[user_id]
+
+        if expired_keys or expired_users:
+            logger.info("Cleared %s expired cache entries", len(expired_keys) + len(expired_users))
+
+# Global storage instance, created on first use so importing this module stays cheap
+_storage: Optional[StorageService] = None
+
+def get_storage() -> StorageService:
+    """Return the shared StorageService, creating it on first use"""
+    global _storage
+    if _storage is None:
+        _storage = StorageService()
+    return _storage
+
+def __getattr__(name: str):
+    # Keeps `from storage_service import storage` working without constructing it at import time
+    if name == "storage":
+        return get_storage()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import re
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "America/New_York")
+
+# Clock time: "3", "3pm", "3:15", "15:30", "3.15 pm", "noon", "midnight"
+_CLOCK = r"(?:\d{1,2}(?:[:.]\d{2})?\s*(?:[ap]\.?m\.?)?|noon|midnight)"
+_RANGE = re.compile(rf"\b(?:from|between)\s+(?P<start>{_CLOCK})\s+(?:to|until|till|and|-)\s+(?P<end>{_CLOCK})(?![\w:])")
+# "2-4pm", "1:30 to 3": a range without "from"/"between", if one side says which time of day
+_BARE_RANGE = re.compile(rf"(?<![\w:.])(?P<start>{_CLOCK})\s*(?:-|–|to|until|till)\s*(?P<end>{_CLOCK})(?![\w:])")
+_CLOCK_MARKER = re.compile(r"[ap]\.?m\b|\d[:.]\d{2}|noon|midnight")
+_AGO = re.compile(r"\b(?P<count>\d+(?:\.\d+)?|an?|half an?|a few)\s*(?P<unit>minutes?|mins?|m|hours?|hrs?|h)\s+ago\b")
+_AT = re.compile(rf"\b(?:at|@|around|about)\s+(?P<time>{_CLOCK})(?![\w:])")
+_BARE = re.compile(r"(?<![\w:.])(?P<time>\d{1,2}(?:[:.]\d{2})?\s*[ap]\.?m\.?)(?!\w)")
+_CLOCK_PARTS = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?\s*(?:([ap])\.?m\.?)?")
+
+# Day-part phrases narrow which day/half-day a bare clock time means: (day offset, from hour, to hour)
+_WINDOWS = {
+    "last night": (re.compile(r"\blast night\b"), (-1, 18, 30)),
+    "yesterday": (re.compile(r"\byesterday\b"), (-1, 0, 24)),
+    "this morning": (re.compile(r"\bthis morning\b"), (0, 0, 12)),
+    "this afternoon": (re.compile(r"\bthis afternoon\b"), (0, 12, 18)),
+    "this evening": (re.compile(r"\b(?:this evening|tonight)\b"), (0, 17, 24)),
+}
+# Default time for "last night" with no clock time
+_LAST_NIGHT_HOUR = 22
+
+# Anything that looks like a time reference the local parser may have missed
+_TIME_HINT = re.compile(r"\d\s*(?:[ap]\.?m|o'?clock|h\b)|\bago\b|\byesterday\b|\bmorning\b|\bafternoon\b|"
+                        r"\bevening\b|\bnight\b|\bnoon\b|\bmidnight\b|\d[:.]\d{2}")
+
+@dataclass(frozen=True)
+class ResolvedTimes:
+    """Times found in a message, as aware datetimes in the user's timezone"""
+    at: Optional[datetime] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+    def __bool__(self) -> bool:
+        return any((self.at, self.start, self.end))
+
+NO_TIMES = ResolvedTimes()
+
+@lru_cache(maxsize=256)
+def get_timezone(name: Optional[str]) -> tzinfo:
+    """ZoneInfo for an IANA name, falling back to the default timezone"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown timezone %s, using %s", name, DEFAULT_TIMEZONE)
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+def local_now(timezone_name: Optional[str]) -> datetime:
+    return datetime.now(get_timezone(timezone_name))
+
+def to_utc_iso(value: datetime) -> str:
+    """Aware datetime -> UTC ISO string, the form the backend stores"""
+    return value.astimezone(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+def normalize_time(value: Optional[str], timezone_name: Optional[str]) -> str:
+    """Parse an ISO time from a command into UTC; naive times are in the user's timezone.
+
+    Missing or unreadable values mean "now".
+    """
+    if value:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=get_timezone(timezone_name))
+            return to_utc_iso(parsed)
+        except ValueError:
+            logger.warning("Unreadable command time %r, using now", value)
+    return to_utc_iso(datetime.now(timezone.utc))
+
+def _clock_minutes(text: str) -> Tuple[List[int], bool]:
+    """Candidate minutes-after-midnight for a clock time, and whether AM/PM was explicit"""
+    text = text.strip()
+    if text == "noon":
+        return [720], True
+    if text == "midnight":
+        return [0], True
+    hour, minute, meridiem = _CLOCK_PARTS.fullmatch(text).groups()
+    hour, minute = int(hour), int(minute or 0)
+    if hour > 23 or minute > 59:
+        return [], False
+    if meridiem:
+        if hour > 12:
+            return [], False
+        return [hour % 12 * 60 + minute + (720 if meridiem == "p" else 0)], True
+    if hour > 12 or hour == 0:
+        return [hour * 60 + minute], True
+    return [hour % 12 * 60 + minute, hour % 12 * 60 + minute + 720], False
+
+def _window(day_part: str, now: datetime) -> Tuple[datetime, datetime]:
+    if day_part in _WINDOWS:
+        days, start_hour, end_hour = _WINDOWS[day_part][1]
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=days)
+        return day + timedelta(hours=start_hour), day + timedelta(hours=end_hour)
+    # Logs are about the recent past: default to the last 24 hours
+    return now - timedelta(hours=24), now
+
+def _latest(minutes: List[int], now: datetime, window: Tuple[datetime, datetime],
+            before: Optional[datetime] = None) -> Optional[datetime]:
+    """Most recent occurrence of any candidate clock time inside the window (and not after `before`)"""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tz = now.tzinfo
+    limit = min(window[1], before or window[1], now + timedelta(minutes=5))
+    best = None
+    for days in (-2, -1, 0):
+        day = (midnight + timedelta(days=days)).date()
+        for minute in minutes:
+            # Build from the wall clock so DST transitions land on the right offset
+            naive = datetime(day.year, day.month, day.day) + timedelta(minutes=minute)
+            candidate = naive.replace(tzinfo=tz)
+            if window[0] <= candidate <= limit and (best is None or candidate > best):
+                best = candidate
+    return best
+
+@lru_cache(maxsize=int(os.getenv("TEMPORAL_CACHE_SIZE", 4096)))
+def _resolve(phrase: str, day_part: str, timezone_name: str, reference: datetime) -> ResolvedTimes:
+    """Resolve one time phrase against a reference minute (memoized: same phrase, same minute)"""
+    now = reference.astimezone(get_timezone(timezone_name))
+    window = _window(day_part, now)
+
+    match = _RANGE.fullmatch(phrase)
+    if match is None and _CLOCK_MARKER.search(phrase):
+        match = _BARE_RANGE.fullmatch(phrase)
+    if match:
+        start_minutes, start_explicit = _clock_minutes(match["start"])
+        end_minutes, end_explicit = _clock_minutes(match["end"])
+        if end_explicit and not start_explicit and len(end_minutes) == 1 and start_minutes:
+            # "from 1 to 3pm": the start shares the end's AM/PM unless that puts it after the end
+            same_half = [m for m in start_minutes if (m >= 720) == (end_minutes[0] >= 720) and m <= end_minutes[0]]
+            start_minutes = same_half or start_minutes
+        end = _latest(end_minutes, now, window)
+        if end is None:
+            return NO_TIMES
+        start = _latest(start_minutes, now, (end - timedelta(hours=24), end), before=end)
+        return ResolvedTimes(start=start, end=end) if start else NO_TIMES
+
+    match = _AGO.fullmatch(phrase)
+    if match:
+        count = {"a": 1, "an": 1, "half a": 0.5, "half an": 0.5, "a few": 3}.get(match["count"])
+        count = count if count is not None else float(match["count"])
+        unit = timedelta(hours=1) if match["unit"].startswith("h") else timedelta(minutes=1)
+        # Elapsed time is absolute, so subtract in UTC (correct across DST changes)
+        return ResolvedTimes(at=(reference - unit * count).astimezone(now.tzinfo))
+
+    match = _AT.fullmatch(phrase) or _BARE.fullmatch(phrase)
+    if match:
+        at = _latest(_clock_minutes(match["time"])[0], now, window)
+        return ResolvedTimes(at=at) if at else NO_TIMES
+
+    if phrase == "last night":
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        return ResolvedTimes(at=day + timedelta(hours=_LAST_NIGHT_HOUR))
+
+    return NO_TIMES
+
+def resolve_times(message: str, timezone_name: Optional[str], now: Optional[datetime] = None) -> ResolvedTimes:
+    """Resolve the time phrases in a message ("20 minutes ago", "at 3pm", "from 1 to 3pm", "2-4pm", "last night")"""
+    text = message.lower()
+    timezone_name = timezone_name or DEFAULT_TIMEZONE
+    # Reference minute: the memo key changes once a minute, not on every call
+    reference = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+    day_part = next((name for name, (pattern, _) in _WINDOWS.items() if pattern.search(text)), "")
+
+    for pattern in (_RANGE, _BARE_RANGE, _AGO, _AT, _BARE):
+        match = pattern.search(text)
+        if match:
+            resolved = _resolve(match.group(0).strip(), day_part, timezone_name, reference)
+            if resolved:
+                return resolved
+
+    if day_part == "last night":
+        return _resolve("last night", day_part, timezone_name, reference)
+    return NO_TIMES
+
+def mentions_time(message: str) -> bool:
+    """Whether a message looks like it refers to a specific time"""
+    return bool(_TIME_HINT.search(message.lower()))
@@ -0,0 +1,41 @@
+import re
+from typing import Optional
+
+from metrics import metrics
+
+# Roughly tracks BPE boundaries for English: a word, 1-3 digits or a punctuation run
+# with at most one leading space; newline runs and indentation are separate tokens
+_PIECES = re.compile(r"\n+|[ \t]{2,}| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s")
+
+def count_tokens(text: str) -> int:
+    """Approximate the BPE token count of `text` without a tokenizer.
+
+    Each piece counts as one token, plus one extra token per further 6
+    characters in long words. Close enough to
+    the provider's count to compare prompt variants and track spend trends.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        length = len(piece.strip()) or 1
+        tokens += 1 + (length - 1) // 6
+    return tokens
+
+def record_usage(stage: str, system: str, user: str, output: str,
+                 input_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+                 cached_tokens: Optional[int] = None) -> None:
+    """Record input/output tokens for a stage, estimating any the provider did not report.
+
+    When the provider reports prompt-cache hits, input is also split into
+    cached and uncached tokens (cached ones are billed at a discount).
+    """
+    if input_tokens is None:
+        input_tokens = count_tokens(system) + count_tokens(user)
+    if output_tokens is None:
+        output_tokens = count_tokens(output)
+    metrics.incr(f"tokens.{stage}.input", input_tokens)
+    metrics.incr(f"tokens.{stage}.output", output_tokens)
+    metrics.observe(f"tokens.{stage}.input_per_call", input_tokens)
+    if cached_tokens is not None:
+        metrics.incr(f"tokens.{stage}.input_cached", cached_tokens)
+        metrics.incr(f"tokens.{stage}.input_uncached", max(0, input_tokens - cached_tokens))
+        metrics.observe(f"tokens.{stage}.cached_share", cached_tokens / input_tokens if input_tokens else 0.0)
@@ -0,0 +1,156 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class InvalidToken(ValueError):
+    """A token that is malformed or whose signature does not verify"""
+
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: Optional[str]
+    expires_at: Optional[float]  # epoch seconds; None if the token never expires
+    issued_at: Optional[float]
+    verified: bool  # signature checked against JWT_SECRET
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def decode_claims(token: str, secret: Optional[str] = None) -> TokenClaims:
+    """Decode a JWT's claims locally, verifying its HS256 signature when `secret` is given"""
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        payload = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError) as e:
+        raise InvalidToken(f"Malformed token: {e}") from e
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        raise InvalidToken("Malformed token: header and payload must be JSON objects")
+
+    if secret:
+        if header.get("alg") != "HS256":
+            raise InvalidToken(f"Unsupported algorithm {header.get('alg')!r}")
+        expected = hmac.new(secret.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).digest()
+        try:
+            signature = _b64decode(signature_b64)
+        except ValueError as e:
+            raise InvalidToken("Malformed signature") from e
+        if not hmac.compare_digest(expected, signature):
+            raise InvalidToken("Signature mismatch")
+
+    try:
+        expires_at = float(payload["exp"]) if "exp" in payload else None
+        issued_at = float(payload["iat"]) if "iat" in payload else None
+    except (ValueError, TypeError) as e:
+        raise InvalidToken(f"Malformed exp/iat claim: {e}") from e
+
+    return TokenClaims(
+        user_id=payload.get("userId") or payload.get("id"),
+        expires_at=expires_at,
+        issued_at=issued_at,
+        verified=bool(secret),
+    )
+
+class TokenManager:
+    """Local JWT checks and expiry tracking for cached auth tokens.
+
+    Claims are decoded (and the signature verified when JWT_SECRET matches the
+    backend's) without a network call, and the result is cached until the
+    token expires. Without JWT_SECRET, tokens that are not JWTs are treated
+    as opaque and never expire locally. The profile the backend returned for a
+    token is kept alongside its claims, so verifying it again needs no network
+    call until it expires. Tokens of users with a cached context
+    are tracked so the context can be dropped once its token expires; the
+    backend has no refresh route, so the user has to log in again.
+    """
+
+    def __init__(self):
+        self.secret = os.getenv("JWT_SECRET")
+        self.clock_skew = float(os.getenv("TOKEN_CLOCK_SKEW", 30))
+        self.max_entries = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+        self._checked: Dict[str, Optional[TokenClaims]] = {}
+        self._profiles: Dict[str, dict] = {}
+        self._expires_at: Dict[str, float] = {}
+
+    def check(self, token: Optional[str]) -> Optional[TokenClaims]:
+        """Claims of a usable token, or None if it is invalid or expired; no network involved"""
+        if not token:
+            return None
+
+        if token in self._checked:
+            claims = self._checked[token]
+        else:
+            try:
+                claims = decode_claims(token, self.secret)
+            except InvalidToken as e:
+                if self.secret:
+                    logger.warning("Rejecting auth token: %s", e)
+                    claims = None
+                else:
+                    # Nothing to verify against; treat it as opaque and let the backend decide
+                    claims = TokenClaims(user_id=None, expires_at=None, issued_at=None, verified=False)
+            self._remember(token, claims)
+
+        if claims is None:
+            metrics.incr("auth.token.rejected")
+            return None
+        if claims.expires_at is not None and claims.expires_at <= time.time() + self.clock_skew:
+            metrics.incr("auth.token.expired")
+            return None
+        return claims
+
+    def _remember(self, token: str, claims: Optional[TokenClaims]) -> None:
+        if len(self._checked) >= self.max_entries:
+            now = time.time()
+            for stale in [t for t, c in self._checked.items() if c is None or (c.expires_at or now + 1) <= now]:
+                del self._checked[stale]
+            if len(self._checked) >= self.max_entries:
+                self._checked.clear()
+            self._profiles = {t: p for t, p in self._profiles.items() if t in self._checked}
+        self._checked[token] = claims
+
+    def profile(self, token: Optional[str]) -> Optional[dict]:
+        """The backend's profile for a token that is still locally valid, if we have one"""
+        if self.check(token) is None:
+            return None
+        return self._profiles.get(token)
+
+    def remember_profile(self, token: str, profile: dict) -> None:
+        """Keep the backend's answer for a token that expires; opaque tokens are always asked about"""
+        claims = self.check(token)
+        if claims is not None and claims.expires_at is not None:
+            self._profiles[token] = profile
+
+    def drop_profile(self, token: str) -> None:
+        self._profiles.pop(token, None)
+
+    def track(self, user_id: str, token: Optional[str]) -> None:
+        """Remember when a user's token expires"""
+        claims = self.check(token)
+        if claims is None or claims.expires_at is None:
+            self._expires_at.pop(user_id, None)
+            return
+        self._expires_at[user_id] = claims.expires_at - self.clock_skew
+
+    def forget(self, user_id: str) -> None:
+        self._expires_at.pop(user_id, None)
+
+    def expired(self, now: Optional[float] = None) -> List[str]:
+        """Users whose tracked token has expired"""
+        now = time.time() if now is None else now
+        return [user_id for user_id, expires_at in self._expires_at.items() if expires_at <= now]
+
+    def get_stats(self) -> dict:
+        return {"checked": len(self._checked), "profiles": len(self._profiles), "tracked": len(self._expires_at), "expired": len(self.expired())}
+
+# Global token manager
+token_manager = TokenManager()
@@ -1,9 +1,11 @@
+import asyncio
 import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from models import User, Child, UserContext
-from auth_middleware import auth
-from storage_service import storage
+from auth_middleware import AuthMiddleware, TokenRejected, get_auth
+from storage_service import StorageService, ContextRecord, get_storage
+from token_manager import token_manager
 
 logger = logging.getLogger(__name__)
 
@@ -11,18 +13,30 @@ class UserService:
     """Manage user authentication, context, and children data"""
 
     def __init__(self):
-        self.auth = auth
-        self.storage = storage
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    @property
+    def auth(self) -> AuthMiddleware:
+        return get_auth()
+
+    @property
+    def storage(self) -> StorageService:
+        return get_storage()
 
     async def get_user_by_id(self, user_id: str) -> Optional[User]:
         """Get user by ID, with caching"""
+        self.storage.touch_user(user_id)
+
         # Try cache first
         cached_context = self.storage.get_user_context(user_id)
+        if not cached_context:
+            # Expired: answer from the stale copy and rebuild it off the critical path
+            cached_context = self.storage.get_user_context(user_id, allow_stale=True)
+            if cached_context:
+                self.schedule_refresh(user_id)
+
         if cached_context:
-            user_data = cached_context.get("user")
-            children_data = cached_context.get("children", [])
-            children = [Child(**child) for child in children_data]
-            return User(**user_data, children=children)
+            return cached_context.to_user()
 
         return None
 
@@ -35,8 +49,10 @@ class UserService:
         user_data = auth_result["user"]
         token = auth_result["token"]
 
-        # Get user's children
-        children_data = await self.auth.get_user_children(token)
+        # Get user's children and timezone
+        children_data, timezone = await asyncio.gather(
+            self.auth.get_user_children(token), self.auth.get_user_timezone(token)
+        )
         children = [Child(**child) for child in children_data] if children_data else []
 
         user = User(
@@ -45,6 +61,7 @@ class UserService:
             name=user_data["name"],
             role=user_data["role"],
             auth_token=token,
+            timezone=timezone,
             children=children
         )
 
@@ -95,33 +112,72 @@ class UserService:
             return f"{', '.join(names[:-1])}, and {names[-1]}"
 
     async def refresh_user_data(self, user_id: str) -> Optional[User]:
-        """Refresh user data from backend (invalidate cache)"""
-        self.storage.invalidate_user_cache(user_id)
+        """Re-fetch profile and children from the backend with the cached token"""
+        # Read the token from the (possibly stale) cache; the old entry is kept
+        # until the new one is built so a failed refresh loses nothing
+        cached_context = self.storage.get_user_context(user_id, allow_stale=True)
+        if not cached_context:
+            return None
 
-        # Get user from cache first (which should be empty now)
-        cached_context = self.storage.get_user_context(user_id)
-        if cached_context:
-            token = cached_context["user"]["auth_token"]
-
-            # Verify token is still valid
-            user_info = await self.auth.verify_token(token)
-            if user_info:
-                children_data = await self.auth.get_user_children(token)
-                children = [Child(**child) for child in children_data] if children_data else []
-
-                user = User(
-                    id=user_info["id"],
-                    email=user_info["email"],
-                    name=user_info["name"],
-                    role=user_info["role"],
-                    auth_token=token,
-                    children=children
-                )
-
-                await self._cache_user_context(user)
-                return user
+        token = cached_context.auth_token
+        if not token:
+            return None
 
-        return None
+        # Verify token is still valid; a rejected token makes the cached context useless
+        try:
+            # Refreshing is the point, so ask the backend even if the profile is known
+            user_info = await self.auth.get_profile(token, fresh=True)
+        except TokenRejected as e:
+            logger.warning("Dropping cached context of user %s: %s", user_id, e)
+            self.storage.invalidate_user_cache(user_id)
+            token_manager.forget(user_id)
+            return None
+        if not user_info:
+            return None
+
+        children_data, timezone = await asyncio.gather(
+            self.auth.get_user_children(token), self.auth.get_user_timezone(token)
+        )
+        if children_data is None:
+            # Rebuilding without the children would tell the user they have none
+            return None
+        children = [Child(**child) for child in children_data]
+
+        user = User(
+            id=user_info["id"],
+            email=user_info["email"],
+            name=user_info["name"],
+            role=user_info["role"],
+            auth_token=token,
+            # A failed timezone lookup keeps the one we had
+            timezone=timezone or cached_context.timezone,
+            children=children
+        )
+
+        await self._cache_user_context(user)
+        return user
+
+    def expire_user(self, user_id: str) -> None:
+        """Drop the cached context of a user whose token expired, so they are asked to log in again"""
+        logger.warning("Auth token of user %s expired; dropping cached context", user_id)
+        self.storage.invalidate_user_cache(user_id)
+        token_manager.forget(user_id)
+
+    def schedule_refresh(self, user_id: str) -> None:
+        """Refresh a user's context in the background, at most once at a time per user"""
+        if user_id in self._refreshing:
+            return
+        task = asyncio.get_running_loop().create_task(self._background_refresh(user_id))
+        self._refreshing[user_id] = task
+
+    async def _background_refresh(self, user_id: str) -> None:
+        try:
+            if await self.refresh_user_data(user_id) is None:
+                logger.warning("Background refresh of user %s failed", user_id)
+        except Exception as e:
+            logger.error("Error refreshing user %s: %s", user_id, e)
+        finally:
+            self._refreshing.pop(user_id, None)
 
     async def register_new_user(self, email: str, password: str, name: str, phone_number: Optional[str] = None) -> Optional[User]:
         """Register a new user"""
@@ -152,33 +208,32 @@ class UserService:
 
     async def _cache_user_context(self, user: User) -> None:
         """Cache complete user context"""
-        context_data = {
-            "user": {
-                "id": user.id,
-                "email": user.email,
-                "name": user.name,
-                "role": user.role,
-                "auth_token": user.auth_token
-            },
-            "children": [
-                {
-                    "id": child.id,
-                    "name": child.name,
-                    "date_of_birth": child.date_of_birth.isoformat(),
-                    "gender": child.gender
-                }
-                for child in user.children
-            ]
-        }
-
-        self.storage.cache_user_context(user.id, context_data)
+        self.storage.cache_user_context(user.id, ContextRecord.from_user(user))
+        token_manager.track(user.id, user.auth_token)
 
     def get_user_token(self, user_id: str) -> Optional[str]:
         """Get user's auth token from cache"""
-        cached_context = self.storage.get_user_context(user_id)
+        # Same staleness rule as get_user_by_id, which may have served the stale context
+        cached_context = self.storage.get_user_context(user_id, allow_stale=True)
         if cached_context:
-            return cached_context.get("user", {}).get("auth_token")
+            token = cached_context.auth_token
+            # Checked locally: an expired token fails here rather than with a 401 mid-request
+            if token_manager.check(token) is not None:
+                return token
         return None
 
-# Global user service instance
-user_service = UserService()
\ No newline at end of file
+# Global user service instance, created on first use so importing this module stays cheap
+_user_service: Optional[UserService] = None
+
+def get_user_service() -> UserService:
+    """Return the shared UserService, creating it on first use"""
+    global _user_service
+    if _user_service is None:
+        _user_service = UserService()
+    return _user_service
+
+def __getattr__(name: str):
+    # Keeps `from user_service import user_service` working without constructing it at import time
+    if name == "user_service":
+        return get_user_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,20 +1,37 @@
-import os
-import httpx
+import asyncio
 import logging
-from typing import Dict, Any
-from message_processor import MessageProcessor
+from typing import Dict, Any, List, Optional
+from message_processor import MessageProcessor, get_message_processor
+from dedup_service import deduplicator
+from whatsapp_sender import whatsapp_sender
+from inbound_journal import inbound_journal, JournalEntry
+from admission import admission, ADMITTED, REJECT_REPLIES
 
 logger = logging.getLogger(__name__)
 
+def payload_kind(webhook_data: Dict) -> str:
+    """Classify a delivery as messages, statuses (status callbacks only) or other"""
+    kind = "other"
+    for entry in webhook_data.get("entry") or ():
+        for change in entry.get("changes") or ():
+            value = change.get("value") or {}
+            if "messages" in value:
+                return "messages"
+            if "statuses" in value:
+                kind = "statuses"
+    return kind
+
 class WhatsAppWebhook:
-    def __init__(self):
-        self.access_token = os.getenv("META_ACCESS_TOKEN")
-        self.phone_number_id = os.getenv("META_PHONE_NUMBER_ID")
-        self.api_url = f"https://graph.facebook.com/v18.0/{self.phone_number_id}/messages"
-        self.message_processor = MessageProcessor()
+    def __init__(self, message_processor: Optional[MessageProcessor] = None):
+        self.message_processor = message_processor or get_message_processor()
+        self.deduplicator = deduplicator
+        self.sender = whatsapp_sender
+        self.journal = inbound_journal
+        self.admission = admission
     
     async def process_webhook(self, webhook_data: Dict) -> Dict:
         """Process incoming webhook from WhatsApp"""
+        message_id = None
         try:
             # Extract message data from webhook
             entry = webhook_data.get("entry", [{}])[0]
@@ -23,6 +40,13 @@ class WhatsAppWebhook:
             
             if "messages" in value:
                 message = value["messages"][0]
+                message_id = message.get("id")
+
+                # Meta redelivers when our ack is slow; acknowledge repeats without reprocessing
+                if await self.deduplicator.is_duplicate(message_id):
+                    logger.info("Ignoring duplicate delivery of message %s", message_id)
+                    return {"status": "duplicate", "message_id": message_id}
+
                 contact = value["contacts"][0]
                 
                 # Extract message details
@@ -30,57 +54,93 @@ class WhatsAppWebhook:
                 message_text = message.get("text", {}).get("body", "")
                 sender_name = contact.get("profile", {}).get("name", "")
                 
-                logger.info(f"Message from {sender_name} ({from_number}): {message_text}")
-                
-                # TODO: Add user lookup by phone number
-                # For now, we'll use a placeholder user_id
-                # In production, you'd look up the user by phone number
-                user_id = "placeholder_user_id"
-
-                # Process the message
-                result = await self.message_processor.process_message(
-                    message=message_text,
-                    user_id=user_id,
-                    user_phone=from_number,
-                    user_name=sender_name
+                logger.info(
+                    "Message from %s (%s)", sender_name, from_number,
+                    extra={"wa_from": from_number, "text_length": len(message_text)}
                 )
-                
-                # Send response back to WhatsApp
-                await self.send_message(from_number, result.get("response", "Message received"))
-                
+                logger.debug("Message text from %s: %s", from_number, message_text)
+
+                # Per-sender rate and daily LLM budget, checked before any LLM work
+                decision = self.admission.admit(from_number)
+                if decision != ADMITTED:
+                    logger.warning("Rejected message %s from %s: %s", message_id, from_number, decision)
+                    if self.admission.should_notify(from_number):
+                        await self.send_message(from_number, REJECT_REPLIES[decision])
+                    return {"status": "rejected", "reason": decision, "message_id": message_id}
+
+                # Journal the message before doing any work so a restart can replay it
+                journal_entry = None
+                if self.journal.running:
+                    journal_entry = await self.journal.append(message_id, from_number, sender_name, message_text)
+                    if journal_entry is None:
+                        logger.info("Message %s was already handled", message_id)
+                        return {"status": "duplicate", "message_id": message_id}
+
+                try:
+                    result = await self._handle_message(from_number, sender_name, message_text)
+                except Exception:
+                    if journal_entry is not None:
+                        await self.journal.mark_failed(journal_entry)
+                    raise
+
+                if journal_entry is not None:
+                    await self.journal.mark_done(journal_entry)
                 return result
             
             return {"status": "no_message"}
             
         except Exception as e:
-            logger.error(f"Error processing webhook: {e}")
+            logger.error("Error processing webhook: %s", e)
+            # Let a redelivery of a message that failed midway be processed again
+            await self.deduplicator.forget(message_id)
             raise
     
+    def process_statuses(self, webhook_data: Dict) -> Dict:
+        """Record delivery status callbacks (sent/delivered/read/failed); no message pipeline involved"""
+        count = 0
+        for entry in webhook_data.get("entry") or ():
+            for change in entry.get("changes") or ():
+                for status in (change.get("value") or {}).get("statuses") or ():
+                    self.sender.record_status(status)
+                    count += 1
+        return {"status": "statuses", "count": count}
+
+    async def _handle_message(self, from_number: str, sender_name: str, message_text: str) -> Dict:
+        """Process one inbound message and queue the reply"""
+        # TODO: Add user lookup by phone number
+        # For now, we'll use a placeholder user_id
+        # In production, you'd look up the user by phone number
+        user_id = "placeholder_user_id"
+
+        # Process the message
+        result = await self.message_processor.process_message(
+            message=message_text,
+            user_id=user_id,
+            user_phone=from_number,
+            user_name=sender_name
+        )
+
+        # Queue response back to WhatsApp (sent by the background sender)
+        await self.send_message(from_number, result.get("response", "Message received"))
+        return result
+
+    async def replay(self, entries: List[JournalEntry]) -> None:
+        """Re-process journaled messages left unfinished by a previous run, in arrival order"""
+        if entries:
+            logger.info("Replaying %s unfinished inbound messages from the journal", len(entries))
+        for entry in entries:
+            # Redeliveries of a message we are replaying should be ignored
+            if entry.message_id:
+                await self.deduplicator.is_duplicate(entry.message_id)
+            try:
+                await self._handle_message(entry.from_number, entry.sender_name, entry.body)
+                await self.journal.mark_done(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error replaying inbound message %s: %s", entry.id, e)
+                await self.journal.mark_failed(entry)
+
     async def send_message(self, to_number: str, message: str) -> bool:
-        """Send message back to WhatsApp user"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.access_token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "messaging_product": "whatsapp",
-                        "to": to_number,
-                        "type": "text",
-                        "text": {"body": message}
-                    }
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Message sent successfully to {to_number}")
-                    return True
-                else:
-                    logger.error(f"Failed to send message: {response.text}")
-                    return False
-                    
-        except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            return False
+        """Queue a message back to the WhatsApp user; delivery happens in the background"""
+        return await self.sender.enqueue(to_number, message)
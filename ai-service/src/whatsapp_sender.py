@@ -0,0 +1,300 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, List
+
+import httpx
+
+from metrics import metrics
+from processes import process_alive
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class OutboundMessage:
+    id: int
+    to_number: str
+    body: str
+    attempts: int = 0
+    created_at: float = 0.0
+
+class TokenBucket:
+    """Token bucket limiting how fast we call the Graph API for one phone number"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Outbox:
+    """SQLite-backed store of replies that have not been delivered yet"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_number TEXT NOT NULL,
+                body TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "claimed_by" not in columns:
+            # Owning worker pid, so several workers can share one outbox file
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_by INTEGER")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def add(self, to_number: str, body: str) -> OutboundMessage:
+        created_at = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (to_number, body, created_at, claimed_by) VALUES (?, ?, ?, ?)",
+                (to_number, body, created_at, os.getpid())
+            )
+        return OutboundMessage(id=cursor.lastrowid, to_number=to_number, body=body, created_at=created_at)
+
+    def record_attempt(self, message_id: int, attempts: int) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET attempts = ? WHERE id = ?", (attempts, message_id))
+
+    def remove(self, message_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    def claim_pending(self) -> List[OutboundMessage]:
+        """Take over replies left by this or any dead worker and return the ones we now own"""
+        pid = os.getpid()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                owners = [row[0] for row in self._conn.execute("SELECT DISTINCT claimed_by FROM outbox")]
+                for owner in owners:
+                    if owner != pid and not process_alive(owner):
+                        self._conn.execute(
+                            "UPDATE outbox SET claimed_by = ? WHERE claimed_by IS ?", (pid, owner)
+                        )
+                rows = self._conn.execute(
+                    "SELECT id, to_number, body, attempts, created_at FROM outbox WHERE claimed_by = ? ORDER BY id",
+                    (pid,)
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [OutboundMessage(*row) for row in rows]
+
+# Delivery states WhatsApp reports in status callbacks
+STATUS_STATES = ("sent", "delivered", "read", "failed")
+
+class WhatsAppSender:
+    """Deliver outbound WhatsApp replies from a persisted queue.
+
+    Replies are written to the outbox and queued; sender workers drain the
+    queue through a token bucket, retry transient failures with exponential
+    backoff, and delete a reply from the outbox only once it was delivered.
+    Anything still pending at shutdown is re-queued on the next start, by
+    whichever worker finds the owning process gone.
+    """
+
+    def __init__(self):
+        self.access_token = os.getenv("META_ACCESS_TOKEN")
+        self.phone_number_id = os.getenv("META_PHONE_NUMBER_ID")
+        self.api_url = f"https://graph.facebook.com/v18.0/{self.phone_number_id}/messages"
+        self.worker_count = int(os.getenv("WHATSAPP_SEND_WORKERS", 4))
+        self.max_attempts = int(os.getenv("WHATSAPP_SEND_MAX_ATTEMPTS", 6))
+        self.backoff_base = float(os.getenv("WHATSAPP_SEND_BACKOFF_SECONDS", 1.0))
+        # Limits are for the phone number, so split them across cluster workers
+        workers = int(os.getenv("CLUSTER_WORKERS", 1))
+        self.rate = float(os.getenv("WHATSAPP_SEND_RATE", 20)) / workers  # messages per second
+        self.burst = max(1.0, float(os.getenv("WHATSAPP_SEND_BURST", 40)) / workers)
+        self.outbox = Outbox(os.getenv("WHATSAPP_OUTBOX_PATH", "whatsapp_outbox.db"))
+        self.bucket: Optional[TokenBucket] = None
+        self.queue: Optional["asyncio.Queue[OutboundMessage]"] = None
+        self.client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+        # Graph API message id -> when it was accepted, for delivery latency from status callbacks
+        self.track_limit = int(os.getenv("WHATSAPP_STATUS_TRACK_LIMIT", 10000))
+        self._sent_at: "OrderedDict[str, float]" = OrderedDict()
+
+    async def start(self) -> None:
+        """Open the outbox, re-queue pending replies and start sender workers"""
+        if self._workers:
+            return
+
+        self.queue = asyncio.Queue()
+        self.bucket = TokenBucket(self.rate, self.burst)
+        self.client = httpx.AsyncClient(timeout=15.0)
+
+        await asyncio.to_thread(self.outbox.open)
+        pending = await asyncio.to_thread(self.outbox.claim_pending)
+        for message in pending:
+            self.queue.put_nowait(message)
+        if pending:
+            logger.info("Re-queued %s undelivered WhatsApp replies from the outbox", len(pending))
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self) -> None:
+        """Stop sender workers; undelivered replies stay in the outbox"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        await asyncio.to_thread(self.outbox.close)
+
+    async def enqueue(self, to_number: str, body: str) -> bool:
+        """Persist a reply and queue it for delivery without waiting for the send"""
+        if self.queue is None:
+            logger.error("WhatsApp sender is not running; dropping reply to %s", to_number)
+            metrics.incr("whatsapp.send.dropped")
+            return False
+
+        message = await asyncio.to_thread(self.outbox.add, to_number, body)
+        self.queue.put_nowait(message)
+        metrics.incr("whatsapp.send.queued")
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.bucket.acquire()
+                await self._deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Unexpected error delivering WhatsApp reply %s: %s", message.id, e)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, message: OutboundMessage) -> None:
+        message.attempts += 1
+        retryable = True
+        error = None
+        try:
+            response = await self.client.post(
+                self.api_url,
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "messaging_product": "whatsapp",
+                    "to": message.to_number,
+                    "type": "text",
+                    "text": {"body": message.body}
+                }
+            )
+
+            if response.status_code == 200:
+                await asyncio.to_thread(self.outbox.remove, message.id)
+                self._track(response)
+                latency_ms = (time.time() - message.created_at) * 1000
+                metrics.incr("whatsapp.send.delivered")
+                metrics.observe("whatsapp.send.latency_ms", latency_ms)
+                logger.info("Message sent successfully to %s", message.to_number,
+                            extra={"attempts": message.attempts, "latency_ms": round(latency_ms, 1)})
+                return
+
+            error = response.text
+            retryable = response.status_code == 429 or response.status_code >= 500
+        except httpx.HTTPError as e:
+            error = str(e)
+
+        if retryable and message.attempts < self.max_attempts:
+            delay = self.backoff_base * (2 ** (message.attempts - 1)) * random.uniform(0.5, 1.5)
+            await asyncio.to_thread(self.outbox.record_attempt, message.id, message.attempts)
+            metrics.incr("whatsapp.send.retried")
+            logger.warning("Failed to send message to %s (attempt %s), retrying in %.1fs: %s",
+                           message.to_number, message.attempts, delay, error)
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, message)
+            return
+
+        await asyncio.to_thread(self.outbox.remove, message.id)
+        metrics.incr("whatsapp.send.failed")
+        logger.error("Failed to send message to %s after %s attempts: %s",
+                     message.to_number, message.attempts, error)
+
+    def _track(self, response: httpx.Response) -> None:
+        try:
+            wamid = response.json()["messages"][0]["id"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return
+        self._sent_at[wamid] = time.time()
+        if len(self._sent_at) > self.track_limit:
+            self._sent_at.popitem(last=False)
+
+    def record_status(self, status: dict) -> None:
+        """Count a delivery status callback and time delivery/read against when we sent the message.
+
+        Send times are only known to the worker process that sent the message,
+        so with CLUSTER_WORKERS > 1 callbacks landing on another worker are
+        counted but not timed.
+        """
+        state = status.get("status")
+        # The state comes from the request body; keep the metric names to a fixed set
+        metrics.incr(f"whatsapp.status.{state if state in STATUS_STATES else 'other'}")
+        if state == "failed":
+            logger.warning("WhatsApp reported delivery failure to %s: %s",
+                           status.get("recipient_id"), status.get("errors"))
+
+        sent_at = self._sent_at.get(status.get("id"))
+        if sent_at is None or state not in ("delivered", "read"):
+            return
+        try:
+            latency_ms = max(0.0, (float(status["timestamp"]) - sent_at) * 1000)
+        except (KeyError, ValueError):
+            return
+        metrics.observe(f"whatsapp.{state}_latency_ms", latency_ms)
+        if state == "read":
+            del self._sent_at[status["id"]]
+
+    def get_stats(self) -> dict:
+        """Queue depth and delivery metrics"""
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "workers": len(self._workers),
+            "latency_ms": metrics.summary("whatsapp.send.latency_ms"),
+            "delivered_latency_ms": metrics.summary("whatsapp.delivered_latency_ms"),
+        }
+
+# Global sender instance
+whatsapp_sender = WhatsAppSender()
@@ -167,7 +167,7 @@ export const getProfile = async (req: AuthRequest, res: Response) => {
     }
     
     const user = await prisma.user.findUnique({
-      where: { id: req.user.userId },
+      where: { id: req.user.id },
       select: {
         id: true,
         email: true,